@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the GTF/GFF3 attributes parser (genial.gff.attrib_parser.attributes_parser)
+over real-world attribute strings from Ensembl, GENCODE, RefSeq and WormBase.
+
+Each string is parsed with attributes_parser and with the previous regex based parser
+(kept here as a baseline), and both must return the same attributes.
+
+usage: python benchmarks/attributes.py [-n repeats]
+"""
+
+import argparse as argp
+import os
+import re
+import sys
+import time
+from html import unescape
+from warnings import catch_warnings, simplefilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.gff.attrib_parser import attributes_parser
+from genial.utils import InternDict
+
+SAMPLES = [
+    ('Ensembl GTF', 'gtf',
+     'gene_id "ENSG00000186092"; gene_version "7"; transcript_id "ENST00000641515"; '
+     'transcript_version "2"; exon_number "3"; gene_name "OR4F5"; gene_source "ensembl_havana"; '
+     'gene_biotype "protein_coding"; transcript_name "OR4F5-201"; transcript_source "ensembl_havana"; '
+     'transcript_biotype "protein_coding"; tag "basic"; transcript_support_level "NA (assigned to previous version 1)";'),
+    ('Ensembl GFF3', 'gff3',
+     'ID=transcript:ENST00000641515;Parent=gene:ENSG00000186092;Name=OR4F5-201;'
+     'biotype=protein_coding;tag=basic;transcript_id=ENST00000641515;version=2'),
+    ('GENCODE GTF', 'gtf',
+     'gene_id "ENSG00000223972.5"; transcript_id "ENST00000456328.2"; gene_type "transcribed_unprocessed_pseudogene"; '
+     'gene_name "DDX11L1"; transcript_type "processed_transcript"; transcript_name "DDX11L1-202"; '
+     'exon_number 1; exon_id "ENSE00002234944.1"; level 2; transcript_support_level "1"; '
+     'hgnc_id "HGNC:37102"; tag "basic"; havana_gene "OTTHUMG00000000961.2"; havana_transcript "OTTHUMT00000362751.1";'),
+    ('GENCODE GFF3', 'gff3',
+     'ID=exon:ENST00000456328.2:1;Parent=ENST00000456328.2;gene_id=ENSG00000223972.5;'
+     'transcript_id=ENST00000456328.2;gene_type=transcribed_unprocessed_pseudogene;gene_name=DDX11L1;'
+     'transcript_type=processed_transcript;transcript_name=DDX11L1-202;exon_number=1;'
+     'exon_id=ENSE00002234944.1;level=2;transcript_support_level=1;hgnc_id=HGNC:37102;tag=basic'),
+    ('RefSeq GFF3', 'gff3',
+     'ID=exon-NM_001005484.2-1;Parent=rna-NM_001005484.2;Dbxref=GeneID:79501,Genbank:NM_001005484.2,'
+     'HGNC:HGNC:14825;gbkey=mRNA;gene=OR4F5;product=olfactory receptor family 4 subfamily F member 5;'
+     'tag=MANE Select;transcript_id=NM_001005484.2'),
+    ('RefSeq GTF', 'gtf',
+     'gene_id "OR4F5"; transcript_id "NM_001005484.2"; db_xref "GeneID:79501"; gbkey "mRNA"; '
+     'gene "OR4F5"; product "olfactory receptor family 4 subfamily F member 5"; '
+     'tag "MANE Select"; transcript_id "NM_001005484.2"; exon_number "1"; '),
+    ('WormBase GFF3', 'gff3',
+     'ID=Transcript:Y74C9A.2a.1;Parent=Gene:WBGene00022276;Name=Y74C9A.2a.1;wormpep=CE:CE28146;'
+     'locus=nlp-40;Note=Neuropeptide-Like Protein &amp; precursor &#59; secreted'),
+]
+
+
+def regex_attributes_parser(attributes, file_format='gff3'):
+    """attributes parser of previous versions (regex for each attribute)"""
+    if file_format == 'gff3':
+        pattern = re.compile(r'^\s*(\S+)\s*=\s*(.*)\s*$')
+    else:
+        pattern = re.compile(r'^\s*(\S+)\s+\"([^\"]+)\"\s*')
+
+    attributes = unescape(attributes.replace("&#59;", "%3B"))
+    attributes = attributes.replace(';\"', '\"').replace(";-", "-")
+    attributes = re.sub(r';\s*$', '', attributes)
+
+    attrib_dict = InternDict()
+    for att in attributes.split(';'):
+        g = re.search(pattern, att)
+        if g is None:
+            continue
+        k, v = g.group(1, 2)
+        if re.match(r'^(\w+):', v):
+            v = re.sub(r'^\w+:', '', v)
+        attrib_dict[k] = v
+    return attrib_dict
+
+
+def timeit(func, attributes, file_format, repeats):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        func(attributes, file_format)
+    return (time.perf_counter() - t0) / repeats * 1e6
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark the GTF/GFF3 attributes parser')
+    ap.add_argument('-n', '--repeats', type=int, default=20000,
+                    help='number of times each attribute string is parsed')
+    args = ap.parse_args()
+
+    print('%-14s %10s %10s %8s' % ('source', 'regex us', 'us', 'speedup'))
+    with catch_warnings():
+        # GENCODE has unquoted values (level 2): both parsers warn
+        simplefilter('ignore')
+        for name, file_format, attributes in SAMPLES:
+            assert attributes_parser(attributes, file_format) == \
+                regex_attributes_parser(attributes, file_format), name
+
+            baseline = timeit(regex_attributes_parser, attributes, file_format, args.repeats)
+            elapsed = timeit(attributes_parser, attributes, file_format, args.repeats)
+            print('%-14s %10.2f %10.2f %7.1fx' % (name, baseline, elapsed, baseline / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark of BED12 readers: genial.parse (one InteractiveAnnotation per line)
+versus genial.readers.read_bed12 (AnnotationSet).
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/bed_reader.py [-i annotation.bed] [-n n_lines]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import parse
+from genial.readers import read_bed12
+
+
+def synthetic_bed12(path, n_lines=1000000, seed=0):
+    rng = np.random.RandomState(seed)
+    with open(path, 'w') as f:
+        pos = 0
+        for i in range(n_lines):
+            n_exons = rng.randint(1, 20)
+            sizes = rng.randint(50, 500, n_exons)
+            gaps = rng.randint(100, 5000, n_exons)
+            starts = np.concatenate([[0], np.cumsum(sizes + gaps)[:-1]])
+            end = pos + starts[-1] + sizes[-1]
+            print('chr%d' % (i * 22 // n_lines + 1), pos, end, 'T%d' % i, 0, '+-'[i % 2],
+                  pos, end, '0,0,0', n_exons,
+                  ','.join(map(str, sizes)) + ',', ','.join(map(str, starts)) + ',',
+                  sep='\t', file=f)
+            pos += 1000
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark BED12 readers')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=1000000,
+                    help='number of lines of the synthetic BED12')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    with open(path) as f:
+        t0 = time.perf_counter()
+        n = 0
+        # parse is lazy: touch the blocks so that each line is fully decoded
+        for annotation in parse(f, 'bed'):
+            annotation.starts, annotation.ends
+            n += 1
+        parse_time = time.perf_counter() - t0
+
+    with open(path) as f:
+        t0 = time.perf_counter()
+        annotations = read_bed12(f)
+        read_time = time.perf_counter() - t0
+
+    assert n == len(annotations)
+    print('lines:                   %d' % n)
+    print('parse(fh, "bed") lines/s: %.0f' % (n / parse_time))
+    print('read_bed12 lines/s:       %.0f' % (n / read_time))
+    print('speedup:                 %.1fx' % (parse_time / read_time))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
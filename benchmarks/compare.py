@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark of genial.compare.Comparison.classify against matching the intron chain of
+each query transcript with the reference transcripts overlapping it, one at a time.
+
+usage: python benchmarks/compare.py -i query.gtf -r reference.gtf [-f gtf] [--threads 1]
+"""
+
+import argparse as argp
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import parse_to_set
+from genial.compare import Comparison
+from genial.index import IntervalIndex
+from genial.utils import magic_open
+
+
+def exact_matches_per_query(reference, query):
+    index = IntervalIndex(reference)
+    chains = [tuple(zip(a.ends[:-1].tolist(), a.starts[1:].tolist())) for a in reference]
+    matches = 0
+    for annotation in query:
+        chain = tuple(zip(annotation.ends[:-1].tolist(), annotation.starts[1:].tolist()))
+        if not chain:
+            continue
+        rows = index.overlap(annotation.chrom, annotation.start, annotation.end, annotation.strand)
+        matches += any(chains[row] == chain for row in rows.tolist())
+    return matches
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark annotation comparison')
+    ap.add_argument('-i', '--input', required=True, help='query annotation file')
+    ap.add_argument('-r', '--reference', required=True, help='reference annotation file')
+    ap.add_argument('-f', '--input_format', default='gtf')
+    ap.add_argument('--threads', type=int, default=1)
+    args = ap.parse_args()
+
+    with magic_open(args.input) as f:
+        query = parse_to_set(f, args.input_format)
+    with magic_open(args.reference) as f:
+        reference = parse_to_set(f, args.input_format)
+
+    t0 = time.perf_counter()
+    per_query = exact_matches_per_query(reference, query)
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    classes = Comparison(reference).classify(query, threads=args.threads)
+    compare_time = time.perf_counter() - t0
+
+    multi_exon = query.blockCount() > 1
+    assert per_query == int(np.sum((classes.class_code == '=') & multi_exon))
+    print('query: %d  reference: %d' % (len(query), len(reference)))
+    print('intron chains per query: %.2fs (exact matches only)' % loop_time)
+    print('Comparison.classify:     %.3fs (%.0fx, all class codes)' % (compare_time, loop_time / compare_time))
+
+
+if __name__ == '__main__':
+    main()
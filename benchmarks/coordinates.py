@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark of genial.coordinates.TranscriptCoordinates.genome_to_transcript against
+mapping each position with the exons of its transcript (one searchsorted per position).
+
+usage: python benchmarks/coordinates.py -i annotation.gtf [-f gtf] [-n 100000]
+"""
+
+import argparse as argp
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import parse_to_set
+from genial.coordinates import TranscriptCoordinates
+from genial.utils import magic_open
+
+
+def exonic_positions_per_query(annotations, rows, positions):
+    transcripts = {}
+    result = np.full(len(rows), -1, dtype=np.int64)
+    for i, (row, position) in enumerate(zip(rows.tolist(), positions.tolist())):
+        if row not in transcripts:
+            annotation = annotations[row]
+            starts, ends = np.asarray(annotation.starts), np.asarray(annotation.ends)
+            before = np.concatenate([[0], np.cumsum(ends - starts)])
+            transcripts[row] = starts, ends, before, annotation.strand == '-'
+        starts, ends, before, minus = transcripts[row]
+
+        exon = np.searchsorted(starts, position, side='right') - 1
+        if exon >= 0 and position < ends[exon]:
+            forward = before[exon] + position - starts[exon]
+            result[i] = before[-1] - 1 - forward if minus else forward
+    return result
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark genome to transcript coordinate mapping')
+    ap.add_argument('-i', '--input', required=True, help='annotation file')
+    ap.add_argument('-f', '--input_format', default='gtf')
+    ap.add_argument('-n', '--positions', type=int, default=100000, help='number of positions')
+    args = ap.parse_args()
+
+    with magic_open(args.input) as f:
+        annotations = parse_to_set(f, args.input_format)
+
+    rng = np.random.default_rng(0)
+    rows = rng.integers(0, len(annotations), args.positions)
+    spans = annotations.end[rows] - annotations.start[rows]
+    positions = annotations.start[rows] + (rng.random(args.positions) * spans).astype(np.int64)
+
+    t0 = time.perf_counter()
+    per_query = exonic_positions_per_query(annotations, rows, positions)
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    transcript_positions, distances = TranscriptCoordinates(annotations).genome_to_transcript(rows, positions)
+    batch_time = time.perf_counter() - t0
+
+    assert np.array_equal(np.where(distances == 0, transcript_positions, -1), per_query)
+    print('transcripts: %d  positions: %d' % (len(annotations), args.positions))
+    print('searchsorted per position:  %.2fs' % loop_time)
+    print('genome_to_transcript:       %.3fs (%.0fx)' % (batch_time, loop_time / batch_time))
+
+
+if __name__ == '__main__':
+    main()
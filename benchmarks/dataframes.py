@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark of loading a BED12 file as a DataFrame with the blocks of each row as
+integers: genial.utils.read_bed (blocks as comma separated str, split row by row)
+versus genial.readers.read_bed12(...).to_pandas() and to_arrow().
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/dataframes.py [-i annotation.bed] [-n n_lines]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.readers import read_bed12
+from genial.utils import read_bed
+from bed_reader import synthetic_bed12
+
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - t0
+
+
+def split_blocks(path):
+    bed = read_bed(path)
+    bed['starts'] = [np.array(s.rstrip(',').split(','), dtype=np.int64) + start
+                     for s, start in zip(bed.blockStart, bed.chromStart)]
+    bed['ends'] = [starts + np.array(s.rstrip(',').split(','), dtype=np.int64)
+                   for s, starts in zip(bed.exons, bed.starts)]
+    return bed
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark DataFrame export')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=200000,
+                    help='number of lines of the synthetic BED12')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    old, old_time = timed(lambda: split_blocks(path))
+    print('rows: %d' % len(old))
+    print('read_bed + split:        %.2fs' % old_time)
+
+    with open(path) as f:
+        annotations, read_time = timed(lambda: read_bed12(f))
+    df, pandas_time = timed(annotations.to_pandas)
+    print('read_bed12 + to_pandas:  %.2fs (%.0fx)' % (read_time + pandas_time,
+                                                      old_time / (read_time + pandas_time)))
+    assert np.array_equal(np.concatenate(old.starts.tolist()), annotations.starts)
+
+    try:
+        _, arrow_time = timed(annotations.to_arrow)
+        print('read_bed12 + to_arrow:   %.2fs' % (read_time + arrow_time))
+    except ImportError:
+        print('to_arrow: pyarrow is not installed')
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark of reading compressed files with genial.utils.magic_open against gzip.open.
+
+The input is compressed as gzip and as BGZF (with genial.bgzf's block layout), and
+all lines are read from each file with every reader.
+
+usage: python benchmarks/decompression.py -i annotation.gtf
+"""
+
+import argparse as argp
+import gzip
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.utils import magic_open
+
+
+def write_bgzf(data, path, block_size=65280):
+    """BGZF file with the given bytes (same layout as bgzip, including the EOF block)"""
+    with open(path, 'wb') as f:
+        for i in range(0, len(data) + 1, block_size):
+            chunk = data[i:i + block_size]
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            deflated = compressor.compress(chunk) + compressor.flush()
+            f.write(b'\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0')
+            f.write(struct.pack('<H', 18 + len(deflated) + 8 - 1))
+            f.write(deflated)
+            f.write(struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+            if not chunk:
+                break
+
+
+def count_lines(f):
+    with f:
+        return sum(1 for _ in f)
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark magic_open on compressed files')
+    ap.add_argument('-i', '--input', required=True, help='uncompressed annotation file')
+    args = ap.parse_args()
+
+    with open(args.input, 'rb') as f:
+        data = f.read()
+
+    tmp = tempfile.mkdtemp()
+    gz = os.path.join(tmp, 'input.gz')
+    bgz = os.path.join(tmp, 'input.bgz')
+    with gzip.open(gz, 'wb') as f:
+        f.write(data)
+    write_bgzf(data, bgz)
+
+    readers = [
+        ('gzip', 'gzip.open', lambda: gzip.open(gz, 'rt')),
+        ('gzip', 'magic_open', lambda: magic_open(gz, background=False)),
+        ('gzip', 'magic_open background', lambda: magic_open(gz)),
+        ('bgzf', 'gzip.open', lambda: gzip.open(bgz, 'rt')),
+        ('bgzf', 'magic_open 1 thread', lambda: magic_open(bgz, threads=1)),
+        ('bgzf', 'magic_open', lambda: magic_open(bgz)),
+    ]
+    print('cpus: %d  uncompressed: %.1f MB' % (os.cpu_count() or 1, len(data) / 1e6))
+    for compression, name, reader in readers:
+        t0 = time.perf_counter()
+        n_lines = count_lines(reader())
+        elapsed = time.perf_counter() - t0
+        print('%-5s %-22s lines: %d  MB/s: %.0f' % (compression, name, n_lines, len(data) / 1e6 / elapsed))
+
+    os.remove(gz)
+    os.remove(bgz)
+    os.rmdir(tmp)
+
+
+if __name__ == '__main__':
+    main()
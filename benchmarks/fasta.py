@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark of genial.fasta.FastaFile.transcripts against loading the genome on a dict
+and joining the exons of each transcript separately.
+
+usage: python benchmarks/fasta.py -i annotation.gtf -g genome.fa [-f gtf]
+"""
+
+import argparse as argp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import parse_to_set
+from genial.fasta import FastaFile
+from genial.utils import magic_open
+
+_COMPLEMENT = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+
+def read_genome(path):
+    genome = {}
+    name, lines = None, []
+    with open(path) as f:
+        for line in f:
+            if line.startswith('>'):
+                if name is not None:
+                    genome[name] = ''.join(lines)
+                name, lines = line[1:].split()[0], []
+            else:
+                lines.append(line.rstrip())
+    if name is not None:
+        genome[name] = ''.join(lines)
+    return genome
+
+
+def transcripts_per_row(genome, annotations):
+    sequences = []
+    for annotation in annotations:
+        chrom = genome[annotation.chrom]
+        sequence = ''.join(chrom[s:e] for s, e in zip(annotation.starts.tolist(), annotation.ends.tolist()))
+        if annotation.strand == '-':
+            sequence = sequence.translate(_COMPLEMENT)[::-1]
+        sequences.append(sequence)
+    return sequences
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark transcript sequence extraction')
+    ap.add_argument('-i', '--input', required=True, help='annotation file')
+    ap.add_argument('-g', '--genome', required=True, help='uncompressed FASTA file')
+    ap.add_argument('-f', '--input_format', default='gtf')
+    args = ap.parse_args()
+
+    with magic_open(args.input) as f:
+        annotations = parse_to_set(f, args.input_format)
+    with FastaFile(args.genome) as fasta:
+        annotations = annotations[[chrom in fasta for chrom in annotations.chrom]]
+
+    t0 = time.perf_counter()
+    per_row = transcripts_per_row(read_genome(args.genome), annotations)
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with FastaFile(args.genome) as fasta:
+        sequences = fasta.transcripts(annotations)
+    fasta_time = time.perf_counter() - t0
+
+    assert sequences == per_row
+    print('transcripts: %d  bases: %d' % (len(annotations), sum(map(len, sequences))))
+    print('dict + join per transcript: %.2fs' % loop_time)
+    print('FastaFile.transcripts:      %.3fs (%.0fx)' % (fasta_time, loop_time / fasta_time))
+
+
+if __name__ == '__main__':
+    main()
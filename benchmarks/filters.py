@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark of genial.filters against filtering one annotation at a time
+(as annotParser.py did before: exon count and intron size bounds).
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/filters.py [-i annotation.bed] [-n n_lines]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.filters import ExonCount, IntronSize
+from genial.readers import read_bed12
+from bed_reader import synthetic_bed12
+
+
+def keep(annotation, min_exon_count, small_gap, huge_gap):
+    if annotation.blockCount() < min_exon_count:
+        return False
+    if annotation.blockCount() > 1:
+        if small_gap and np.sum(annotation.introns < small_gap) > 0:
+            return False
+        if huge_gap and np.sum(annotation.introns > huge_gap) > 0:
+            return False
+    return True
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark annotation filters')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=200000,
+                    help='number of lines of the synthetic BED12')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    with open(path) as f:
+        annotations = read_bed12(f)
+
+    t0 = time.perf_counter()
+    loop_rows = [row for row, annotation in enumerate(annotations) if keep(annotation, 3, 50, 100000)]
+    loop_time = time.perf_counter() - t0
+
+    predicate = ExonCount(minimum=3) & IntronSize(minimum=50, maximum=100000)
+    t0 = time.perf_counter()
+    mask = predicate.mask(annotations)
+    set_time = time.perf_counter() - t0
+
+    assert np.array_equal(np.flatnonzero(mask), loop_rows)
+    print('annotations: %d  selected: %d' % (len(annotations), mask.sum()))
+    print('per annotation: %.2fs' % loop_time)
+    print('filters:        %.3fs (%.0fx)' % (set_time, loop_time / set_time))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Benchmark of genial.genes.Genes.meta_exons against grouping transcripts by gene
+with a dict and merging the exons of each gene separately.
+
+usage: python benchmarks/genes.py -i annotation.gtf [-f gtf]
+"""
+
+import argparse as argp
+import os
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import parse_to_set
+from genial.genes import Genes
+from genial.utils import magic_open, merge_blocks
+
+
+def meta_exons_per_gene(annotations):
+    groups = defaultdict(list)
+    for annotation in annotations:
+        groups[annotation.chrom, annotation.strand, annotation.gene_id].append(annotation)
+
+    meta_exons = {}
+    for key, transcripts in groups.items():
+        starts = np.concatenate([t.starts for t in transcripts])
+        ends = np.concatenate([t.ends for t in transcripts])
+        order = np.lexsort((ends, starts))
+        meta_exons[key] = merge_blocks(starts[order], ends[order], [0, len(starts)])[:2]
+    return meta_exons
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark gene aggregation')
+    ap.add_argument('-i', '--input', required=True, help='annotation file')
+    ap.add_argument('-f', '--input_format', default='gtf')
+    args = ap.parse_args()
+
+    with magic_open(args.input) as f:
+        annotations = parse_to_set(f, args.input_format)
+
+    t0 = time.perf_counter()
+    per_gene = meta_exons_per_gene(annotations)
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    genes = Genes(annotations)
+    meta_exons = genes.meta_exons()
+    set_time = time.perf_counter() - t0
+
+    assert len(per_gene) == len(genes) and len(meta_exons.starts) == sum(len(s) for s, _ in per_gene.values())
+    print('transcripts: %d  genes: %d' % (len(annotations), len(genes)))
+    print('dict + merge per gene: %.2fs' % loop_time)
+    print('Genes.meta_exons:      %.3fs (%.0fx)' % (set_time, loop_time / set_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the GTF/GFF3 parser (genial.gff.parse_to_dict)
+
+Reports lines/second and how many times the attributes column was parsed per line.
+Without an input file, a synthetic Ensembl-like GTF is generated.
+
+usage: python benchmarks/gff_parser.py [-i annotation.gtf] [-f gtf] [-g n_genes]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import genial.gff.classes
+from genial.gff import parse_to_dict
+from genial.utils import magic_open
+
+
+def synthetic_gtf(path, n_genes=2000, n_transcripts=3, n_exons=8):
+    attribs = ('gene_id "{g}"; gene_version "1"; transcript_id "{t}"; transcript_version "1"; '
+               'gene_name "GENE{g}"; gene_source "ensembl_havana"; gene_biotype "protein_coding"; '
+               'transcript_biotype "protein_coding"; tag "basic"; transcript_support_level "1";')
+    with open(path, 'w') as f:
+        pos = 1000
+        for g in range(n_genes):
+            gene_id = 'ENSG%011d' % g
+            strand = '+-'[g % 2]
+            print('\t'.join(['1', 'ensembl', 'gene', str(pos), str(pos + 20000), '.', strand, '.',
+                             'gene_id "%s"; gene_name "GENE%s";' % (gene_id, gene_id)]), file=f)
+            for t in range(n_transcripts):
+                tx_id = 'ENST%09d%02d' % (g, t)
+                attrib = attribs.format(g=gene_id, t=tx_id)
+                print('\t'.join(['1', 'ensembl', 'transcript', str(pos), str(pos + 20000),
+                                 '.', strand, '.', attrib]), file=f)
+                exons = range(n_exons) if strand == '+' else reversed(range(n_exons))
+                for e in exons:
+                    start = pos + e * 2500
+                    for feature in ('exon', 'CDS'):
+                        print('\t'.join(['1', 'ensembl', feature, str(start), str(start + 199),
+                                         '.', strand, '0' if feature == 'CDS' else '.',
+                                         attrib + ' exon_number "%d";' % (e + 1)]), file=f)
+            pos += 25000
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark the GTF/GFF3 parser')
+    ap.add_argument('-i', '--input', help='GTF/GFF3 file (default: synthetic GTF)')
+    ap.add_argument('-f', '--input_format', default='gtf', choices=['gtf', 'gff3'])
+    ap.add_argument('-g', '--genes', type=int, default=2000,
+                    help='number of genes of the synthetic GTF')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.gtf', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_gtf(path, args.genes)
+
+    with magic_open(path) as f:
+        n_lines = sum(1 for line in f if not line.startswith('#'))
+
+    # count calls to the attributes parser
+    calls = [0]
+    attributes_parser = genial.gff.classes.attributes_parser
+
+    def counting_parser(*a, **kw):
+        calls[0] += 1
+        return attributes_parser(*a, **kw)
+
+    genial.gff.classes.attributes_parser = counting_parser
+
+    with magic_open(path) as f:
+        t0 = time.perf_counter()
+        gff = parse_to_dict(f, args.input_format)
+        elapsed = time.perf_counter() - t0
+
+    genial.gff.classes.attributes_parser = attributes_parser
+
+    print('lines:                 %d' % n_lines)
+    print('transcripts:           %d' % len(gff))
+    print('seconds:               %.2f' % elapsed)
+    print('lines/second:          %.0f' % (n_lines / elapsed))
+    print('attribute parses/line: %.2f' % (calls[0] / n_lines))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark of batch queries on genial.index.IntervalIndex.
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/interval_index.py [-i annotation.bed] [-n n_lines] [-q n_queries]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.index import IntervalIndex
+from genial.readers import read_bed12
+from bed_reader import synthetic_bed12
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark IntervalIndex queries')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=200000,
+                    help='number of lines of the synthetic BED12')
+    ap.add_argument('-q', '--queries', type=int, default=1000000,
+                    help='number of queries of each batch')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    with open(path) as f:
+        annotations = read_bed12(f)
+
+    rng = np.random.RandomState(0)
+    chroms = rng.choice(list(annotations.chrom.categories), args.queries)
+    positions = rng.randint(0, annotations.end.max(), args.queries)
+
+    for level in ('transcript', 'exon'):
+        t0 = time.perf_counter()
+        index = IntervalIndex(annotations, level)
+        print('%-10s  intervals: %d  build: %.2fs' % (level, len(index), time.perf_counter() - t0))
+
+        queries = [
+            ('point', lambda: index.point_batch(chroms, positions)),
+            ('range 1kb', lambda: index.overlap_batch(chroms, positions, positions + 1000)),
+            ('nearest', lambda: index.nearest_batch(chroms, positions)),
+        ]
+        for name, query in queries:
+            t0 = time.perf_counter()
+            query()
+            print('    %-10s queries/s: %.0f' % (name, args.queries / (time.perf_counter() - t0)))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
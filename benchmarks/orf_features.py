@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark of AnnotationSet.orf_features against the per annotation properties.
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/orf_features.py [-i annotation.bed] [-n n_lines]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial.readers import read_bed12
+from bed_reader import synthetic_bed12
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark ORF features')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=200000,
+                    help='number of lines of the synthetic BED12')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    with open(path) as f:
+        annotations = read_bed12(f)
+
+    t0 = time.perf_counter()
+    for annotation in annotations:
+        annotation._find_orf_index()
+    loop_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    annotations.orf_index()
+    annotations.orf_features()
+    set_time = time.perf_counter() - t0
+
+    print('annotations: %d' % len(annotations))
+    print('per annotation: %.2fs' % loop_time)
+    print('orf_features:   %.2fs (%.0fx)' % (set_time, loop_time / set_time))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark of output writers: InteractiveAnnotation.format (one line at a time)
+versus genial.writers.format_set (all rows of an AnnotationSet at once).
+The outputs are compared, byte by byte.
+
+Without an input file, a synthetic BED12 is generated.
+
+usage: python benchmarks/writers.py [-i annotation.bed] [-n n_lines]
+"""
+
+import argparse as argp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from genial import output_formats
+from genial.readers import read_bed12
+from genial.writers import format_set
+from bed_reader import synthetic_bed12
+
+
+def main():
+    ap = argp.ArgumentParser(description='Benchmark output writers')
+    ap.add_argument('-i', '--input', help='BED12 file (default: synthetic BED12)')
+    ap.add_argument('-n', '--lines', type=int, default=100000,
+                    help='number of lines of the synthetic BED12')
+    args = ap.parse_args()
+
+    if args.input:
+        path = args.input
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix='.bed', delete=False)
+        tmp.close()
+        path = tmp.name
+        synthetic_bed12(path, args.lines)
+
+    with open(path) as f:
+        annotations = read_bed12(f)
+    n = len(annotations)
+    print('annotations: %d' % n)
+
+    for output_format in sorted(output_formats):
+        t0 = time.perf_counter()
+        expected = ''.join(line + '\n' for line in
+                           (annotation.format(output_format) for annotation in annotations) if line)
+        format_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        output = format_set(annotations, output_format)
+        writer_time = time.perf_counter() - t0
+
+        assert output == expected, 'output of format_set differs from format(%r)' % output_format
+        print('%-10s  format() annotations/s: %9.0f  format_set annotations/s: %9.0f  speedup: %.1fx'
+              % (output_format, n / format_time, n / writer_time, format_time / writer_time))
+
+    if not args.input:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import argparse as argp
+import os
+import sys
+
+from genial.utils import magic_open
+from genial import parse_to_set, input_formats
+from genial.compare import Comparison
+
+
+def read_set(path, input_format, use_cache):
+    if not os.path.exists(path):
+        raise SystemExit("ERROR: input file %s doesn't exist" % path)
+    # gnl: memory mapped, no need to uncompress
+    with (open(path, 'rb') if input_format == 'gnl' else magic_open(path)) as f:
+        return parse_to_set(f, input_format, cache=use_cache)
+
+
+def main():
+    ap = argp.ArgumentParser(description='Compare the transcripts of an annotation file against a reference. '
+                                         'Writes the class code (as gffcompare) and the best reference match '
+                                         'of each transcript.')
+    ap.add_argument('-i', '--input', required=True,
+                    help='input (query) file')
+    ap.add_argument('-f', '--input_format',
+                    help='input file format',
+                    default='bed',
+                    choices=input_formats)
+    ap.add_argument('-r', '--reference', required=True,
+                    help='reference file')
+    ap.add_argument('-F', '--reference_format',
+                    help='reference file format (default: the input file format)',
+                    choices=input_formats)
+    ap.add_argument('-o', '--output',
+                    help='output file (tab separated, one line per input transcript)', default=sys.stdout)
+    ap.add_argument('-s', '--stats',
+                    help='file where sensitivity and precision of each level are written '
+                         '(default: stderr)')
+    ap.add_argument('--single_exon_overlap', type=float, default=0.8,
+                    help='single exon transcripts with an exonic overlap of at least this fraction '
+                         'of the longer one are matches (=)')
+    ap.add_argument('--threads', type=int, default=1,
+                    help='number of processes used to classify the input transcripts')
+    ap.add_argument('--no-cache', default=False, action='store_true',
+                    help="don't load (or save) parsed annotations from the cache "
+                         '($GENIAL_CACHE_DIR, default: ~/.cache/genial)')
+
+    args = ap.parse_args()
+
+    if args.output is not sys.stdout and os.path.exists(args.output):
+        raise SystemExit('ERROR: %s already exists!!!' % args.output)
+
+    use_cache = not args.no_cache
+    query = read_set(args.input, args.input_format, use_cache)
+    reference = read_set(args.reference, args.reference_format or args.input_format, use_cache)
+
+    comparison = Comparison(reference, single_exon_overlap=args.single_exon_overlap)
+    classes = comparison.classify(query, threads=args.threads)
+    accuracy = comparison.accuracy(query, classes)
+
+    classes.drop(columns='ref_row').to_csv(args.output, sep='\t', index=False, na_rep='-')
+    if args.stats:
+        accuracy.to_csv(args.stats, sep='\t', index_label='level', float_format='%.4f')
+    else:
+        print(accuracy.to_string(float_format='%.4f'), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
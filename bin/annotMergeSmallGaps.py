@@ -3,9 +3,23 @@
 import argparse as argp
 import os
 import sys
+from collections import Counter
 
 from genial.utils import magic_open
-from genial import parse, input_formats, output_formats
+from genial import parse, parse_to_set, input_formats, output_formats, AnnotationSet
+from genial.AnnotationSet import iter_chunks
+from genial.writers import format_set, write
+from genial import cache
+from genial.gff import format_feature_counts
+
+
+def merge_chunk(annotations, small_gap, output_format, cds=False):
+    """used by --threads: the output of a chunk of annotations as a single string (AnnotationSet for gnl)"""
+    merged = AnnotationSet.from_annotations(annotations).merge_small_gaps(small_gap, cds)
+    if output_format == 'gnl':
+        # binary: the chunks are concatenated and written at once
+        return merged
+    return format_set(merged, output_format)
 
 
 def main():
@@ -25,6 +39,22 @@ def main():
                     choices=output_formats)
     ap.add_argument('-s', '--small_gap_size', type=int, default=9,
                     help='gap size.')
+    ap.add_argument('--cds', default=False, action='store_true',
+                    help='also merge small gaps between CDS blocks')
+    ap.add_argument('--streaming', default=False, action='store_true',
+                    help='gff3/gtf grouped by gene (eg: ensembl, gencode): '
+                         'output each gene as soon as it is parsed')
+    ap.add_argument('--threads', type=int, default=1,
+                    help='number of processes used to parse and convert the input file '
+                         '(not used when reading from stdin)')
+    ap.add_argument('--no-cache', default=False, action='store_true',
+                    help="don't load (or save) parsed annotations from the cache "
+                         '($GENIAL_CACHE_DIR, default: ~/.cache/genial)')
+    ap.add_argument('--cache-stats', default=False, action='store_true',
+                    help='print cache hits/misses to stderr')
+    ap.add_argument('--feature-stats', default=False, action='store_true',
+                    help='gff3/gtf: print the number of lines of each feature type parsed or skipped '
+                         'to stderr (not counted with --threads or on cache hits)')
 
 
     args = ap.parse_args()
@@ -41,9 +71,14 @@ def main():
 
     if args.input:
         if args.input == 'stdin':
+            if input_format == 'gnl':
+                raise SystemExit("ERROR: gnl files can't be read from stdin")
             f_in = sys.stdin
         elif not os.path.exists(args.input):
             raise SystemExit("ERROR: input file %s doesn't exist" % args.input)
+        elif input_format == 'gnl':
+            # memory mapped: no need to uncompress
+            f_in = open(args.input, 'rb')
         else:
             f_in = magic_open(args.input)
     else:
@@ -53,7 +88,7 @@ def main():
 
     if args.output:
         if args.output == sys.stdout:
-            f_out = sys.stdout
+            f_out = sys.stdout.buffer if output_format == 'gnl' else sys.stdout
 
         elif os.path.exists(args.output):
             raise SystemExit('ERROR: %s already exists!!!' % args.output)
@@ -62,14 +97,49 @@ def main():
             # dirname = os.path.dirname(args.output)
             # os.makedirs(dirname, exist_ok=True)
             # print('created dir', dirname, file=sys.stderr)
-            f_out = open(args.output, 'w')
+            f_out = open(args.output, 'wb' if output_format == 'gnl' else 'w')
+
+    small_gap = args.small_gap_size
+
+    use_cache = not args.no_cache and f_in is not sys.stdin
+    feature_counts = Counter()
+
+    parallel = args.threads > 1 and f_in is not sys.stdin and input_format != 'gnl'
+    if parallel and not (use_cache and cache.lookup(args.input, input_format)):
+        from functools import partial
+        from genial.parallel import process_chunks
+
+        f_in.close()
+        func = partial(merge_chunk, small_gap=small_gap, output_format=output_format, cds=args.cds)
+        outputs = process_chunks(args.input, input_format, func, threads=args.threads)
+        if output_format == 'gnl':
+            write(AnnotationSet.concat(outputs), f_out, output_format)
+        else:
+            for output in outputs:
+                f_out.write(output)
+
+    else:
+        # all annotations of a chunk are merged at once
+        if args.streaming:
+            annotations = parse(f_in, input_format, streaming=True, cache=use_cache,
+                                feature_counts=feature_counts)
+            annotation_sets = iter_chunks(annotations, 10000)
+        else:
+            annotation_sets = [parse_to_set(f_in, input_format, cache=use_cache,
+                                            feature_counts=feature_counts)]
+        merged = (s.merge_small_gaps(small_gap, args.cds) for s in annotation_sets)
+
+        if output_format == 'gnl':
+            write(AnnotationSet.concat(merged), f_out, output_format)
+        else:
+            for annotation_set in merged:
+                write(annotation_set, f_out, output_format)
 
-    for annotation in parse(f_in, input_format):
-        if annotation.blockCount() > 1:
-            small_gap = args.small_gap_size
-            annotation = annotation.merge_small_gaps(small_gap)
+    if args.cache_stats:
+        print(cache.format_stats(), file=sys.stderr)
 
-        print(annotation.format(output_format), file=f_out, sep='\t')
+    if args.feature_stats:
+        print(format_feature_counts(feature_counts), file=sys.stderr)
 
     f_in.close()
     f_out.close()
@@ -3,11 +3,50 @@
 import argparse as argp
 import os
 import sys
-
-import numpy as np
+from collections import Counter
 
 from genial.utils import magic_open
-from genial import parse, input_formats, output_formats
+from genial import parse, parse_to_set, input_formats, output_formats, AnnotationSet
+from genial.writers import format_set, write
+from genial import cache
+from genial.gff import format_feature_counts
+from genial.exceptions import UnsupportedFile
+from genial.filters import Chrom, Coding, ExonCount, IdMatches, IntronSize, Length, Strand
+
+
+def build_predicate(argv):
+    """genial.filters predicate with the filter options of the command line"""
+    predicate = ExonCount(minimum=argv.min_exon_count, maximum=argv.max_exon_count)
+    # 0 disables the intron filters
+    if argv.ignore_gaps_smaller_than or argv.ignore_gaps_bigger_than:
+        predicate &= IntronSize(minimum=argv.ignore_gaps_smaller_than or None,
+                                maximum=argv.ignore_gaps_bigger_than or None)
+    if argv.min_length is not None or argv.max_length is not None:
+        predicate &= Length(minimum=argv.min_length, maximum=argv.max_length)
+    if argv.chrom:
+        predicate &= Chrom(*argv.chrom)
+    if argv.strand:
+        predicate &= Strand(argv.strand)
+    if argv.coding:
+        predicate &= Coding()
+    if argv.non_coding:
+        predicate &= ~Coding()
+    if argv.id_regex:
+        predicate &= IdMatches(argv.id_regex)
+
+    # argv -v / --invert_match
+    if argv.invert_match:
+        predicate = ~predicate
+    return predicate
+
+
+def convert_chunk(annotations, output_format, predicate):
+    """used by --threads: the output of a chunk of annotations as a single string (AnnotationSet for gnl)"""
+    selected = predicate.select(AnnotationSet.from_annotations(annotations))
+    if output_format == 'gnl':
+        # binary: the chunks are concatenated and written at once
+        return selected
+    return format_set(selected, output_format)
 
 
 def main():
@@ -30,11 +69,46 @@ def main():
     ap.add_argument('-n', '--min_exon_count', type=int, default=1,
                     help='min number of exons')
 
+    ap.add_argument('--max_exon_count', type=int, default=None,
+                    help='max number of exons')
     ap.add_argument('-igs', '--ignore_gaps_smaller_than', type=int, default=False)
     ap.add_argument('-igb', '--ignore_gaps_bigger_than', type=int, default=False)
+    ap.add_argument('--min_length', type=int, default=None,
+                    help='min length (end - start)')
+    ap.add_argument('--max_length', type=int, default=None,
+                    help='max length (end - start)')
+    ap.add_argument('--chrom', action='append',
+                    help='only annotations on this chromosome (can be repeated)')
+    ap.add_argument('--strand', choices=['+', '-'])
+    ap.add_argument('--coding', default=False, action='store_true',
+                    help='only annotations with CDS')
+    ap.add_argument('--non_coding', default=False, action='store_true',
+                    help='only annotations without CDS')
+    ap.add_argument('--id_regex',
+                    help='only annotations with a transcript id matching this regular expression')
 
     ap.add_argument('-v', '--invert_match', default=False, action='store_true',
                     help='select non matching annotations (similar to grep -v)',)
+    ap.add_argument('--streaming', default=False, action='store_true',
+                    help='gff3/gtf grouped by gene (eg: ensembl, gencode): '
+                         'output each gene as soon as it is parsed')
+    ap.add_argument('--threads', type=int, default=1,
+                    help='number of processes used to parse and convert the input file '
+                         '(not used when reading from stdin)')
+    ap.add_argument('--no-cache', default=False, action='store_true',
+                    help="don't load (or save) parsed annotations from the cache "
+                         '($GENIAL_CACHE_DIR, default: ~/.cache/genial)')
+    ap.add_argument('--cache-stats', default=False, action='store_true',
+                    help='print cache hits/misses to stderr')
+    ap.add_argument('--feature-stats', default=False, action='store_true',
+                    help='gff3/gtf: print the number of lines of each feature type parsed or skipped '
+                         'to stderr (not counted with --threads or on cache hits)')
+    ap.add_argument('--region', action='append', metavar='CHR:START-END',
+                    help='bed/gtf: only output annotations overlapping this region (1-based, inclusive; '
+                         'can be repeated). Only the needed parts of the file are read, using an index '
+                         '(INPUT.gix, built on the first use). The input must be bgzipped or uncompressed')
+    ap.add_argument('--regions-file',
+                    help='same as --region, with the regions of a bed file (or one CHR:START-END per line)')
 
     argv = ap.parse_args()
 
@@ -48,11 +122,28 @@ def main():
         if output_format not in output_formats:
             raise SystemExit('ERROR: %s extension is not supported' % output_format)
 
+    regions = None
+    if argv.region or argv.regions_file:
+        from genial.tabix import read_regions_file
+        if input_format not in ('bed', 'gtf'):
+            raise SystemExit('ERROR: --region is only supported for bed and gtf files')
+        if not argv.input or argv.input == 'stdin':
+            raise SystemExit("ERROR: --region can't be used reading from stdin")
+        regions = list(argv.region or [])
+        if argv.regions_file:
+            with magic_open(argv.regions_file) as f:
+                regions.extend(read_regions_file(f))
+
     if argv.input:
         if argv.input == 'stdin':
+            if input_format == 'gnl':
+                raise SystemExit("ERROR: gnl files can't be read from stdin")
             f_in = sys.stdin
         elif not os.path.exists(argv.input):
             raise SystemExit("ERROR: input file %s doesn't exist" % argv.input)
+        elif input_format == 'gnl' or regions is not None:
+            # memory mapped / read through the region index: no need to uncompress
+            f_in = open(argv.input, 'rb')
         else:
             f_in = magic_open(argv.input)
     else:
@@ -62,7 +153,7 @@ def main():
 
     if argv.output:
         if argv.output == 'stdout':
-            f_out = sys.stdout
+            f_out = sys.stdout.buffer if output_format == 'gnl' else sys.stdout
 
         # elif os.path.exists(argv.output):
         #     raise SystemExit('ERROR: %s already exists!!!' % argv.output)
@@ -71,53 +162,54 @@ def main():
             # dirname = os.path.dirname(argv.output)
             # os.makedirs(dirname, exist_ok=True)
             # print('created dir', dirname, file=sys.stderr)
-            f_out = open(argv.output, 'w')
-
-    def filter(annotation, min_exon_count, small_gap, huge_gap):
-        c = 0
-
-        if annotation.blockCount() < min_exon_count:
-            # if we already know the count is above the minimum, just ignore it
-            return False
-
-        elif annotation.blockCount() > 1:
-            # ignore small introns
-            if small_gap:
-                gaps = annotation.introns
-                small_gaps_count = np.sum(gaps < small_gap)
-                if small_gaps_count > 0:
-                    c += 1
-
-            # ignore HUGE introns
-            if huge_gap:
-                gaps = annotation.introns
-                huge_gaps_count = np.sum(gaps > huge_gap)
-                if huge_gaps_count > 0:
-                    c += 1
-
-        if c > 0:
-            return False
-        else:
-            return True
-
-    # list of args to be used on filter function
-    args = [argv.min_exon_count,
-            argv.ignore_gaps_smaller_than,
-            argv.ignore_gaps_bigger_than]
+            f_out = open(argv.output, 'wb' if output_format == 'gnl' else 'w')
 
-    # argv -v / --invert_match
-    match = True
-    if argv.invert_match:
-        match = False
+    predicate = build_predicate(argv)
 
+    use_cache = not argv.no_cache and f_in is not sys.stdin
+    feature_counts = Counter()
 
-    for annotation in parse(f_in, input_format):
+    parallel = argv.threads > 1 and f_in is not sys.stdin and input_format != 'gnl' and regions is None
+    if parallel and not (use_cache and cache.lookup(argv.input, input_format)):
+        from functools import partial
+        from genial.parallel import process_chunks
 
-        if filter(annotation, *args) == match:
-            output = annotation.format(output_format)
-            if output:  # skip empty lines
-                print(output, file=f_out)
+        f_in.close()
+        func = partial(convert_chunk, output_format=output_format, predicate=predicate)
+        outputs = process_chunks(argv.input, input_format, func, threads=argv.threads)
+        if output_format == 'gnl':
+            write(AnnotationSet.concat(outputs), f_out, output_format)
+        else:
+            for output in outputs:
+                f_out.write(output)
 
+    else:
+        # all annotations of a chunk are filtered at once
+        if regions is not None:
+            annotations = parse(f_in, input_format, feature_counts=feature_counts, regions=regions)
+            annotation_sets = predicate.select(annotations)
+        elif argv.streaming:
+            annotations = parse(f_in, input_format, streaming=True, cache=use_cache,
+                                feature_counts=feature_counts)
+            annotation_sets = predicate.select(annotations)
+        else:
+            annotation_sets = [predicate.select(parse_to_set(f_in, input_format, cache=use_cache,
+                                                             feature_counts=feature_counts))]
+
+        try:
+            if output_format == 'gnl':
+                write(AnnotationSet.concat(annotation_sets), f_out, output_format)
+            else:
+                for annotation_set in annotation_sets:
+                    write(annotation_set, f_out, output_format)
+        except UnsupportedFile as error:
+            raise SystemExit('ERROR: %s' % error)
+
+    if argv.cache_stats:
+        print(cache.format_stats(), file=sys.stderr)
+
+    if argv.feature_stats:
+        print(format_feature_counts(feature_counts), file=sys.stderr)
 
     f_in.close()
     f_out.close()
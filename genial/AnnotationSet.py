@@ -0,0 +1,615 @@
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+from .GenomeAnnotation import InteractiveAnnotation
+from .utils import merge_blocks
+
+
+def _categorical(values, size):
+    """Build a pandas.Categorical from values (or an all-missing one if values is None)."""
+    if values is None:
+        return pd.Categorical.from_codes(np.full(size, -1, dtype=np.int8), categories=[])
+    if isinstance(values, pd.Categorical):
+        return values
+    return pd.Categorical(values)
+
+
+def _category_at(column, row):
+    code = column.codes[row]
+    if code < 0:
+        return None
+    return column.categories[code]
+
+
+def segment_sum(values, offsets):
+    """
+    Sum values for each segment [offsets[i], offsets[i+1]) of a CSR-like layout.
+    Empty segments sum to 0.
+    """
+    cumsum = np.concatenate([[0], np.cumsum(values)])
+    return cumsum[offsets[1:]] - cumsum[offsets[:-1]]
+
+
+def gather_segments(offsets, rows):
+    """
+    Positions (on the flat arrays) of every element belonging to the given rows,
+    in the same order of rows, plus the offsets of the gathered layout.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    positions = np.arange(new_offsets[-1], dtype=np.int64)
+    positions += np.repeat(offsets[rows] - new_offsets[:-1], counts)
+    return positions, new_offsets
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is required for Arrow export (pip install genial[arrow])')
+    return pyarrow
+
+
+def iter_chunks(annotations, chunk_size):
+    """AnnotationSets with up to chunk_size annotations each, from an iterable of InteractiveAnnotation"""
+    annotations = iter(annotations)
+    while True:
+        chunk = AnnotationSet.from_annotations(islice(annotations, chunk_size))
+        if not len(chunk):
+            return
+        yield chunk
+
+
+def _block_property(name):
+    """
+    Property of an AnnotationView: read from the AnnotationSet row
+    until the attribute is explicitly assigned on the view.
+    """
+    def fget(self):
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            return self._set._row_value(name, self._row)
+
+    def fset(self, value):
+        self.__dict__[name] = value
+
+    return property(fget, fset)
+
+
+class AnnotationView(InteractiveAnnotation):
+    """
+    Lazy view of a single row of an AnnotationSet.
+
+    Behaves as an InteractiveAnnotation, but nothing is copied from the
+    AnnotationSet arrays until an attribute is accessed. Assigning an attribute
+    (eg: merge_small_gaps) only changes the view, never the AnnotationSet.
+    """
+
+    starts = _block_property('starts')
+    ends = _block_property('ends')
+    cds_starts = _block_property('cds_starts')
+    cds_ends = _block_property('cds_ends')
+    strand = _block_property('strand')
+    chrom = _block_property('chrom')
+    transcript_id = _block_property('transcript_id')
+    gene_id = _block_property('gene_id')
+    thickStart = _block_property('thickStart')
+    thickEnd = _block_property('thickEnd')
+    itemRgb = _block_property('itemRgb')
+
+    def __init__(self, annotation_set, row):
+        self._set = annotation_set
+        self._row = row
+
+    def __repr__(self):
+        return '<AnnotationView row={} {}>'.format(self._row, self.transcript_id)
+
+
+class AnnotationSet:
+    def __init__(self, starts, ends, offsets, chrom, strand,
+                 transcript_id=None, gene_id=None,
+                 cds_starts=None, cds_ends=None, cds_offsets=None,
+                 thick_starts=None, thick_ends=None, item_rgb=None):
+        """
+
+        A columnar collection of genomic annotations.
+
+        Exon blocks of all annotations are stored in flat int64 arrays (0-based starts),
+        and the blocks of row i are starts[offsets[i]:offsets[i+1]] (CSR-like layout).
+        CDS blocks use the same layout with their own cds_offsets.
+        chrom, strand, transcript_id, gene_id and item_rgb are stored as pandas.Categorical.
+
+        Parameters
+        ----------
+        starts, ends: flat arrays with the exon blocks
+        offsets: array with len(annotations) + 1 elements
+        chrom, strand: one value per row
+        transcript_id, gene_id: one value per row (optional)
+        cds_starts, cds_ends, cds_offsets: CDS blocks (optional)
+            rows without CDS have no blocks
+        thick_starts, thick_ends: one value per row, -1 when missing (optional)
+        item_rgb: one value per row (optional)
+        """
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        size = len(self.offsets) - 1
+
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+
+        if cds_offsets is None:
+            cds_starts = cds_ends = np.zeros(0, dtype=np.int64)
+            cds_offsets = np.zeros(size + 1, dtype=np.int64)
+        self.cds_starts = np.asarray(cds_starts, dtype=np.int64)
+        self.cds_ends = np.asarray(cds_ends, dtype=np.int64)
+        self.cds_offsets = np.asarray(cds_offsets, dtype=np.int64)
+
+        if thick_starts is None:
+            thick_starts = np.full(size, -1, dtype=np.int64)
+        if thick_ends is None:
+            thick_ends = np.full(size, -1, dtype=np.int64)
+        self.thick_starts = np.asarray(thick_starts, dtype=np.int64)
+        self.thick_ends = np.asarray(thick_ends, dtype=np.int64)
+
+        self.chrom = _categorical(chrom, size)
+        self.strand = _categorical(strand, size)
+        self.transcript_id = _categorical(transcript_id, size)
+        self.gene_id = _categorical(gene_id, size)
+        self.item_rgb = None if item_rgb is None else _categorical(item_rgb, size)
+
+        assert len(self.starts) == len(self.ends) == self.offsets[-1]
+        assert len(self.cds_starts) == len(self.cds_ends) == self.cds_offsets[-1]
+
+    @classmethod
+    def from_annotations(cls, annotations):
+        """
+        Build an AnnotationSet from an iterable of InteractiveAnnotation
+        (eg: the output of genial.parse)
+        """
+        starts, ends, counts = [], [], []
+        cds_starts, cds_ends, cds_counts = [], [], []
+        chrom, strand, transcript_id, gene_id = [], [], [], []
+        thick_starts, thick_ends, item_rgb = [], [], []
+
+        for annotation in annotations:
+            starts.append(np.asarray(annotation.starts, dtype=np.int64))
+            ends.append(np.asarray(annotation.ends, dtype=np.int64))
+            counts.append(len(annotation.starts))
+
+            if np.isnan(np.sum(annotation.cds_starts)):
+                cds_counts.append(0)
+            else:
+                cds_starts.append(np.asarray(annotation.cds_starts, dtype=np.int64))
+                cds_ends.append(np.asarray(annotation.cds_ends, dtype=np.int64))
+                cds_counts.append(len(annotation.cds_starts))
+
+            chrom.append(annotation.chrom)
+            strand.append(annotation.strand)
+            transcript_id.append(annotation.transcript_id)
+            gene_id.append(annotation.gene_id)
+            # thickStart may be a str (BED) or a number (GTF/GFF)
+            thick_starts.append(-1 if annotation.thickStart is None else int(annotation.thickStart))
+            thick_ends.append(-1 if annotation.thickEnd is None else int(annotation.thickEnd))
+            item_rgb.append(getattr(annotation, 'itemRgb', None))
+
+        def concat(arrays):
+            if arrays:
+                return np.concatenate(arrays)
+            return np.zeros(0, dtype=np.int64)
+
+        def to_offsets(block_counts):
+            offsets = np.zeros(len(block_counts) + 1, dtype=np.int64)
+            np.cumsum(block_counts, out=offsets[1:])
+            return offsets
+
+        if all(rgb is None for rgb in item_rgb):
+            item_rgb = None
+
+        return cls(concat(starts), concat(ends), to_offsets(counts),
+                   chrom=chrom,
+                   strand=strand,
+                   transcript_id=transcript_id,
+                   gene_id=gene_id,
+                   cds_starts=concat(cds_starts),
+                   cds_ends=concat(cds_ends),
+                   cds_offsets=to_offsets(cds_counts),
+                   thick_starts=thick_starts,
+                   thick_ends=thick_ends,
+                   item_rgb=item_rgb)
+
+    @classmethod
+    def concat(cls, annotation_sets):
+        """Concatenate several AnnotationSets (rows keep the given order)"""
+        annotation_sets = list(annotation_sets)
+        if not annotation_sets:
+            return cls.from_annotations([])
+
+        def stack_offsets(attr):
+            offsets = [np.zeros(1, dtype=np.int64)]
+            shift = 0
+            for annotation_set in annotation_sets:
+                arr = getattr(annotation_set, attr)
+                offsets.append(arr[1:] + shift)
+                shift += arr[-1]
+            return np.concatenate(offsets)
+
+        def stack(attr):
+            return np.concatenate([getattr(s, attr) for s in annotation_sets])
+
+        def stack_categorical(attr):
+            values = [getattr(s, attr) for s in annotation_sets]
+            if all(v is None for v in values):
+                return None
+            return pd.Categorical(np.concatenate([
+                np.full(len(s), None, dtype=object) if v is None else np.asarray(v, dtype=object)
+                for s, v in zip(annotation_sets, values)]))
+
+        return cls(stack('starts'), stack('ends'), stack_offsets('offsets'),
+                   chrom=stack_categorical('chrom'),
+                   strand=stack_categorical('strand'),
+                   transcript_id=stack_categorical('transcript_id'),
+                   gene_id=stack_categorical('gene_id'),
+                   cds_starts=stack('cds_starts'),
+                   cds_ends=stack('cds_ends'),
+                   cds_offsets=stack_offsets('cds_offsets'),
+                   thick_starts=stack('thick_starts'),
+                   thick_ends=stack('thick_ends'),
+                   item_rgb=stack_categorical('item_rgb'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield AnnotationView(self, row)
+
+    def __getitem__(self, item):
+        """
+        int => AnnotationView of the row
+        slice, boolean mask or array of ints => a new AnnotationSet
+        """
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError('row %s out of range' % item)
+            return AnnotationView(self, int(item))
+
+        return self.take(np.arange(len(self))[item])
+
+    def take(self, rows):
+        """Return a new AnnotationSet with only the specified rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, offsets = gather_segments(self.offsets, rows)
+        cds_positions, cds_offsets = gather_segments(self.cds_offsets, rows)
+
+        def take_categorical(column):
+            if column is None:
+                return None
+            return pd.Categorical.from_codes(column.codes[rows], categories=column.categories)
+
+        return AnnotationSet(self.starts[positions], self.ends[positions], offsets,
+                             chrom=take_categorical(self.chrom),
+                             strand=take_categorical(self.strand),
+                             transcript_id=take_categorical(self.transcript_id),
+                             gene_id=take_categorical(self.gene_id),
+                             cds_starts=self.cds_starts[cds_positions],
+                             cds_ends=self.cds_ends[cds_positions],
+                             cds_offsets=cds_offsets,
+                             thick_starts=self.thick_starts[rows],
+                             thick_ends=self.thick_ends[rows],
+                             item_rgb=take_categorical(self.item_rgb))
+
+    def _row_value(self, name, row):
+        """values used by AnnotationView"""
+        if name in ('starts', 'ends'):
+            return getattr(self, name)[self.offsets[row]:self.offsets[row + 1]].copy()
+
+        elif name in ('cds_starts', 'cds_ends'):
+            lo, hi = self.cds_offsets[row], self.cds_offsets[row + 1]
+            if lo == hi:
+                return np.array([np.nan])
+            return getattr(self, name)[lo:hi].copy()
+
+        elif name in ('thickStart', 'thickEnd'):
+            column = self.thick_starts if name == 'thickStart' else self.thick_ends
+            if column[row] < 0:
+                return None
+            return column[row]
+
+        elif name == 'itemRgb':
+            value = None if self.item_rgb is None else _category_at(self.item_rgb, row)
+            if value is None:
+                raise AttributeError("attribute itemRgb doesn't exist")
+            return value
+
+        return _category_at(getattr(self, name), row)
+
+    def row_ids(self, offsets=None):
+        """row index of each block (by default, of each exon block)"""
+        if offsets is None:
+            offsets = self.offsets
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    def split(self, values, offsets=None):
+        """split a flat array in a list with one array per row"""
+        if offsets is None:
+            offsets = self.offsets
+        return np.split(values, offsets[1:-1])
+
+    def blockCount(self):
+        return np.diff(self.offsets)
+
+    def blockSizes(self):
+        return self.ends - self.starts
+
+    @property
+    def exons(self):
+        """flat array with the size of every exon (use offsets to split it by row)"""
+        return self.ends - self.starts
+
+    @property
+    def intron_offsets(self):
+        """offsets of introns on the flat array returned by introns"""
+        counts = np.maximum(self.blockCount() - 1, 0)
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return offsets
+
+    @property
+    def introns(self):
+        """flat array with the size of every intron (use intron_offsets to split it by row)"""
+        # every block, but the first of each row, is preceded by an intron
+        not_first = np.ones(len(self.starts), dtype=bool)
+        not_first[self.offsets[:-1][self.blockCount() > 0]] = False
+        idx = np.flatnonzero(not_first)
+        return self.starts[idx] - self.ends[idx - 1]
+
+    @property
+    def cds(self):
+        """flat array with the size of every CDS block (use cds_offsets to split it by row)"""
+        return self.cds_ends - self.cds_starts
+
+    orf_blocks = cds
+
+    @property
+    def orf_size(self):
+        """ORF size of each row (nan for non coding rows)"""
+        size = segment_sum(self.cds, self.cds_offsets).astype(np.float64)
+        size[np.diff(self.cds_offsets) == 0] = np.nan
+        return size
+
+    @property
+    def start(self):
+        """first start of each row"""
+        return self.starts[self.offsets[:-1]]
+
+    @property
+    def end(self):
+        """last end of each row"""
+        return self.ends[self.offsets[1:] - 1]
+
+    @property
+    def is_coding(self):
+        """True for rows with an ORF (thickStart < thickEnd)"""
+        return (self.thick_starts >= 0) & (self.thick_ends > self.thick_starts)
+
+    def orf_index(self):
+        """
+        Index (within the row) of the exons with the start (thickStart) and the end
+        (thickEnd) of the ORF of each row, as InteractiveAnnotation._find_orf_index.
+
+        Returns
+        -------
+        start_index, stop_index: int64 arrays (-1 for non coding rows)
+        """
+        counts = self.blockCount()
+        coding = self.is_coding & (counts > 0)
+        rows = self.row_ids()
+        if not len(rows):
+            empty = np.full(len(self), -1, dtype=np.int64)
+            return empty, empty.copy()
+
+        # rows are shifted apart by span: one searchsorted for all rows
+        low = self.starts.min()
+        span = self.ends.max() - low + 1
+        shift = np.arange(len(self), dtype=np.int64) * span - low
+        thick_starts = np.clip(self.thick_starts, self.start, self.end)
+        thick_ends = np.clip(self.thick_ends, self.start, self.end)
+
+        first = self.offsets[:-1]
+        start_index = np.searchsorted(self.starts + shift[rows], thick_starts + shift, side='right') - 1 - first
+        stop_index = np.searchsorted(self.ends + shift[rows], thick_ends + shift, side='left') - first
+
+        start_index = np.where(coding, np.maximum(start_index, 0), -1)
+        stop_index = np.where(coding, np.minimum(stop_index, counts - 1), -1)
+        return start_index, stop_index
+
+    def orf_features(self):
+        """
+        ORF features of every row, computed in one pass from thickStart/thickEnd.
+
+        Returns
+        -------
+        dict of numpy arrays:
+            coding: coding bases of each exon (flat, split with offsets)
+            exon_contrib_to_orf: fraction of the ORF on each exon (flat; same as
+                InteractiveAnnotation.exon_contrib_to_orf, 0 for non coding rows)
+            phase: phase of the coding part of each exon, on the strand of the row
+                (flat; -1 for non coding exons)
+            orf_size: coding bases of each row (nan for non coding rows)
+            five_prime_utr, three_prime_utr: exonic bases before/after the ORF of each
+                row, on the strand of the row (nan for non coding rows)
+        """
+        rows = self.row_ids()
+        is_coding = self.is_coding
+        thick_starts = np.where(is_coding, self.thick_starts, 0)[rows]
+        thick_ends = np.where(is_coding, self.thick_ends, 0)[rows]
+
+        coding = np.clip(np.minimum(self.ends, thick_ends) - np.maximum(self.starts, thick_starts), 0, None)
+        before = segment_sum(np.clip(np.minimum(self.ends, thick_starts) - self.starts, 0, None), self.offsets)
+        after = segment_sum(np.clip(self.ends - np.maximum(self.starts, thick_ends), 0, None), self.offsets)
+        orf_size = segment_sum(coding, self.offsets).astype(np.float64)
+        orf_size[~is_coding] = np.nan
+
+        # fraction of the ORF on each exon (single exon rows: coding fraction of the exon)
+        single = (self.blockCount() == 1)[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            contrib = np.where(single, coding / self.exons, coding / orf_size[rows])
+        contrib[~is_coding[rows]] = 0
+
+        # coding bases upstream of each exon, on the strand of the row
+        upstream = np.concatenate([[0], np.cumsum(coding)])
+        upstream = upstream[:-1] - upstream[self.offsets[:-1]][rows]
+        minus = np.asarray(self.strand == '-')[rows]
+        upstream = np.where(minus, np.nan_to_num(orf_size)[rows] - upstream - coding, upstream).astype(np.int64)
+        phase = np.where(coding > 0, (3 - upstream % 3) % 3, -1)
+
+        minus = np.asarray(self.strand == '-')
+        five_prime = np.where(minus, after, before).astype(np.float64)
+        three_prime = np.where(minus, before, after).astype(np.float64)
+        five_prime[~is_coding] = np.nan
+        three_prime[~is_coding] = np.nan
+
+        return {'coding': coding,
+                'exon_contrib_to_orf': contrib,
+                'phase': phase,
+                'orf_size': orf_size,
+                'five_prime_utr': five_prime,
+                'three_prime_utr': three_prime}
+
+    def merge_small_gaps(self, gap=15, cds=False):
+        """
+        Merge gaps smaller or equals gap on every row at once
+        (same as InteractiveAnnotation.merge_small_gaps).
+
+        Parameters
+        ----------
+        gap: int
+        cds: Boolean (default: False)
+            also merge small gaps between CDS blocks
+
+        Returns
+        -------
+        a new AnnotationSet
+        """
+        starts, ends, offsets = merge_blocks(self.starts, self.ends, self.offsets, gap)
+        if cds:
+            cds_starts, cds_ends, cds_offsets = merge_blocks(self.cds_starts, self.cds_ends,
+                                                             self.cds_offsets, gap)
+        else:
+            cds_starts, cds_ends, cds_offsets = self.cds_starts, self.cds_ends, self.cds_offsets
+
+        return AnnotationSet(starts, ends, offsets,
+                             chrom=self.chrom,
+                             strand=self.strand,
+                             transcript_id=self.transcript_id,
+                             gene_id=self.gene_id,
+                             cds_starts=cds_starts,
+                             cds_ends=cds_ends,
+                             cds_offsets=cds_offsets,
+                             thick_starts=self.thick_starts,
+                             thick_ends=self.thick_ends,
+                             item_rgb=self.item_rgb)
+
+    def _scalar_columns(self):
+        """name and per row array of the columns with a single value per row"""
+        columns = [('chrom', self.chrom),
+                   ('start', self.start),
+                   ('end', self.end),
+                   ('strand', self.strand),
+                   ('transcript_id', self.transcript_id),
+                   ('gene_id', self.gene_id),
+                   ('thick_start', self.thick_starts),
+                   ('thick_end', self.thick_ends),
+                   ('block_count', self.blockCount())]
+        if self.item_rgb is not None:
+            columns.append(('item_rgb', self.item_rgb))
+        return columns
+
+    def _block_columns(self):
+        """name, flat array and offsets of the columns with the blocks of each row"""
+        return [('starts', self.starts, self.offsets),
+                ('ends', self.ends, self.offsets),
+                ('cds_starts', self.cds_starts, self.cds_offsets),
+                ('cds_ends', self.cds_ends, self.cds_offsets)]
+
+    def to_arrow(self):
+        """
+        pyarrow.Table with one row per annotation (requires pyarrow).
+
+        chrom, strand, transcript_id, gene_id and item_rgb are dictionary encoded,
+        start, end and block_count are int64, thick_start/thick_end are int64 with
+        nulls when missing. starts, ends, cds_starts and cds_ends are large_list<int64>
+        columns, whose values and offsets are the flat arrays of the set (not copied).
+        """
+        pa = _import_pyarrow()
+
+        arrays = {}
+        for name, column in self._scalar_columns():
+            if isinstance(column, pd.Categorical):
+                categories = pa.array(np.asarray(column.categories, dtype=object), type=pa.string())
+                codes = pa.array(column.codes, mask=column.codes < 0)
+                arrays[name] = pa.DictionaryArray.from_arrays(codes, categories)
+            elif name in ('thick_start', 'thick_end'):
+                arrays[name] = pa.array(column, mask=column < 0)
+            else:
+                arrays[name] = pa.array(column)
+
+        for name, values, offsets in self._block_columns():
+            arrays[name] = pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values))
+
+        return pa.table(arrays)
+
+    def to_pandas(self, blocks=True):
+        """
+        pandas.DataFrame with one row per annotation.
+
+        chrom, strand, transcript_id, gene_id and item_rgb are categorical,
+        start, end and block_count are int64, thick_start/thick_end are Int64
+        (<NA> when missing).
+
+        Parameters
+        ----------
+        blocks: bool (default: True)
+            add the starts, ends, cds_starts and cds_ends columns with the blocks of each row.
+            With pyarrow, they are list columns (pd.ArrowDtype) sharing the flat arrays of the set
+            (see to_arrow). Without it, they are object columns of numpy arrays (views of the
+            flat arrays).
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        data = {}
+        for name, column in self._scalar_columns():
+            if name in ('thick_start', 'thick_end'):
+                column = pd.arrays.IntegerArray(column, column < 0)
+            data[name] = column
+
+        if blocks:
+            try:
+                pa = _import_pyarrow()
+            except ImportError:
+                pa = None
+
+            for name, values, offsets in self._block_columns():
+                if pa is not None:
+                    lists = pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values))
+                    data[name] = pd.arrays.ArrowExtensionArray(lists)
+                else:
+                    column = np.empty(len(self), dtype=object)
+                    column[:] = self.split(values, offsets)
+                    data[name] = column
+
+        return pd.DataFrame(data)
+
+    def format(self, format):
+        """yield each row formatted as InteractiveAnnotation.format"""
+        for annotation in self:
+            yield annotation.format(format)
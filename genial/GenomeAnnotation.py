@@ -1,7 +1,9 @@
 import re
+from abc import ABCMeta
+
 import numpy as np
 
-from .utils import str2array, stringfy, sort_intervals
+from .utils import coords2array, str2array, stringfy, sort_intervals, merge_blocks
 
 
 def _bed6_to_GeneAnnot(bed6):
@@ -20,78 +22,13 @@ def _bed6_to_GeneAnnot(bed6):
     return g_annot
 
 
-class InteractiveAnnotation:
-    def __init__(self, starts, ends, strand, cds_starts=None, cds_ends=None,
-                 starts_offset=1, orientation='Unknown', **kwargs):
-        """
-
-        A interactive and flexible genomic anotation.
-
-        Parameters
-        ----------
-        starts
-        ends
-        strand
-        cds_starts
-        cds_ends
-        starts_offset: 0 or 1 (default = 1)
-            GTF/GFF => use 1
-            BED => use 0
-            extb => use 0
-        orientation
-        kwargs
-        """
-
-        # self.starts = np.array([np.nan])
-        # self.ends = np.array([np.nan])
-        # self.strand = None
-        # self.cds_starts = np.array([np.nan])
-        # self.cds_ends = np.array([np.nan])
-        self.chrom = None
-        self.transcript_id = None
-        self.gene_id = None
-        self.thickStart = None
-        self.thickEnd = None
-
-        # create/update all custom defined kwargs
-        for k, v in kwargs.items():
-            setattr(self, k, v)
-
-        if type(starts) == str:
-            starts = str2array(starts)
-            ends = str2array(ends)
-
-        self.starts = starts.copy()
-        self.ends = ends.copy()
-
-        if not re.match('-|\+', strand):
-            raise Exception('invalid strand value: %s' % strand)
-        self.strand = strand
-
-        # assert len(self.starts) == len(self.ends)
-
-        # make starts 0-based
-        self.starts -= starts_offset
-
-        if cds_starts and cds_ends:
-            cds_starts = str2array(cds_starts)
-            cds_ends = str2array(cds_ends)
-
-            assert len(cds_starts) == len(cds_ends)
-            # make starts 0-based
-            cds_starts -= starts_offset
-            self.cds_starts = cds_starts
-            self.cds_ends = cds_ends
-
-            self.thickStart = np.min(cds_starts)
-            self.thickEnd = np.max(cds_ends)
-
-        else:
-            self.cds_starts = np.array([np.nan])
-            self.cds_ends = np.array([np.nan])
+class _Annotation(metaclass=ABCMeta):
+    """
+    Methods of InteractiveAnnotation and LazyAnnotation. It has no instance attributes
+    (empty __slots__), so the ones of LazyAnnotation are all on its __slots__.
+    """
 
-        self._fix_orientation(orientation)
-        # self._reverse()
+    __slots__ = ()
 
     def __len__(self):
         return len(self.starts)
@@ -136,78 +73,35 @@ class InteractiveAnnotation:
 
     @property
     def exon_contrib_to_orf(self):
-        # if self.cds == 'NA':
+        """
+        Fraction of the ORF on each exon (for single exon annotations,
+        the fraction of the exon that is coding).
+        """
         if np.isnan(np.sum(self.cds_starts)):
             return np.zeros_like(self.exons)
 
-        else:
-            start = self.cds_starts[0]
-            stop = self.cds_ends[-1]
-            contrib = np.zeros_like(self.exons, dtype=np.float32)
-
-            if len(self) == 1:
-                coding = stop - start
-                total = self.ends[-1] - self.starts[0]
-                return np.array([coding/total])
-
-            else:
-                # find exon with start codon
-                for i, g_start in enumerate(self.starts):
-                    if start >= g_start:
-                        startIndex = i
-                        break
-
-                # find exon with stop codon
-                for i, g_end in reversed(list(enumerate(self.ends))):
-                    if stop > g_end:
-                        stopIndex = i + 1
-                        break
-                    elif stop == g_end:
-                        stopIndex = i
-                        break
-
-            for i in range(self.blockCount()):
-                if i < startIndex:
-                    contrib[i] = 0
+        start = self.cds_starts[0]
+        stop = self.cds_ends[-1]
 
-                elif i == startIndex:
-                    contrib[i] = (self.ends[i] - start) / self.orf_size
+        if len(self) == 1:
+            coding = stop - start
+            total = self.ends[-1] - self.starts[0]
+            return np.array([coding/total])
 
-                elif i < stopIndex:
-                    contrib[i] = self.exons[i] / self.orf_size
+        # coding bases of each exon
+        coding = np.clip(np.minimum(self.ends, stop) - np.maximum(self.starts, start), 0, None)
+        return (coding / self.orf_size).astype(np.float32)
 
+    def _find_orf_index(self):
+        """index of the exons with the start (thickStart) and the end (thickEnd) of the ORF"""
+        start = int(self.thickStart)
+        stop = int(self.thickEnd)
 
-                elif i == stopIndex:
-                    # if stop == self.ends[i]:
-                    #     contrib[i] = 1
-                    # else:
-                        # contrib[i] = (stop - self.starts[i]) / (self.ends[i] - self.starts[i])
-                    contrib[i] = (stop - self.starts[i]) / self.orf_size
-
-
-                else:
-                    contrib[i] = 0
-
-            return contrib
+        # last exon starting at or before start, first exon ending at or after stop
+        start_index = np.searchsorted(self.starts, start, side='right') - 1
+        stop_index = np.searchsorted(self.ends, stop, side='left')
 
-    def _find_orf_index(self):
-        start = self.thickStart
-        stop = self.thickEnd
-        for i, g_start in enumerate(self.starts):
-            if start >= g_start:
-                startIndex = i
-                break
-
-        # find exon with stop codon
-        for i, g_end in reversed(list(enumerate(self.ends))):
-            if stop > g_end:
-                stopIndex = i + 1
-                break
-            elif stop == g_end:
-                stopIndex = i
-                break
-
-        return startIndex, stopIndex
+        return max(int(start_index), 0), min(int(stop_index), len(self) - 1)
 
     @property
     def orf_size(self):
@@ -236,7 +130,7 @@ class InteractiveAnnotation:
     #
     #     return BedTool(self.format(format), from_string=True)
 
-    def merge_small_gaps(self, gap=15):
+    def merge_small_gaps(self, gap=15, cds=False):
         """
         Merge gaps smaller or equals the specified amount.
         Useful to remove gaps that should not be treated as introns.
@@ -247,46 +141,28 @@ class InteractiveAnnotation:
         ----------
         gap:    int
             size of the gap
-        pybedtools: Boolean
-            use pybedtools (and bedtools). should be removed in future releases.
+        cds: Boolean (default: False)
+            also merge small gaps between CDS blocks
 
         Returns
         -------
 
-        a new GeneAnnotation with gaps properly merged
+        the same annotation, with gaps properly merged
 
         """
+        # blocks are already sorted (see _fix_orientation)
+        offsets = [0, len(self.starts)]
+        self.starts, self.ends, _ = merge_blocks(self.starts, self.ends, offsets, gap)
 
-        #ToDO: add argument to allow this to be done to cds_starts / cds_ends?
-
-        intervals = [(s, e) for s, e in zip(self.starts, self.ends)]
-        # sorted_by_lower_bound = sorted(intervals, key=lambda tup: tup[0])
-        # hopefully we dont need to sort this data... we may activate this for some messed up data, though
-        merged = []
-
-        for higher in intervals:  # sorted_by_lower_bound: # intervals already sorted.
-            if not merged:
-                merged.append(higher)
-            else:
-                lower = merged[-1]
-                # test for intersection between lower and higher:
-                # we know via sorting that lower[0] <= higher[0]
-                if higher[0] <= lower[1] + gap:
-                    upper_bound = max(lower[1], higher[1])
-                    merged[-1] = (lower[0], upper_bound)  # replace by merged interval
-                else:
-                    merged.append(higher)
-
-        starts, ends = zip(*merged)
-        # self.starts = np.array(starts, dtype=np.int64)
-        # self.ends = np.array(ends, dtype=np.int64)
-        setattr(self, 'starts', np.array(starts, dtype=np.int64))
-        setattr(self, 'ends', np.array(ends, dtype=np.int64))
+        if cds and not np.isnan(np.sum(self.cds_starts)):
+            offsets = [0, len(self.cds_starts)]
+            self.cds_starts, self.cds_ends, _ = merge_blocks(self.cds_starts, self.cds_ends, offsets, gap)
 
         return self
 
     def _fix_orientation(self, orientation='Unknown'):
-        if orientation == 'transcript' and len(self) > 1:
+        # transcript orientation: blocks of the minus strand are listed from 3' to 5'
+        if orientation == 'transcript' and len(self) > 1 and self.strand == '-':
         
             if orientation == 'transcript':
                 self._reverse()
@@ -347,7 +223,8 @@ class InteractiveAnnotation:
             else:
                 item_rgb = "200,155,55"
 
-            if self.thickStart and self.thickEnd:
+            # thickStart may be 0 (and a str, for BED files)
+            if self.thickStart is not None and self.thickEnd is not None:
                 thickStart = self.thickStart
                 thickEnd = self.thickEnd
             else:
@@ -412,4 +289,227 @@ class InteractiveAnnotation:
             return ''
 
         else:
-            super(InteractiveAnnotation, self).__format__(format)
+            super(_Annotation, self).__format__(format)
+
+
+class InteractiveAnnotation(_Annotation):
+    def __init__(self, starts, ends, strand, cds_starts=None, cds_ends=None,
+                 starts_offset=1, orientation='Unknown', **kwargs):
+        """
+
+        A interactive and flexible genomic anotation.
+
+        Parameters
+        ----------
+        starts
+        ends
+        strand
+        cds_starts
+        cds_ends
+        starts_offset: 0 or 1 (default = 1)
+            GTF/GFF => use 1
+            BED => use 0
+            extb => use 0
+        orientation
+        kwargs
+        """
+
+        # self.starts = np.array([np.nan])
+        # self.ends = np.array([np.nan])
+        # self.strand = None
+        # self.cds_starts = np.array([np.nan])
+        # self.cds_ends = np.array([np.nan])
+        self.chrom = None
+        self.transcript_id = None
+        self.gene_id = None
+        self.thickStart = None
+        self.thickEnd = None
+
+        # create/update all custom defined kwargs
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+        self.starts = coords2array(starts)
+        self.ends = coords2array(ends)
+
+        if not re.match('-|\+', strand):
+            raise Exception('invalid strand value: %s' % strand)
+        self.strand = strand
+
+        # assert len(self.starts) == len(self.ends)
+
+        # make starts 0-based
+        self.starts -= starts_offset
+
+        if cds_starts is not None and cds_ends is not None and len(cds_starts) and len(cds_ends):
+            cds_starts = coords2array(cds_starts)
+            cds_ends = coords2array(cds_ends)
+
+            assert len(cds_starts) == len(cds_ends)
+            # make starts 0-based
+            cds_starts -= starts_offset
+            self.cds_starts = cds_starts
+            self.cds_ends = cds_ends
+
+            self.thickStart = np.min(cds_starts)
+            self.thickEnd = np.max(cds_ends)
+
+        else:
+            self.cds_starts = np.array([np.nan])
+            self.cds_ends = np.array([np.nan])
+
+        self._fix_orientation(orientation)
+        # self._reverse()
+
+
+def _decode_blocks(starts, ends, cds_starts, cds_ends, starts_offset):
+    """blocks as InteractiveAnnotation.__init__ (cds_starts/cds_ends are None for non coding annotations)"""
+    starts = coords2array(starts)
+    ends = coords2array(ends)
+    # make starts 0-based
+    starts -= starts_offset
+
+    if cds_starts is not None and cds_ends is not None and len(cds_starts) and len(cds_ends):
+        cds_starts = coords2array(cds_starts)
+        cds_ends = coords2array(cds_ends)
+        assert len(cds_starts) == len(cds_ends)
+        cds_starts -= starts_offset
+    else:
+        cds_starts = cds_ends = None
+
+    return starts, ends, cds_starts, cds_ends
+
+
+def _decode_bed12(chrom_start, block_sizes, block_starts):
+    """blocks of a BED12 line (blockStarts are relative to chromStart)"""
+    starts = str2array(block_starts) + int(chrom_start)
+    ends = str2array(block_sizes) + starts
+    return starts, ends, None, None
+
+
+def _lazy_block(name):
+    """Property of a LazyAnnotation: decode the raw blocks on first access"""
+    def fget(self):
+        if self._raw is not None:
+            self._decode()
+        return getattr(self, name)
+
+    def fset(self, value):
+        if self._raw is not None:
+            self._decode()
+        setattr(self, name, value)
+
+    return property(fget, fset)
+
+
+class LazyAnnotation(_Annotation):
+    """
+    InteractiveAnnotation that keeps the raw coordinates (text, lists or buffers)
+    and only decodes, makes 0-based and sorts them on first access of
+    starts/ends/cds_starts/cds_ends/thickStart/thickEnd.
+
+    blockCount() doesn't decode the blocks, so filtering on chrom, strand, ids or
+    number of exons is cheap. Once decoded, it behaves as InteractiveAnnotation.
+
+    It has no __dict__: only the attributes on __slots__ (eg: chrom, transcript_id,
+    gene_id, itemRgb) can be set.
+    """
+
+    __slots__ = ('_raw', '_count', '_starts', '_ends', '_cds_starts', '_cds_ends',
+                 '_thick_start', '_thick_end', 'strand', 'chrom', 'transcript_id', 'gene_id', 'itemRgb')
+
+    starts = _lazy_block('_starts')
+    ends = _lazy_block('_ends')
+    cds_starts = _lazy_block('_cds_starts')
+    cds_ends = _lazy_block('_cds_ends')
+
+    def __init__(self, starts, ends, strand, cds_starts=None, cds_ends=None,
+                 starts_offset=1, orientation='Unknown', chrom=None, transcript_id=None,
+                 gene_id=None, thickStart=None, thickEnd=None, **kwargs):
+        """
+        Same parameters as InteractiveAnnotation.
+        """
+        if strand[:1] not in ('-', '+'):
+            raise Exception('invalid strand value: %s' % strand)
+        self.strand = strand
+        self.chrom = chrom
+        self.transcript_id = transcript_id
+        self.gene_id = gene_id
+        self._thick_start = thickStart
+        self._thick_end = thickEnd
+
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+        self._raw = (_decode_blocks, (starts, ends, cds_starts, cds_ends, starts_offset), orientation)
+        self._count = len(starts) if not isinstance(starts, str) else None
+
+    @classmethod
+    def from_bed12(cls, bed_field):
+        """LazyAnnotation from the (split) fields of a BED12 line"""
+        annotation = cls('', '', bed_field[5],
+                         chrom=bed_field[0],
+                         transcript_id=bed_field[3],
+                         thickStart=bed_field[6],
+                         thickEnd=bed_field[7],
+                         itemRgb=bed_field[8])
+        annotation._raw = (_decode_bed12, (bed_field[1], bed_field[10], bed_field[11]), 'genomic')
+        annotation._count = int(bed_field[9])
+        return annotation
+
+    def _decode(self):
+        decoder, args, orientation = self._raw
+        self._raw = None
+        self._starts, self._ends, cds_starts, cds_ends = decoder(*args)
+
+        if cds_starts is not None:
+            self._cds_starts = cds_starts
+            self._cds_ends = cds_ends
+            self._thick_start = np.min(cds_starts)
+            self._thick_end = np.max(cds_ends)
+        else:
+            self._cds_starts = np.array([np.nan])
+            self._cds_ends = np.array([np.nan])
+
+        self._fix_orientation(orientation)
+
+    @property
+    def thickStart(self):
+        if self._thick_start is None and self._raw is not None:
+            self._decode()
+        return self._thick_start
+
+    @thickStart.setter
+    def thickStart(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._thick_start = value
+
+    @property
+    def thickEnd(self):
+        if self._thick_end is None and self._raw is not None:
+            self._decode()
+        return self._thick_end
+
+    @thickEnd.setter
+    def thickEnd(self, value):
+        if self._raw is not None:
+            self._decode()
+        self._thick_end = value
+
+    @property
+    def decoded(self):
+        """True once the raw blocks were decoded"""
+        return self._raw is None
+
+    def __len__(self):
+        if self._raw is not None and self._count is not None:
+            return self._count
+        return len(self.starts)
+
+    def blockCount(self):
+        return len(self)
+
+
+# isinstance(annotation, InteractiveAnnotation) is True for both
+InteractiveAnnotation.register(LazyAnnotation)
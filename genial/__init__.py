@@ -1,10 +1,13 @@
-import re
+import os
 
-from .GenomeAnnotation import InteractiveAnnotation
+from .GenomeAnnotation import InteractiveAnnotation, LazyAnnotation
+from .AnnotationSet import AnnotationSet
 from .utils import str2array
 
-input_formats = {'gff3', 'gtf', 'bed'}
-output_formats = {'bed', 'extb', 'bed6', 'intron-bed'}
+__version__ = '0.1.0a1'
+
+input_formats = {'gff3', 'gtf', 'bed', 'gnl'}
+output_formats = {'bed', 'extb', 'bed6', 'intron-bed', 'gnl'}
 
 
 
@@ -26,63 +29,159 @@ def bed12_to_GeneAnnot(bed12):
 
     bed12 = bed12.strip()
     bed_field = bed12.split('\t')
-    starts = str2array(bed_field[11]) + int(bed_field[1])
-    ends = str2array(bed_field[10]) + starts
-    name = bed_field[3]
-    chrom = bed_field[0]
-    strand = bed_field[5]
-    thickStart = bed_field[6]
-    thickEnd = bed_field[7]
-    itemRgb = bed_field[8]
-
-    return InteractiveAnnotation(starts, ends, strand,
-                                 chrom=chrom,
-                                 transcript_id=name,
-                                 thickStart=thickStart,
-                                 thickEnd=thickEnd,
-                                 starts_offset=0,
-                                 itemRgb=itemRgb,
-                                 orientation='genomic'    
-                                )
-
-
-def parse(file_handle, input_format):
+    # blocks are decoded on first access
+    return LazyAnnotation.from_bed12(bed_field)
+
+
+def _gff_to_annotations(gff):
+    for tranx in gff:
+        # ToDo: support fivePrime and threePrime UTR elements
+        if not gff[tranx].exon_starts:
+            gff[tranx].exon_starts = gff[tranx].CDS_starts
+            gff[tranx].exon_ends = gff[tranx].CDS_ends
+
+        annotation = LazyAnnotation(
+            starts=gff[tranx].exon_starts,
+            ends=gff[tranx].exon_ends,
+            strand=gff[tranx].strand,
+            orientation=gff.orientation,
+            cds_starts=gff[tranx].CDS_starts,
+            cds_ends=gff[tranx].CDS_ends,
+            chrom=gff[tranx].chrom,
+            transcript_id=gff[tranx].transcript_id,
+            gene_id=gff.gene_of(tranx))
+
+        yield annotation
+
+
+def _file_path(file_handle):
+    """path of the regular file behind file_handle (None for pipes, stdin, StringIO, ...)"""
+    path = getattr(file_handle, 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        return path
+    return None
+
+
+def parse(file_handle, input_format, streaming=False, window=1000, cache=False, cache_dir=None,
+          feature_counts=None, regions=None):
     """
 
     Parameters
     ----------
     file_handle
     input_format
+    streaming: bool (default: False)
+        gff3/gtf only. Yield the transcripts of each gene as soon as the gene is complete,
+        instead of reading the whole file first. Use it for files grouped by gene
+        (eg: Ensembl, GENCODE). See genial.gff.stream_to_dict
+    window: int (default: 1000)
+        streaming only. number of lines from other genes before a gene is considered complete
+    cache: bool (default: False)
+        load the annotations from the cache (see genial.cache) instead of parsing the file
+        again. On a cache miss, the parsed annotations are cached (unless streaming).
+        Only used when file_handle is a regular file.
+    cache_dir: default: genial.cache.default_cache_dir()
+    feature_counts: collections.Counter (optional)
+        gff3/gtf only. updated with the number of lines of each feature type parsed or
+        skipped (see genial.gff.line_parser). Not updated on cache hits
+    regions: list of regions (optional)
+        bed/gtf only. Yield only the annotations overlapping these regions, as str
+        ('chr1:1-5000000') or (chrom, start, end) tuples with 0-based starts. Only the
+        parts of the file holding them are read, using a region index (see genial.tabix),
+        built on the first use. file_handle must be a bgzipped or uncompressed file on disk.
 
     Returns
     -------
 
     """
+    if regions is not None:
+        path = _file_path(file_handle)
+        if path is None:
+            raise ValueError('regions require an annotation file on disk (not a pipe or stdin)')
+        from .tabix import load_index
+        yield from load_index(path, input_format).fetch(regions, feature_counts)
+        return
+
+    # gnl files are already memory mapped: never cached
+    path = _file_path(file_handle) if cache and input_format != 'gnl' else None
+    if path is None:
+        yield from _parse(file_handle, input_format, streaming, window, feature_counts)
+        return
+
+    from .cache import load, store
+    annotation_set = load(path, input_format, cache_dir)
+    if annotation_set is not None:
+        yield from annotation_set
+
+    elif streaming:
+        yield from _parse(file_handle, input_format, streaming, window, feature_counts)
+
+    else:
+        annotations = list(_parse(file_handle, input_format, streaming, window, feature_counts))
+        store(AnnotationSet.from_annotations(annotations), path, input_format, cache_dir)
+        yield from annotations
+
+
+def _parse(file_handle, input_format, streaming=False, window=1000, feature_counts=None):
     # --------------- gff3 / gtf -----------------------------
     if input_format in ['gff3', 'gtf']:
-        from .gff import parse_to_dict
-        gff = parse_to_dict(file_handle, input_format)
-
-        for tranx in gff:
-            # ToDo: support fivePrime and threePrime UTR elements
-            if re.match(r'\s*$', gff[tranx].exon_starts):
-                gff[tranx].exon_starts = gff[tranx].CDS_starts
-                gff[tranx].exon_ends = gff[tranx].CDS_ends
-
-            annotation = InteractiveAnnotation(
-                starts=gff[tranx].exon_starts,
-                ends=gff[tranx].exon_ends,
-                strand=gff[tranx].strand,
-                orientation=gff.orientation,
-                cds_starts=gff[tranx].CDS_starts,
-                cds_ends=gff[tranx].CDS_ends,
-                chrom=gff[tranx].chrom,
-                transcript_id=gff[tranx].transcript_id,
-                gene_id=gff[tranx].gene_id)
-
-            yield annotation
+        # annotations only use exon/CDS lines and the ids: skip all other lines and attributes
+        from .gff import ANNOTATION_FEATURES, REQUIRED_ATTRIBUTES
+        options = dict(keep_attributes=REQUIRED_ATTRIBUTES, features=ANNOTATION_FEATURES,
+                       feature_counts=feature_counts)
+        if streaming:
+            from .gff import stream_to_dict
+            for gff in stream_to_dict(file_handle, input_format, window=window, **options):
+                yield from _gff_to_annotations(gff)
+
+        else:
+            from .gff import parse_to_dict
+            gff = parse_to_dict(file_handle, input_format, **options)
+            yield from _gff_to_annotations(gff)
 
     # -------------------- bed -----------------------------
     elif input_format == 'bed':
         for line in file_handle:
             yield bed12_to_GeneAnnot(line)
+
+    # -------------------- gnl -----------------------------
+    elif input_format == 'gnl':
+        from .gnl import read_gnl
+        yield from read_gnl(file_handle)
+
+
+def parse_to_set(file_handle, input_format, cache=False, cache_dir=None, feature_counts=None):
+    """
+    Parse an annotation file into a columnar AnnotationSet.
+
+    Parameters
+    ----------
+    file_handle
+    input_format
+    cache: bool (default: False)
+        use the cache of parsed annotations (see genial.parse)
+    cache_dir: default: genial.cache.default_cache_dir()
+    feature_counts: collections.Counter (optional). See genial.parse
+
+    Returns
+    -------
+    AnnotationSet
+    """
+    path = _file_path(file_handle) if cache and input_format != 'gnl' else None
+    if path is not None:
+        from .cache import load, store
+        annotation_set = load(path, input_format, cache_dir)
+        if annotation_set is None:
+            annotation_set = parse_to_set(file_handle, input_format, feature_counts=feature_counts)
+            store(annotation_set, path, input_format, cache_dir)
+        return annotation_set
+
+    if input_format == 'bed':
+        from .readers import read_bed12
+        return read_bed12(file_handle)
+
+    if input_format == 'gnl':
+        from .gnl import read_gnl
+        return read_gnl(file_handle)
+
+    return AnnotationSet.from_annotations(parse(file_handle, input_format, feature_counts=feature_counts))
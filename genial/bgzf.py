@@ -0,0 +1,329 @@
+"""
+Readers of compressed annotation files.
+
+BGZF (the blocked gzip written by bgzip/htslib) is a series of independent gzip members
+of up to 64KB, each one with its compressed size on the header. Blocks are found without
+inflating them and decompressed in batches by a pool of threads (zlib releases the GIL),
+so BGZF files are decompressed on several cores and in parallel with parsing.
+
+Other compressed files (gzip, bzip2, xz and zstd) are single streams: they are
+decompressed by a background thread (ThreadedReader), ahead of the parser.
+
+All readers are binary file objects (io.BufferedReader): wrap them on io.TextIOWrapper
+to read lines of text (see genial.utils.magic_open).
+"""
+
+import io
+import os
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import UnsupportedFile
+
+BUFFER_SIZE = 2 ** 22
+
+# gzip, bzip2, xz and zstd magic numbers
+_MAGIC = [('gzip', b'\x1f\x8b'),
+          ('bz2', b'BZh'),
+          ('xz', b'\xfd7zXZ\x00'),
+          ('zstd', b'\x28\xb5\x2f\xfd')]
+
+_BGZF_HEADER = struct.Struct('<4sI2sH')  # magic+flags, mtime, xfl+os, xlen
+
+
+def _bgzf_extra(head):
+    """extra field of a gzip member with the FEXTRA flag (None otherwise)"""
+    if len(head) < 12 or head[:4] != b'\x1f\x8b\x08\x04':
+        return None
+    xlen = _BGZF_HEADER.unpack_from(head)[3]
+    return head[12:12 + xlen]
+
+
+def _bgzf_block_size(extra):
+    """BSIZE + 1 (size of the whole block) from the BC subfield of the extra field"""
+    position = 0
+    while position + 4 <= len(extra):
+        si, slen = extra[position:position + 2], struct.unpack_from('<H', extra, position + 2)[0]
+        if si == b'BC' and slen == 2:
+            return struct.unpack_from('<H', extra, position + 4)[0] + 1
+        position += 4 + slen
+    return None
+
+
+def sniff(head):
+    """
+    Compression of a file from its first bytes.
+
+    Returns
+    -------
+    'bgzf', 'gzip', 'bz2', 'xz', 'zstd' or None (not compressed)
+    """
+    for name, magic in _MAGIC:
+        if head.startswith(magic):
+            if name == 'gzip':
+                extra = _bgzf_extra(head)
+                if extra is not None and _bgzf_block_size(extra) is not None:
+                    return 'bgzf'
+            return name
+    return None
+
+
+def _read_blocks(file_obj, read_size=BUFFER_SIZE):
+    """
+    Yield lists of (deflate data, crc32, uncompressed size, block size) of consecutive
+    BGZF blocks, read from file_obj in reads of read_size bytes.
+    """
+    data = b''
+    position = 0
+    while True:
+        new = file_obj.read(read_size)
+        data = data[position:] + new
+        position = 0
+
+        blocks = []
+        while len(data) - position >= 12:
+            xlen = _BGZF_HEADER.unpack_from(data, position)[3]
+            if len(data) - position < 12 + xlen:
+                break
+            extra = _bgzf_extra(data[position:position + 12 + xlen])
+            size = _bgzf_block_size(extra) if extra is not None else None
+            if size is None:
+                raise UnsupportedFile('invalid BGZF block')
+            if len(data) - position < size:
+                break
+            block = memoryview(data)[position:position + size]
+            crc, isize = struct.unpack_from('<II', block, size - 8)
+            blocks.append((block[12 + len(extra):size - 8], crc, isize, size))
+            position += size
+        if blocks:
+            yield blocks
+
+        if not new:
+            if len(data) > position:
+                raise UnsupportedFile('truncated BGZF file')
+            return
+
+
+def _inflate(blocks):
+    """uncompressed bytes of a list of BGZF blocks"""
+    out = []
+    for deflated, crc, isize, _ in blocks:
+        inflated = zlib.decompress(deflated, -15)
+        if len(inflated) != isize or zlib.crc32(inflated) != crc:
+            raise UnsupportedFile('corrupted BGZF block')
+        out.append(inflated)
+    return b''.join(out)
+
+
+def inflate_bgzf(file_obj, threads=None):
+    """
+    Yield the uncompressed content of a BGZF file (binary file object) in chunks,
+    decompressed by `threads` threads (default: number of cpus).
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        # keep a few batches of blocks ahead of the one being yielded
+        running = deque()
+        for blocks in _read_blocks(file_obj):
+            running.append(executor.submit(_inflate, blocks))
+            if len(running) > 2 * threads:
+                yield running.popleft().result()
+
+        while running:
+            yield running.popleft().result()
+
+
+def iter_blocks(file_obj):
+    """Yield (offset on the compressed file, uncompressed bytes) of each block of a BGZF file"""
+    offset = 0
+    for blocks in _read_blocks(file_obj):
+        for block in blocks:
+            yield offset, _inflate([block])
+            offset += block[3]
+
+
+def read_range(file_obj, compressed_offsets, offsets, start, end):
+    """
+    Bytes [start, end) of the uncompressed content of a BGZF file, reading only the
+    blocks holding them.
+
+    Parameters
+    ----------
+    file_obj: BGZF file opened on binary mode
+    compressed_offsets, offsets: sorted arrays with the offset of each block on the
+        compressed and on the uncompressed content, plus the size of both (see iter_blocks)
+    start, end: offsets on the uncompressed content
+    """
+    import numpy as np
+
+    first = np.searchsorted(offsets, start, side='right') - 1
+    last = np.searchsorted(offsets, end, side='left')
+    file_obj.seek(compressed_offsets[first])
+    data = file_obj.read(compressed_offsets[last] - compressed_offsets[first])
+    blocks = [block for batch in _read_blocks(io.BytesIO(data)) for block in batch]
+
+    skip = start - offsets[first]
+    return _inflate(blocks)[skip:skip + end - start]
+
+
+class ChunkReader(io.RawIOBase):
+    """read only raw file object over an iterable of bytes"""
+    def __init__(self, chunks, name=None, close=None):
+        super(ChunkReader, self).__init__()
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b'')
+        self._close = close
+        if name is not None:
+            self.name = name
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not len(self._chunk):
+            try:
+                self._chunk = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            close = getattr(self._chunks, 'close', None)
+            if close is not None:
+                close()
+            if self._close is not None:
+                self._close()
+        super(ChunkReader, self).close()
+
+
+class ThreadedReader:
+    """
+    Iterable with the content of a binary file object, read in chunks of chunk_size
+    bytes by a background thread (up to `depth` chunks ahead of the consumer).
+
+    Reading a decompressing file object (eg: gzip.open) this way overlaps
+    decompression with parsing.
+    """
+    def __init__(self, file_obj, chunk_size=BUFFER_SIZE, depth=4):
+        self._file_obj = file_obj
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            while True:
+                chunk = self._file_obj.read(self._chunk_size)
+                if not self._put(chunk) or not chunk:
+                    return
+        except BaseException as error:
+            self._put(error)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                return
+            yield item
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._file_obj.close()
+
+
+def open_bgzf(path, threads=None, buffer_size=BUFFER_SIZE):
+    """binary file object with the uncompressed content of a BGZF file"""
+    file_obj = open(path, 'rb')
+    raw = ChunkReader(inflate_bgzf(file_obj, threads), name=path, close=file_obj.close)
+    return io.BufferedReader(raw, buffer_size=buffer_size)
+
+
+class _PipeReader(io.RawIOBase):
+    """stdout of a decompressing process (eg: zstd -dc) as a raw file object"""
+    def __init__(self, args):
+        import subprocess
+        super(_PipeReader, self).__init__()
+        self._process = subprocess.Popen(args, stdout=subprocess.PIPE)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = self._process.stdout.readinto(buffer)
+        if size == 0 and self._process.wait() != 0:
+            raise UnsupportedFile('%s failed' % ' '.join(self._process.args))
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._process.stdout.close()
+            if self._process.poll() is None:
+                self._process.terminate()
+            self._process.wait()
+        super(_PipeReader, self).close()
+
+
+def _open_zstd(path):
+    """zstd files: zstandard, if installed, or the zstd command"""
+    try:
+        import zstandard
+    except ImportError:
+        import shutil
+        if shutil.which('zstd') is None:
+            raise ImportError('zstandard (or the zstd command) is required to read zstd files')
+        return io.BufferedReader(_PipeReader(['zstd', '-dcq', path]), buffer_size=BUFFER_SIZE)
+
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def open_compressed(path, compression, background=True, buffer_size=BUFFER_SIZE):
+    """
+    binary file object with the uncompressed content of a gzip, bzip2, xz or zstd file.
+    If background, decompression runs on a background thread.
+    """
+    if compression == 'gzip':
+        import gzip
+        file_obj = gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        import bz2
+        file_obj = bz2.open(path, 'rb')
+    elif compression == 'xz':
+        import lzma
+        file_obj = lzma.open(path, 'rb')
+    elif compression == 'zstd':
+        file_obj = _open_zstd(path)
+    else:
+        raise UnsupportedFile('File %s is compressed with %s' % (path, compression))
+
+    if not background:
+        return io.BufferedReader(ChunkReader(iter(lambda: file_obj.read(buffer_size), b''),
+                                             name=path, close=file_obj.close),
+                                 buffer_size=buffer_size)
+
+    reader = ThreadedReader(file_obj, chunk_size=buffer_size)
+    return io.BufferedReader(ChunkReader(reader, name=path, close=reader.close),
+                             buffer_size=buffer_size)
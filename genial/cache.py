@@ -0,0 +1,189 @@
+"""
+Persistent cache of parsed annotations.
+
+An AnnotationSet parsed from a file is saved as an uncompressed .npz file, named after a
+fingerprint of the input: real path, size, modification time, input format, parse options
+and genial version. Changing any of them invalidates the cache entry, and stale entries
+of the same input are removed when the new one is written.
+
+The cache directory is $GENIAL_CACHE_DIR or, by default, $XDG_CACHE_HOME/genial (~/.cache/genial).
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet
+
+# bump when the layout of the cached files changes
+CACHE_FORMAT = 1
+
+_int_arrays = ['starts', 'ends', 'offsets',
+               'cds_starts', 'cds_ends', 'cds_offsets',
+               'thick_starts', 'thick_ends']
+_categoricals = ['chrom', 'strand', 'transcript_id', 'gene_id', 'item_rgb']
+
+stats = {'hits': 0, 'misses': 0, 'writes': 0, 'invalidated': 0}
+
+
+def reset_stats():
+    for key in stats:
+        stats[key] = 0
+
+
+def format_stats():
+    return 'genial cache: %(hits)d hits, %(misses)d misses, %(writes)d writes, ' \
+           '%(invalidated)d invalidated' % stats
+
+
+def default_cache_dir():
+    try:
+        return os.environ['GENIAL_CACHE_DIR']
+    except KeyError:
+        cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(cache_home, 'genial')
+
+
+def _digest(*fields):
+    return hashlib.sha1('\0'.join(str(f) for f in fields).encode()).hexdigest()[:16]
+
+
+def cache_file(path, input_format, cache_dir=None, **options):
+    """
+    Path of the cache entry of an input file.
+
+    Parameters
+    ----------
+    path: path to the annotation file
+    input_format
+    cache_dir: default: default_cache_dir()
+    options: parse options that change the parsed annotations
+
+    Returns
+    -------
+    path to a .npz file (which may not exist)
+    """
+    from genial import __version__
+
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+
+    # entries of the same input share the prefix (used to remove stale entries)
+    prefix = _digest(path, input_format)
+    key = _digest(stat.st_size, stat.st_mtime_ns, __version__, CACHE_FORMAT,
+                  sorted(options.items()))
+
+    name = '%s.%s.%s.npz' % (os.path.basename(path), prefix, key)
+    return os.path.join(cache_dir or default_cache_dir(), name)
+
+
+def save_set(annotation_set, file):
+    """Save an AnnotationSet as an uncompressed .npz file"""
+    arrays = {name: getattr(annotation_set, name) for name in _int_arrays}
+    for name in _categoricals:
+        column = getattr(annotation_set, name)
+        if column is not None:
+            arrays[name + '_codes'] = np.asarray(column.codes)
+            arrays[name + '_categories'] = np.asarray(column.categories, dtype=str)
+    np.savez(file, **arrays)
+
+
+def load_set(file):
+    """Load an AnnotationSet saved by save_set"""
+    with np.load(file, allow_pickle=False) as npz:
+        kwargs = {name: npz[name] for name in _int_arrays}
+        for name in _categoricals:
+            if name + '_codes' in npz:
+                kwargs[name] = pd.Categorical.from_codes(npz[name + '_codes'],
+                                                         categories=npz[name + '_categories'])
+            else:
+                kwargs[name] = None
+
+    return AnnotationSet(kwargs.pop('starts'), kwargs.pop('ends'), kwargs.pop('offsets'), **kwargs)
+
+
+def lookup(path, input_format, cache_dir=None, **options):
+    """cache entry of path, or None if it is not cached (stats are not updated)"""
+    try:
+        entry = cache_file(path, input_format, cache_dir, **options)
+    except OSError:
+        return None
+    return entry if os.path.exists(entry) else None
+
+
+def load(path, input_format, cache_dir=None, **options):
+    """
+    Load the cached AnnotationSet of path.
+
+    Returns
+    -------
+    AnnotationSet, or None if path is not cached (or the cache entry can't be read)
+    """
+    entry = lookup(path, input_format, cache_dir, **options)
+    if entry is not None:
+        try:
+            annotation_set = load_set(entry)
+        except (OSError, ValueError, KeyError):
+            # truncated or corrupted entry: parse again
+            annotation_set = None
+        if annotation_set is not None:
+            stats['hits'] += 1
+            return annotation_set
+
+    stats['misses'] += 1
+    return None
+
+
+def store(annotation_set, path, input_format, cache_dir=None, **options):
+    """
+    Save the AnnotationSet parsed from path, and remove stale entries of path.
+
+    Returns
+    -------
+    path of the cache entry, or None if the cache directory is not writable
+    """
+    entry = cache_file(path, input_format, cache_dir, **options)
+    directory, name = os.path.split(entry)
+    prefix = name.rsplit('.', 2)[0]
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first: concurrent readers never see partial entries
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                save_set(annotation_set, f)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError:
+        return None
+    stats['writes'] += 1
+
+    for other in os.listdir(directory):
+        if other != name and other.startswith(prefix + '.') and other.endswith('.npz'):
+            try:
+                os.remove(os.path.join(directory, other))
+                stats['invalidated'] += 1
+            except OSError:
+                pass
+
+    return entry
+
+
+def clear(cache_dir=None):
+    """remove all cache entries. Returns the number of removed entries"""
+    directory = cache_dir or default_cache_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    removed = 0
+    for name in os.listdir(directory):
+        if name.endswith('.npz'):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
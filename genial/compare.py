@@ -0,0 +1,438 @@
+"""
+Comparison of a collection of (query) transcripts against a reference annotation.
+
+Every query transcript gets the class code of its best match on the reference, as
+gffcompare (best first):
+
+    =  same intron chain (single exon: exonic overlap >= single_exon_overlap of the longer)
+    c  contained: the intron chain of the query is a contiguous part of the reference chain
+       and the query ends inside the reference exons (single exon: inside a reference exon)
+    k  containment of the reference (c, with query and reference swapped)
+    j  at least one intron in common
+    o  exonic overlap on the same strand
+    i  inside an intron of the reference, same strand
+    x  exonic overlap on the opposite strand
+    u  none of the above (intergenic)
+
+Candidate pairs come from sorted interval sweeps (genial.index.IntervalIndex) over the
+reference transcripts and exons. Introns and exons are matched with exact integer keys
+and intron chains with 64-bit hashes, so no python loop runs per transcript.
+
+    from genial.compare import Comparison
+
+    comparison = Comparison(reference)
+    classes = comparison.classify(query, threads=4)   # pandas.DataFrame, one row per query
+    comparison.accuracy(query, classes)               # sensitivity and precision of each level
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet, segment_sum
+from .index import _SHIFT, IntervalIndex, _expand, _searchsorted
+
+CLASS_CODES = ('=', 'c', 'k', 'j', 'o', 'i', 'x', 'u')
+_RANK = {code: rank for rank, code in enumerate(CLASS_CODES)}
+
+_STRANDS = ['+', '-']
+
+
+def _as_set(annotations):
+    if isinstance(annotations, AnnotationSet):
+        return annotations
+    return AnnotationSet.from_annotations(annotations)
+
+
+def _groups(annotation_set, chroms):
+    """(chrom, strand) group of each row, with chrom codes on chroms (-1 if unknown)"""
+    chrom_codes = pd.Categorical(annotation_set.chrom.categories, categories=chroms).codes.astype(np.int64)
+    chrom_codes = np.append(chrom_codes, -1)[annotation_set.chrom.codes]
+    strand_codes = pd.Categorical(annotation_set.strand, categories=_STRANDS).codes.astype(np.int64)
+    groups = chrom_codes * len(_STRANDS) + strand_codes
+    groups[(chrom_codes < 0) | (strand_codes < 0)] = -1
+    return groups
+
+
+def _distinct(values):
+    """sorted distinct values (np.unique hashes integers, much slower on large arrays)"""
+    values = np.sort(values)
+    return values[np.append(True, values[1:] != values[:-1])] if len(values) else values
+
+
+def _introns(annotation_set):
+    """row, start and end of every intron, on the order of annotation_set.introns"""
+    not_first = np.ones(len(annotation_set.starts), dtype=bool)
+    not_first[annotation_set.offsets[:-1][annotation_set.blockCount() > 0]] = False
+    idx = np.flatnonzero(not_first)
+    return annotation_set.row_ids()[idx], annotation_set.ends[idx - 1], annotation_set.starts[idx]
+
+
+class _Keys:
+    def __init__(self, groups, starts, ends):
+        """
+        Exact lookup of (group, start, end) keys: (group, start) is replaced by its rank
+        among the distinct (group, start) values, so every key is a single int64.
+        """
+        firsts = (groups << _SHIFT) | starts
+        self._firsts = _distinct(firsts[groups >= 0])
+        self._span = int(ends.max()) + 1 if len(ends) else 1
+        keys = self.keys_of(groups, starts, ends)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def keys_of(self, groups, starts, ends):
+        """int64 key of each (group, start, end) (-1 if it can't be on the index)"""
+        firsts = (groups << _SHIFT) | starts
+        rank = np.searchsorted(self._firsts, firsts)
+        found = np.append(self._firsts, -1)[rank] == firsts
+        found &= (groups >= 0) & (ends < self._span)
+        return np.where(found, rank * self._span + ends, -1)
+
+    def lookup(self, groups, starts, ends):
+        """[lo, hi) range of each key on self.order (lo == hi for missing keys)"""
+        keys = self.keys_of(groups, starts, ends)
+        lo = _searchsorted(self.keys, keys, 'left')
+        hi = np.where(keys >= 0, _searchsorted(self.keys, keys, 'right'), lo)
+        return lo, hi
+
+
+def _mix(values):
+    """splitmix64 of uint64 values"""
+    z = values + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def chain_hashes(annotation_set, chroms=None):
+    """
+    64-bit hash of the intron chain (chrom, strand and introns) of each row
+    (0 for single exon rows). chroms: list used to code the chromosomes
+    (default: the categories of annotation_set.chrom)
+    """
+    if chroms is None:
+        chroms = list(annotation_set.chrom.categories)
+    rows, starts, ends = _introns(annotation_set)
+    groups = _groups(annotation_set, chroms)[rows].astype(np.uint64)
+    offsets = annotation_set.intron_offsets
+    index = np.arange(len(rows), dtype=np.int64) - offsets[rows]
+
+    with np.errstate(over='ignore'):
+        hashes = _mix(_mix((groups << np.uint64(_SHIFT)) | starts.astype(np.uint64)) ^ ends.astype(np.uint64))
+        hashes = _mix(hashes + index.astype(np.uint64))
+        cumulative = np.zeros(len(hashes) + 1, dtype=np.uint64)
+        np.cumsum(hashes, out=cumulative[1:])
+        return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+
+def _level(reference, query):
+    """matched and total distinct keys of reference and query: ((group, start, end) arrays)"""
+    reference_keys, query_keys = _Keys(*reference), _Keys(*query)
+
+    def matched(own, other, elements):
+        lo, hi = other.lookup(*elements)
+        keys = own.keys_of(*elements)
+        return len(_distinct(keys[hi > lo])), len(_distinct(own.keys[own.keys >= 0]))
+
+    return matched(reference_keys, query_keys, reference) + matched(query_keys, reference_keys, query)
+
+
+def _accuracy_row(matched_reference, reference, matched_query, query):
+    # 0 for an empty reference (or query), as gffcompare
+    return {'sensitivity': np.float64(matched_reference / reference if reference else 0),
+            'precision': np.float64(matched_query / query if query else 0),
+            'matched_reference': matched_reference, 'reference': reference,
+            'matched_query': matched_query, 'query': query}
+
+
+# reference comparison of the worker processes of Comparison.classify
+_worker_comparison = None
+
+
+def _init_worker(comparison):
+    global _worker_comparison
+    _worker_comparison = comparison
+
+
+def _classify_chunk(query):
+    return _worker_comparison._classify(query)
+
+
+class Comparison:
+    def __init__(self, reference, single_exon_overlap=0.8):
+        """
+
+        Index a reference annotation for comparisons.
+
+        Parameters
+        ----------
+        reference: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+            blocks of each transcript must be sorted by start (as parsed by genial).
+            Rows with a strand other than '+'/'-' are not matched.
+        single_exon_overlap: single exon transcripts with an exonic overlap of at least
+            this fraction of the longer one are '=' matches
+        """
+        reference = _as_set(reference)
+        self.reference = reference
+        self.single_exon_overlap = single_exon_overlap
+        self.chroms = list(reference.chrom.categories)
+
+        self._transcripts = IntervalIndex(reference)
+        self._exons = IntervalIndex(reference, level='exon')
+        self._groups = _groups(reference, self.chroms)
+        self._lengths = segment_sum(reference.exons, reference.offsets)
+
+        rows, starts, ends = _introns(reference)
+        self._intron_rows = rows
+        self._introns = _Keys(self._groups[rows], starts, ends)
+
+        # exons of the rows are shifted apart by span: one searchsorted for all rows
+        if len(reference.starts):
+            self._low = reference.starts.min()
+            self._span = reference.ends.max() - self._low + 1
+        else:
+            self._low, self._span = 0, 1
+        self._start_keys = reference.starts - self._low + reference.row_ids() * self._span
+
+    def __len__(self):
+        return len(self.reference)
+
+    def _pairs(self, query):
+        """query row, reference row and exonic overlap of every pair overlapping on the genome"""
+        has_blocks = np.flatnonzero(query.blockCount() > 0)
+        chroms = pd.Categorical.from_codes(query.chrom.codes[has_blocks], categories=query.chrom.categories)
+        query_ids, refs = self._transcripts.overlap_batch(chroms, query.start[has_blocks], query.end[has_blocks])
+        keys = _distinct(has_blocks[query_ids] * len(self) + refs)
+
+        # exonic overlap of the pairs
+        exon_rows = query.row_ids()
+        chroms = pd.Categorical.from_codes(query.chrom.codes[exon_rows], categories=query.chrom.categories)
+        query_exons, ref_exons = self._exons.overlap_batch(chroms, query.starts, query.ends)
+        bases = (np.minimum(query.ends[query_exons], self.reference.ends[ref_exons]) -
+                 np.maximum(query.starts[query_exons], self.reference.starts[ref_exons]))
+        exon_keys = exon_rows[query_exons] * len(self) + self._exons.row_ids(ref_exons)
+        overlap = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(overlap, np.searchsorted(keys, exon_keys), bases)
+
+        return keys // max(len(self), 1), keys % max(len(self), 1), overlap
+
+    def _shared_introns(self, query, keys):
+        """
+        introns of each pair (sorted keys) found on both transcripts, and the first/last
+        index (within the row) of these introns on the query and on the reference
+        """
+        rows, starts, ends = _introns(query)
+        lo, hi = self._introns.lookup(_groups(query, self.chroms)[rows], starts, ends)
+        positions, query_introns = _expand(lo, hi)
+        ref_introns = self._introns.order[positions]
+
+        pair_keys = rows[query_introns] * len(self) + self._intron_rows[ref_introns]
+        query_index = query_introns - query.intron_offsets[rows[query_introns]]
+        ref_index = ref_introns - self.reference.intron_offsets[self._intron_rows[ref_introns]]
+
+        pairs = np.searchsorted(keys, pair_keys)
+        shared = np.bincount(pairs, minlength=len(keys))
+        first_query = np.full(len(keys), np.iinfo(np.int64).max, dtype=np.int64)
+        last_query = np.full(len(keys), -1, dtype=np.int64)
+        first_ref, last_ref = first_query.copy(), last_query.copy()
+        np.minimum.at(first_query, pairs, query_index)
+        np.maximum.at(last_query, pairs, query_index)
+        np.minimum.at(first_ref, pairs, ref_index)
+        np.maximum.at(last_ref, pairs, ref_index)
+        return shared, first_query, last_query, first_ref, last_ref
+
+    def _inside_intron(self, query, query_rows, ref_rows):
+        """True for pairs where the query is inside a single intron of the reference"""
+        reference = self.reference
+        start, end = query.start[query_rows], query.end[query_rows]
+        first = reference.offsets[ref_rows]
+        last = reference.offsets[ref_rows + 1] - 1
+
+        exon = np.clip(_searchsorted(self._start_keys, start - self._low + ref_rows * self._span, 'right') - 1,
+                       first, last)
+        following = np.minimum(exon + 1, last)
+        return ((start >= reference.starts[first]) & (exon < last) &
+                (reference.ends[exon] <= start) & (reference.starts[following] >= end))
+
+    def _classify(self, query):
+        """class code, reference row and exonic overlap of the best match of each query row"""
+        reference = self.reference
+        query_rows, ref_rows, overlap = self._pairs(query)
+        keys = query_rows * len(self) + ref_rows
+        shared, first_query, last_query, first_ref, last_ref = self._shared_introns(query, keys)
+
+        query_strands = pd.Categorical(query.strand, categories=_STRANDS).codes.astype(np.int64)[query_rows]
+        ref_strands = pd.Categorical(reference.strand, categories=_STRANDS).codes.astype(np.int64)[ref_rows]
+        same_strand = (query_strands == ref_strands) | (query_strands < 0)
+
+        query_introns = np.diff(query.intron_offsets)[query_rows]
+        ref_introns = np.diff(reference.intron_offsets)[ref_rows]
+        query_lengths = segment_sum(query.exons, query.offsets)[query_rows]
+        ref_lengths = self._lengths[ref_rows]
+
+        # query chain inside the reference chain, and the reverse. The exons are only
+        # read for the pairs where all introns of the contained transcript are shared.
+        def contained(inner, inner_rows, inner_introns, outer, outer_rows, outer_introns, first, last):
+            chained = (same_strand & (shared == inner_introns) & (inner_introns > 0) &
+                       (inner_introns < outer_introns) & (last - first + 1 == inner_introns))
+            pairs = np.flatnonzero(chained)
+            offsets = outer.offsets[outer_rows[pairs]]
+            chained[pairs] = ((inner.start[inner_rows[pairs]] >= outer.starts[offsets + first[pairs]]) &
+                              (inner.end[inner_rows[pairs]] <= outer.ends[offsets + last[pairs] + 1]))
+            return chained
+
+        chain_c = contained(query, query_rows, query_introns, reference, ref_rows, ref_introns, first_ref, last_ref)
+        chain_k = contained(reference, ref_rows, ref_introns, query, query_rows, query_introns,
+                            first_query, last_query)
+
+        single_query, single_ref = query_introns == 0, ref_introns == 0
+        equal = np.where(single_query & single_ref,
+                         overlap >= self.single_exon_overlap * np.maximum(query_lengths, ref_lengths),
+                         (shared == query_introns) & (shared == ref_introns) & ~single_query)
+
+        inside = same_strand & (overlap == 0)
+        pairs = np.flatnonzero(inside)
+        inside[pairs] = self._inside_intron(query, query_rows[pairs], ref_rows[pairs])
+
+        codes = np.full(len(keys), _RANK['u'], dtype=np.int64)
+        conditions = [
+            ('=', same_strand & equal),
+            ('c', same_strand & (chain_c | (single_query & (overlap == query_lengths)))),
+            ('k', same_strand & (chain_k | (single_ref & (overlap == ref_lengths)))),
+            ('j', same_strand & (shared > 0)),
+            ('o', same_strand & (overlap > 0)),
+            ('i', inside),
+            ('x', ~same_strand & (overlap > 0)),
+        ]
+        for code, condition in reversed(conditions):
+            codes[condition] = _RANK[code]
+
+        # best pair of each query: by class, then by exonic overlap
+        order = np.lexsort((ref_rows, -overlap, codes, query_rows))
+        first = order[np.flatnonzero(np.diff(query_rows[order], prepend=-1) != 0)]
+        best_codes = np.full(len(query), _RANK['u'], dtype=np.int64)
+        best_refs = np.full(len(query), -1, dtype=np.int64)
+        best_overlap = np.zeros(len(query), dtype=np.int64)
+        matched = codes[first] != _RANK['u']
+        best_codes[query_rows[first]] = codes[first]
+        best_refs[query_rows[first[matched]]] = ref_rows[first[matched]]
+        best_overlap[query_rows[first[matched]]] = overlap[first[matched]]
+        return best_codes, best_refs, best_overlap
+
+    def classify(self, query, threads=1, chunk_size=100000):
+        """
+        Class code and best reference match of every query transcript.
+
+        Parameters
+        ----------
+        query: AnnotationSet or iterable of InteractiveAnnotation
+        threads: number of processes (the reference index is sent once to each process)
+        chunk_size: number of query transcripts classified at once
+
+        Returns
+        -------
+        pandas.DataFrame with one row per query row: query_id, query_gene_id, class_code,
+        ref_id, ref_gene_id (missing for 'u'), ref_row (-1 for 'u'), exon_count,
+        length (exonic bases) and overlap (exonic bases shared with the reference)
+        """
+        query = _as_set(query)
+        chunks = [query[start:start + chunk_size] for start in range(0, len(query), chunk_size)]
+        if threads > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=threads, initializer=_init_worker,
+                                     initargs=(self,)) as executor:
+                results = list(executor.map(_classify_chunk, chunks))
+        else:
+            results = [self._classify(chunk) for chunk in chunks]
+
+        if results:
+            codes, refs, overlap = (np.concatenate(arrays) for arrays in zip(*results))
+        else:
+            codes = refs = overlap = np.zeros(0, dtype=np.int64)
+
+        def ref_column(column):
+            # -1 (missing) for queries without a reference (the reference may be empty)
+            codes = np.full(len(refs), -1, dtype=np.int64)
+            codes[refs >= 0] = column.codes[refs[refs >= 0]]
+            return pd.Categorical.from_codes(codes, categories=column.categories)
+
+        return pd.DataFrame({
+            'query_id': query.transcript_id,
+            'query_gene_id': query.gene_id,
+            'class_code': pd.Categorical.from_codes(codes, categories=list(CLASS_CODES)),
+            'ref_id': ref_column(self.reference.transcript_id),
+            'ref_gene_id': ref_column(self.reference.gene_id),
+            'ref_row': refs,
+            'exon_count': query.blockCount(),
+            'length': segment_sum(query.exons, query.offsets),
+            'overlap': overlap,
+        })
+
+    def accuracy(self, query, classes=None, **classify_kwargs):
+        """
+        Sensitivity and precision (as gffcompare) of the query on each level:
+
+            exon, intron: distinct (chrom, strand, start, end) found on both sets
+            intron_chain: distinct intron chains (multi exon transcripts) found on both sets
+            transcript: reference transcripts with a '=' query (for multi exon transcripts, any
+                with the chain of a '=' query), and '=' query transcripts
+
+        Parameters
+        ----------
+        query: AnnotationSet or iterable of InteractiveAnnotation
+        classes: output of classify for query (computed if None, with classify_kwargs)
+
+        Returns
+        -------
+        pandas.DataFrame indexed by level, with sensitivity, precision and the counts of
+        matched and distinct keys of each set
+        """
+        query = _as_set(query)
+        reference = self.reference
+        if classes is None:
+            classes = self.classify(query, **classify_kwargs)
+
+        # chromosomes of the query missing from the reference are still counted
+        known = set(self.chroms)
+        chroms = self.chroms + [chrom for chrom in query.chrom.categories if chrom not in known]
+        query_groups = _groups(query, chroms)
+
+        levels = {}
+        levels['exon'] = _level((self._groups[reference.row_ids()], reference.starts, reference.ends),
+                                (query_groups[query.row_ids()], query.starts, query.ends))
+
+        rows, starts, ends = _introns(query)
+        levels['intron'] = _level((self._groups[self._intron_rows],) + _introns(reference)[1:],
+                                  (query_groups[rows], starts, ends))
+
+        ref_multi, query_multi = np.diff(reference.intron_offsets) > 0, np.diff(query.intron_offsets) > 0
+        ref_hashes, query_hashes = chain_hashes(reference, chroms), chain_hashes(query, chroms)
+        ref_chains, query_chains = _distinct(ref_hashes[ref_multi]), _distinct(query_hashes[query_multi])
+        common = len(np.intersect1d(ref_chains, query_chains, assume_unique=True))
+        levels['intron_chain'] = (common, len(ref_chains), common, len(query_chains))
+
+        # multi exon '=' matches have the same chain: every reference transcript with the
+        # chain of a '=' query is matched (not only the one reported on classes)
+        equal = np.asarray(classes['class_code'] == '=')
+        ref_rows = classes['ref_row'].values[equal & ~query_multi]
+        matched = np.isin(ref_hashes, query_hashes[equal & query_multi]) & ref_multi
+        matched[ref_rows[~ref_multi[ref_rows]]] = True
+        levels['transcript'] = (int(matched.sum()), len(reference), int(equal.sum()), len(query))
+
+        return pd.DataFrame.from_dict({level: _accuracy_row(*counts) for level, counts in levels.items()},
+                                      orient='index')
+
+
+def compare(reference, query, threads=1, single_exon_overlap=0.8):
+    """
+    Compare query transcripts against a reference.
+
+    Returns
+    -------
+    classes, accuracy: pandas.DataFrame, as Comparison.classify and Comparison.accuracy
+    """
+    comparison = Comparison(reference, single_exon_overlap)
+    query = _as_set(query)
+    classes = comparison.classify(query, threads=threads)
+    return classes, comparison.accuracy(query, classes)
@@ -0,0 +1,217 @@
+"""
+Mapping of positions between genomic, transcript, CDS and protein coordinates.
+
+All positions are 0-based. Transcript and CDS positions are counted from the 5' end of
+the transcript (on its strand: the last exonic base of a '-' strand transcript is its
+position 0); rows with a strand other than '-' are mapped as '+'.
+
+Queries are pairs of arrays (the row of the AnnotationSet each position refers to, and
+the positions), answered at once: the exons of all rows are shifted apart on a single
+sorted key, so each query is a binary search (no python loop per transcript).
+The rows of a batch of genomic positions can be found with genial.index.IntervalIndex:
+
+    from genial.coordinates import TranscriptCoordinates
+    from genial.index import IntervalIndex
+
+    query_ids, rows = IntervalIndex(annotation_set).point_batch(chroms, positions)
+    coordinates = TranscriptCoordinates(annotation_set)
+    cds_positions, distances = coordinates.genome_to_cds(rows, positions[query_ids])
+    codons, frames = coordinates.cds_to_protein(rows, cds_positions)
+"""
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet, segment_sum
+from .index import _searchsorted
+
+
+class TranscriptCoordinates:
+    def __init__(self, annotations):
+        """
+
+        Index the exons of a collection of annotations for coordinate mapping.
+
+        Parameters
+        ----------
+        annotations: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+            blocks of each transcript must be sorted by start (as parsed by genial)
+        """
+        if not isinstance(annotations, AnnotationSet):
+            annotations = AnnotationSet.from_annotations(annotations)
+        self.annotations = annotations
+        annotation_set = annotations
+
+        rows = annotation_set.row_ids()
+        exons = annotation_set.exons
+        self._minus = np.asarray(annotation_set.strand == '-')
+
+        # exonic bases of the row before each exon (on genomic order)
+        cumulative = np.concatenate([[0], np.cumsum(exons)])
+        self._before = cumulative[:-1] - cumulative[annotation_set.offsets[:-1]][rows]
+        self.lengths = segment_sum(exons, annotation_set.offsets)
+
+        # rows are shifted apart by span: one searchsorted for all rows
+        if len(rows):
+            self._low = annotation_set.starts.min()
+            self._span = annotation_set.ends.max() - self._low + 1
+            self._length_span = self.lengths.max() + 1
+        else:
+            self._low, self._span, self._length_span = 0, 1, 1
+        self._start_keys = annotation_set.starts - self._low + rows * self._span
+        self._end_keys = self._before + exons + rows * self._length_span
+
+        # coding bases and transcript position of the first coding base (5') of each row
+        coding = annotation_set.is_coding & (annotation_set.blockCount() > 0)
+        thick_starts = np.where(coding, annotation_set.thick_starts, 0)
+        thick_ends = np.where(coding, annotation_set.thick_ends, 0)
+        self.cds_lengths = segment_sum(
+            np.clip(np.minimum(annotation_set.ends, thick_ends[rows]) -
+                    np.maximum(annotation_set.starts, thick_starts[rows]), 0, None),
+            annotation_set.offsets)
+        all_rows = np.arange(len(annotation_set))
+        first_coding = np.where(self._minus, thick_ends - 1, thick_starts)
+        self._cds_starts = np.where(coding, self.genome_to_transcript(all_rows, first_coding)[0], -1)
+
+    def __len__(self):
+        return len(self.annotations)
+
+    def transcript_rows(self, transcript_ids):
+        """row of each transcript_id (the first one, for repeated ids; -1 for unknown ids)"""
+        column = self.annotations.transcript_id
+        codes = pd.Categorical(np.atleast_1d(np.asarray(transcript_ids, dtype=object)),
+                               categories=column.categories).codes.astype(np.int64)
+        row_of_code = np.full(len(column.categories) + 1, -1, dtype=np.int64)
+        # reversed, so the first row of each code is written last; missing ids fall on the extra -1
+        row_of_code[column.codes[::-1]] = np.arange(len(column) - 1, -1, -1)
+        row_of_code[-1] = -1
+        return row_of_code[codes]
+
+    def _queries(self, rows, values):
+        """rows and values as int64 arrays of the same size, rows with exons and row (0 if invalid) to read"""
+        rows, values = np.broadcast_arrays(np.atleast_1d(np.asarray(rows, dtype=np.int64)),
+                                           np.atleast_1d(np.asarray(values)))
+        valid = (rows >= 0) & (rows < len(self))
+        safe_rows = np.where(valid, rows, 0)
+        if len(self):
+            valid &= self.lengths[safe_rows] > 0
+        return safe_rows, values, valid
+
+    def genome_to_transcript(self, rows, positions):
+        """
+        Transcript position of genomic positions.
+
+        Intronic positions (and positions outside the transcript) are mapped to the nearest
+        exonic base, plus their distance to it, on the strand of the transcript (as HGVS
+        c.100+5 and c.101-3): positive after the base, negative before it. Positions at the
+        middle of an intron are mapped to the upstream exon.
+
+        Parameters
+        ----------
+        rows: array of int (or a single int), the row of the AnnotationSet of each position
+        positions: array of int, 0-based genomic positions
+
+        Returns
+        -------
+        positions, distances: int64 arrays (distances are 0 for exonic positions;
+        positions are -1 for invalid rows and rows without exons)
+        """
+        rows, positions, valid = self._queries(rows, positions)
+        positions = positions.astype(np.int64)
+        if not len(self._start_keys):
+            return np.full(len(rows), -1, dtype=np.int64), np.zeros(len(rows), dtype=np.int64)
+
+        annotation_set = self.annotations
+        # (rows without exons read any exon: they are invalid)
+        first = np.minimum(annotation_set.offsets[rows], len(self._start_keys) - 1)
+        last = np.clip(annotation_set.offsets[rows + 1] - 1, first, None)
+        start, end = annotation_set.starts[first], annotation_set.ends[last]
+        clipped = np.clip(positions, start, end - 1)
+
+        # last exon of the row starting at or before the position, and the next one
+        exon = _searchsorted(self._start_keys, clipped - self._low + rows * self._span, 'right') - 1
+        exon = np.clip(exon, first, last)
+        following = np.minimum(exon + 1, last)
+
+        exon_start, exon_end = annotation_set.starts[exon], annotation_set.ends[exon]
+        minus = self._minus[rows]
+        after_exon = clipped - exon_end + 1
+        before_following = annotation_set.starts[following] - clipped
+        upstream = (after_exon < before_following) | ((after_exon == before_following) & ~minus)
+
+        # position on the genomic order of the exons and distance, on the genomic strand
+        exonic = clipped < exon_end
+        forward = np.where(exonic, self._before[exon] + clipped - exon_start,
+                           np.where(upstream, self._before[exon] + exon_end - exon_start - 1,
+                                    self._before[following]))
+        distances = np.where(exonic, 0, np.where(upstream, after_exon, -before_following))
+        distances = np.where(positions < start, positions - start,
+                             np.where(positions >= end, positions - end + 1, distances))
+
+        lengths = self.lengths[rows]
+        transcript_positions = np.where(minus, lengths - 1 - forward, forward)
+        distances = np.where(minus, -distances, distances)
+        return np.where(valid, transcript_positions, -1), np.where(valid, distances, 0)
+
+    def transcript_to_genome(self, rows, positions):
+        """
+        Genomic position of transcript positions.
+
+        Parameters
+        ----------
+        rows: array of int (or a single int), the row of the AnnotationSet of each position
+        positions: array of int, 0-based positions on the transcript (from its 5' end)
+
+        Returns
+        -------
+        int64 array of 0-based genomic positions (-1 for positions outside the transcript)
+        """
+        rows, positions, valid = self._queries(rows, positions)
+        positions = positions.astype(np.int64)
+        lengths = self.lengths[rows] if len(self) else np.zeros(len(rows), dtype=np.int64)
+        valid &= (positions >= 0) & (positions < lengths)
+        if not valid.any():
+            return np.full(len(rows), -1, dtype=np.int64)
+
+        forward = np.where(self._minus[rows], lengths - 1 - positions, positions)
+        forward = np.where(valid, forward, 0)
+
+        # first exon of the row ending after the position (zero-sized exons are skipped)
+        exon = _searchsorted(self._end_keys, forward + rows * self._length_span, 'right')
+        exon = np.minimum(exon, len(self._end_keys) - 1)
+        genomic = self.annotations.starts[exon] + forward - self._before[exon]
+        return np.where(valid, genomic, -1)
+
+    def genome_to_cds(self, rows, positions):
+        """
+        CDS position of genomic positions: transcript position relative to the first coding
+        base (thickStart, or thickEnd on the '-' strand). 5' UTR positions are negative and
+        3' UTR positions are >= cds_lengths (as HGVS c.-10 and c.*10).
+
+        Returns
+        -------
+        positions: float64 array (nan for non coding and invalid rows)
+        distances: int64 array, as genome_to_transcript
+        """
+        rows, positions, _ = self._queries(rows, positions)
+        transcript_positions, distances = self.genome_to_transcript(rows, positions)
+        cds_starts = self._cds_starts[rows] if len(self) else np.full(len(rows), -1, dtype=np.int64)
+        valid = (transcript_positions >= 0) & (cds_starts >= 0)
+        return np.where(valid, transcript_positions - cds_starts, np.nan), distances
+
+    def cds_to_protein(self, rows, positions):
+        """
+        Codon (0-based amino acid index; HGVS p. positions are codons + 1) and position
+        within the codon (0, 1 or 2) of CDS positions.
+
+        Returns
+        -------
+        codons, frames: int64 arrays (-1 for positions outside the CDS, nan and non coding rows)
+        """
+        rows, positions, valid = self._queries(rows, positions)
+        positions = np.asarray(positions, dtype=np.float64)
+        cds_lengths = self.cds_lengths[rows] if len(self) else np.zeros(len(rows), dtype=np.int64)
+        with np.errstate(invalid='ignore'):
+            valid &= (positions >= 0) & (positions < cds_lengths)
+        positions = np.where(valid, positions, 0).astype(np.int64)
+        return np.where(valid, positions // 3, -1), np.where(valid, positions % 3, -1)
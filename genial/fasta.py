@@ -0,0 +1,325 @@
+"""
+Sequences of annotations from a FASTA file.
+
+The FASTA file is memory mapped and indexed with a samtools compatible .fai index
+(read from path + '.fai', or built and saved there). The file offsets of all blocks of a
+collection of annotations are computed at once with numpy, and each block is a single
+slice of the map (line breaks are only removed from blocks spanning several lines), so
+only the pages holding the blocks are read (on file order). '-' strand sequences are reverse complemented.
+
+The ##FASTA section at the end of a GFF3 file is read with FastaFile.from_gff3.
+
+    from genial.fasta import FastaFile
+
+    with FastaFile('genome.fa') as fasta:
+        mrna = fasta.transcripts(annotation_set)     # one str per row
+        cds = fasta.cds(annotation_set)
+        donors, acceptors = fasta.splice_sites(annotation_set)
+"""
+
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet, segment_sum
+from .bgzf import sniff
+from .exceptions import UnsupportedFile
+
+_NEWLINE, _CARRIAGE_RETURN = ord('\n'), ord('\r')
+
+# IUPAC complement of every byte (other bytes are kept)
+_COMPLEMENT = bytes.maketrans(b'ACGTUMRWSYKVHDBNacgtumrwsykvhdbn',
+                              b'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn')
+
+
+def index_file_of(path):
+    return path + '.fai'
+
+
+def _layout(region):
+    """length, linebases and linewidth of the sequence lines of a record (uint8 array)"""
+    # ignore blank lines at the end of the record
+    content = np.flatnonzero((region != _NEWLINE) & (region != _CARRIAGE_RETURN) & (region != ord(' ')))
+    if not len(content):
+        return 0, 1, 1
+    region = region[:content[-1] + 1]
+
+    newlines = np.flatnonzero(region == _NEWLINE)
+    if not len(newlines):
+        return len(region), len(region), len(region) + 1
+
+    linewidth = int(newlines[0]) + 1
+    linebases = linewidth - 1 - int(region[newlines[0] - 1] == _CARRIAGE_RETURN) if newlines[0] else 0
+    expected = np.arange(1, len(newlines) + 1) * linewidth - 1
+    if not np.array_equal(newlines, expected) or len(region) - linewidth * len(newlines) > linebases:
+        raise UnsupportedFile('FASTA lines of a sequence must have the same length (but the last)')
+    return len(region) - len(newlines) * (linewidth - linebases), linebases, linewidth
+
+
+def _scan(mm, start=0):
+    """fai records (name, length, offset, linebases, linewidth) of the sequences of a mmap, from start"""
+    records = []
+    if mm[start:start + 1] == b'>':
+        header = start
+    else:
+        header = mm.find(b'\n>', start)
+        header = header + 1 if header >= 0 else -1
+    while header >= 0:
+        header_end = mm.find(b'\n', header)
+        if header_end < 0:
+            header_end = len(mm)
+        name = mm[header + 1:header_end].split()
+        if not name:
+            raise UnsupportedFile('FASTA header without a name')
+
+        sequence_start = min(header_end + 1, len(mm))
+        next_header = mm.find(b'\n>', header_end)
+        sequence_end = next_header + 1 if next_header >= 0 else len(mm)
+        region = np.frombuffer(mm[sequence_start:sequence_end], dtype=np.uint8)
+        length, linebases, linewidth = _layout(region)
+        records.append((name[0].decode(), length, sequence_start, linebases, linewidth))
+        header = sequence_end if next_header >= 0 else -1
+    return records
+
+
+def read_fai(index_file):
+    """fai records (name, length, offset, linebases, linewidth) of a .fai file"""
+    records = []
+    with open(index_file) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) >= 5:
+                records.append((fields[0],) + tuple(int(x) for x in fields[1:5]))
+    return records
+
+
+def write_fai(records, index_file):
+    with open(index_file, 'w') as f:
+        f.writelines('%s\t%d\t%d\t%d\t%d\n' % record for record in records)
+
+
+class FastaFile:
+    def __init__(self, path, index_file=None, start=0):
+        """
+
+        Memory mapped FASTA file (uncompressed).
+
+        Parameters
+        ----------
+        path: path to the FASTA file
+        index_file: default: path + '.fai'. Built (and saved, if the directory is writable)
+            if it doesn't exist or is older than path
+        start: offset where the sequences start (eg: the ##FASTA section of a GFF3 file).
+            If given, the index is built on memory (index_file is not used)
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            compression = sniff(f.read(1024))
+        if compression is not None:
+            raise UnsupportedFile('%s is compressed with %s: decompress it to extract sequences'
+                                  % (path, compression))
+        if not os.path.getsize(path):
+            raise UnsupportedFile('%s is empty' % path)
+
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        index_file = index_file or index_file_of(path)
+        if start:
+            records = _scan(self._mmap, start)
+        elif os.path.exists(index_file) and os.path.getmtime(index_file) >= os.path.getmtime(path):
+            records = read_fai(index_file)
+        else:
+            records = _scan(self._mmap)
+            try:
+                write_fai(records, index_file)
+            except PermissionError:
+                pass
+
+        self.names = [r[0] for r in records]
+        self._code_of = {name: code for code, name in enumerate(self.names)}
+        self.lengths, self._offsets, self._linebases, self._linewidths = (
+            np.array([r[i] for r in records], dtype=np.int64).reshape(-1) for i in range(1, 5))
+
+    @classmethod
+    def from_gff3(cls, path):
+        """sequences of the ##FASTA section at the end of a GFF3 file (the index is not saved)"""
+        from .parallel import _end_of_features
+
+        start = _end_of_features(path, 'gff3')
+        if start >= os.path.getsize(path):
+            raise UnsupportedFile('%s has no ##FASTA section' % path)
+        return cls(path, start=start)
+
+    def __contains__(self, chrom):
+        return chrom in self._code_of
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        if self._mmap is not None:
+            # the numpy view must be released before the map is closed
+            self._buffer = None
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _codes(self, chroms):
+        """index code of each chrom (list of str or pandas.Categorical)"""
+        chroms = pd.Categorical(chroms)
+        lookup = np.array([self._code_of.get(c, -1) for c in chroms.categories] + [-1], dtype=np.int64)
+        codes = lookup[chroms.codes]
+        if (codes < 0).any():
+            raise KeyError('sequence %s is not on %s' % (np.asarray(chroms)[codes < 0][0], self.path))
+        return codes
+
+    def _file_offsets(self, codes, positions):
+        """offset on the file of each position (0-based) of the sequences codes"""
+        linebases = self._linebases[codes]
+        return self._offsets[codes] + positions // linebases * self._linewidths[codes] + positions % linebases
+
+    def _blocks(self, codes, starts, ends):
+        """bytes of every block [starts, ends) of the sequences codes"""
+        invalid = (starts < 0) | (ends < starts) | (ends > self.lengths[codes])
+        if invalid.any():
+            i = np.flatnonzero(invalid)[0]
+            raise ValueError('block %s:%d-%d is outside of the sequence'
+                             % (self.names[codes[i]], starts[i], ends[i]))
+
+        first = self._file_offsets(codes, starts)
+        last = np.where(ends > starts, self._file_offsets(codes, np.maximum(ends - 1, 0)) + 1, first)
+        # blocks spanning several lines have line breaks to remove
+        wrapped = (last - first) != (ends - starts)
+
+        # sliced on file order (chromosome by chromosome), so the pages of the map are read sequentially
+        mm = self._mmap
+        blocks = [b''] * len(first)
+        order = np.argsort(first, kind='stable')
+        for i, lo, hi in zip(order.tolist(), first[order].tolist(), last[order].tolist()):
+            blocks[i] = mm[lo:hi]
+        for i in np.flatnonzero(wrapped).tolist():
+            blocks[i] = blocks[i].replace(b'\n', b'').replace(b'\r', b'')
+        return blocks
+
+    def extract(self, chroms, starts, ends, offsets, minus):
+        """
+        Sequences of groups of blocks: the blocks of group i are [starts, ends)[offsets[i]:offsets[i+1]],
+        on the sequence chroms[i]. Groups with minus True are reverse complemented.
+
+        Returns
+        -------
+        list of str, one per group
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        codes = np.repeat(self._codes(chroms), np.diff(offsets))
+        blocks = self._blocks(codes, np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64))
+
+        sequences = []
+        bounds = offsets.tolist()
+        for lo, hi, reverse in zip(bounds[:-1], bounds[1:], np.asarray(minus, dtype=bool).tolist()):
+            sequence = b''.join(blocks[lo:hi])
+            if reverse:
+                sequence = sequence.translate(_COMPLEMENT)[::-1]
+            sequences.append(sequence.decode('ascii', errors='replace'))
+        return sequences
+
+    def fetch(self, chrom, start, end, strand='+'):
+        """sequence of chrom:start-end (0-based, half open), reverse complemented on the '-' strand"""
+        return self.extract([chrom], [start], [end], [0, 1], [strand == '-'])[0]
+
+    # ---------------- annotations ----------------
+
+    @staticmethod
+    def _as_set(annotations):
+        if isinstance(annotations, AnnotationSet):
+            return annotations
+        return AnnotationSet.from_annotations(annotations)
+
+    def _rows(self, annotation_set, starts, ends, offsets):
+        """sequences of blocks grouped by row, on the strand of each row"""
+        return self.extract(annotation_set.chrom, starts, ends, offsets, np.asarray(annotation_set.strand == '-'))
+
+    def _clipped(self, annotation_set, lo, hi):
+        """sequences of the parts of the exons of each row inside [lo[row], hi[row])"""
+        rows = annotation_set.row_ids()
+        starts = np.maximum(annotation_set.starts, lo[rows])
+        ends = np.minimum(annotation_set.ends, hi[rows])
+        keep = ends > starts
+        offsets = np.zeros(len(annotation_set) + 1, dtype=np.int64)
+        np.cumsum(segment_sum(keep, annotation_set.offsets), out=offsets[1:])
+        return self._rows(annotation_set, starts[keep], ends[keep], offsets)
+
+    def transcripts(self, annotations):
+        """spliced sequence (exons) of each annotation, on its strand"""
+        annotation_set = self._as_set(annotations)
+        return self._rows(annotation_set, annotation_set.starts, annotation_set.ends, annotation_set.offsets)
+
+    def cds(self, annotations):
+        """coding sequence (exons clipped to thickStart/thickEnd) of each annotation ('' if non coding)"""
+        annotation_set = self._as_set(annotations)
+        coding = annotation_set.is_coding
+        lo = np.where(coding, annotation_set.thick_starts, 0)
+        hi = np.where(coding, annotation_set.thick_ends, 0)
+        return self._clipped(annotation_set, lo, hi)
+
+    def utrs(self, annotations, end=5):
+        """
+        5' (end=5) or 3' (end=3) UTR sequence of each annotation, on its strand
+        ('' if non coding)
+        """
+        if end not in (3, 5):
+            raise ValueError('end must be 5 or 3, not %r' % (end,))
+        annotation_set = self._as_set(annotations)
+        coding = annotation_set.is_coding
+        minus = np.asarray(annotation_set.strand == '-')
+        before = (end == 5) != minus
+
+        lo = np.where(before, 0, annotation_set.thick_ends)
+        hi = np.where(before, annotation_set.thick_starts, np.iinfo(np.int64).max)
+        return self._clipped(annotation_set, np.where(coding, lo, 0), np.where(coding, hi, 0))
+
+    def _introns(self, annotation_set):
+        """chrom, start, end and minus of every intron, on the order of annotation_set.introns"""
+        not_first = np.ones(len(annotation_set.starts), dtype=bool)
+        not_first[annotation_set.offsets[:-1][annotation_set.blockCount() > 0]] = False
+        idx = np.flatnonzero(not_first)
+        rows = annotation_set.row_ids()[idx]
+        chroms = pd.Categorical.from_codes(annotation_set.chrom.codes[rows], categories=annotation_set.chrom.categories)
+        minus = np.asarray(annotation_set.strand == '-')[rows]
+        return chroms, annotation_set.ends[idx - 1], annotation_set.starts[idx], minus
+
+    def introns(self, annotations):
+        """
+        sequence of every intron, on the strand of its annotation
+        (flat list, on the order of AnnotationSet.introns: split it with intron_offsets)
+        """
+        chroms, starts, ends, minus = self._introns(self._as_set(annotations))
+        return self.extract(chroms, starts, ends, np.arange(len(starts) + 1), minus)
+
+    def splice_sites(self, annotations, size=2):
+        """
+        donor and acceptor sites of every intron: its first and last `size` bases,
+        on the strand of its annotation (eg: 'GT' and 'AG')
+
+        Returns
+        -------
+        donors, acceptors: flat lists, on the order of AnnotationSet.introns
+        """
+        chroms, starts, ends, minus = self._introns(self._as_set(annotations))
+        groups = np.arange(len(starts) + 1)
+        first = self.extract(chroms, starts, np.minimum(starts + size, ends), groups, minus)
+        last = self.extract(chroms, np.maximum(ends - size, starts), ends, groups, minus)
+        # on the '-' strand the intron starts at its genomic end
+        donors = [a if m else d for d, a, m in zip(first, last, minus.tolist())]
+        acceptors = [d if m else a for d, a, m in zip(first, last, minus.tolist())]
+        return donors, acceptors
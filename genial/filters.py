@@ -0,0 +1,197 @@
+"""
+Filters of annotations, evaluated on all rows of an AnnotationSet at once.
+
+Each predicate computes a boolean mask with one value per row, using only the flat
+arrays of the set (no per-annotation objects). Predicates are composed with & (and),
+| (or) and ~ (not):
+
+    from genial.filters import ExonCount, IntronSize, Coding
+
+    predicate = ExonCount(minimum=2) & IntronSize(minimum=30) & ~Coding()
+    selected = predicate.select(annotation_set)
+
+Predicates are plain objects (picklable), so they can be sent to other processes
+(eg: genial.parallel.process_chunks).
+"""
+
+import re
+
+import numpy as np
+
+from .AnnotationSet import AnnotationSet, iter_chunks, segment_sum
+
+
+def _within(values, minimum, maximum):
+    mask = np.ones(len(values), dtype=bool)
+    if minimum is not None:
+        mask &= values >= minimum
+    if maximum is not None:
+        mask &= values <= maximum
+    return mask
+
+
+def _labels_in(column, labels):
+    """rows of a categorical column with one of the labels"""
+    wanted = np.isin(np.asarray(column.categories, dtype=object), list(labels))
+    # -1 (missing) codes read the appended False
+    return np.append(wanted, False)[column.codes]
+
+
+class Predicate:
+    """Base class of filters: subclasses implement mask"""
+
+    def mask(self, annotation_set):
+        """boolean array, True for the rows of annotation_set that pass the filter"""
+        raise NotImplementedError
+
+    def select(self, annotations, chunk_size=10000):
+        """
+        Rows that pass the filter.
+
+        Parameters
+        ----------
+        annotations: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+        chunk_size: iterables only, number of annotations filtered at once
+
+        Returns
+        -------
+        AnnotationSet (for an AnnotationSet) or generator of AnnotationSet (one per chunk)
+        """
+        if isinstance(annotations, AnnotationSet):
+            return annotations[self.mask(annotations)]
+        return (chunk[self.mask(chunk)] for chunk in iter_chunks(annotations, chunk_size))
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __repr__(self):
+        args = ', '.join('%s=%r' % item for item in vars(self).items())
+        return '%s(%s)' % (type(self).__name__, args)
+
+
+class And(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def mask(self, annotation_set):
+        mask = np.ones(len(annotation_set), dtype=bool)
+        for predicate in self.predicates:
+            mask &= predicate.mask(annotation_set)
+        return mask
+
+    def __repr__(self):
+        return '(%s)' % ' & '.join(map(repr, self.predicates))
+
+
+class Or(Predicate):
+    def __init__(self, *predicates):
+        self.predicates = predicates
+
+    def mask(self, annotation_set):
+        mask = np.zeros(len(annotation_set), dtype=bool)
+        for predicate in self.predicates:
+            mask |= predicate.mask(annotation_set)
+        return mask
+
+    def __repr__(self):
+        return '(%s)' % ' | '.join(map(repr, self.predicates))
+
+
+class Not(Predicate):
+    def __init__(self, predicate):
+        self.predicate = predicate
+
+    def mask(self, annotation_set):
+        return ~self.predicate.mask(annotation_set)
+
+    def __repr__(self):
+        return '~%r' % (self.predicate,)
+
+
+class All(Predicate):
+    """every row passes (the neutral element of &)"""
+    def mask(self, annotation_set):
+        return np.ones(len(annotation_set), dtype=bool)
+
+
+class ExonCount(Predicate):
+    """rows with minimum <= number of exons <= maximum (None: no bound)"""
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def mask(self, annotation_set):
+        return _within(annotation_set.blockCount(), self.minimum, self.maximum)
+
+
+class IntronSize(Predicate):
+    """rows where all introns have minimum <= size <= maximum (rows without introns pass)"""
+    def __init__(self, minimum=None, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def mask(self, annotation_set):
+        failed = ~_within(annotation_set.introns, self.minimum, self.maximum)
+        return segment_sum(failed, annotation_set.intron_offsets) == 0
+
+
+class Length(Predicate):
+    """
+    rows with minimum <= length <= maximum. The length is end - start or,
+    if exonic, the sum of the exon sizes.
+    """
+    def __init__(self, minimum=None, maximum=None, exonic=False):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.exonic = exonic
+
+    def mask(self, annotation_set):
+        if self.exonic:
+            length = segment_sum(annotation_set.exons, annotation_set.offsets)
+        else:
+            length = annotation_set.end - annotation_set.start
+        return _within(length, self.minimum, self.maximum)
+
+
+class Chrom(Predicate):
+    """rows on one of the chromosomes"""
+    def __init__(self, *chroms):
+        self.chroms = chroms
+
+    def mask(self, annotation_set):
+        return _labels_in(annotation_set.chrom, self.chroms)
+
+
+class Strand(Predicate):
+    """rows on the strand ('+' or '-')"""
+    def __init__(self, strand):
+        self.strand = strand
+
+    def mask(self, annotation_set):
+        return _labels_in(annotation_set.strand, [self.strand])
+
+
+class Coding(Predicate):
+    """rows with an ORF: CDS blocks or thickStart < thickEnd (use ~Coding() for non coding rows)"""
+    def mask(self, annotation_set):
+        return annotation_set.is_coding | (np.diff(annotation_set.cds_offsets) > 0)
+
+
+class IdMatches(Predicate):
+    """rows where column ('transcript_id' or 'gene_id') matches the regex pattern (re.search)"""
+    def __init__(self, pattern, column='transcript_id'):
+        self.pattern = pattern
+        self.column = column
+
+    def mask(self, annotation_set):
+        column = getattr(annotation_set, self.column)
+        regex = re.compile(self.pattern)
+        # one regex call per distinct id
+        matches = [regex.search(str(label)) is not None for label in column.categories]
+        return np.append(np.array(matches, dtype=bool), False)[column.codes]
@@ -0,0 +1,193 @@
+"""
+Gene level views of a collection of transcripts.
+
+Transcripts are grouped by (chrom, strand, gene_id); transcripts without gene_id are
+genes of their own. All blocks of all genes are sorted once by (gene, start, end) and
+every operation is a sweep over these flat arrays (no python loop per gene).
+
+Results are AnnotationSets with one row per gene (named after the gene, with the gene
+blocks as exons), so they can be written with genial.writers (bed, bed6, ...):
+
+    from genial.genes import Genes
+    from genial.writers import write
+
+    genes = Genes(annotation_set)
+    write(genes.meta_exons(), open('genes.bed', 'w'), 'bed')
+    write(genes.constitutive_exons(), open('constitutive.bed', 'w'), 'bed6')
+"""
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet
+
+
+def _offsets(groups, size):
+    """offsets of a CSR layout from the (sorted) group of each element"""
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=size), out=offsets[1:])
+    return offsets
+
+
+def _codes(column, size):
+    if column is None:
+        return np.full(size, -1, dtype=np.int64)
+    return np.asarray(column.codes, dtype=np.int64)
+
+
+class Genes:
+    def __init__(self, annotations):
+        """
+
+        Group the transcripts of a collection of annotations by gene.
+
+        Parameters
+        ----------
+        annotations: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+            blocks of each transcript must be sorted by start (as parsed by genial)
+        """
+        if not isinstance(annotations, AnnotationSet):
+            annotations = AnnotationSet.from_annotations(annotations)
+        self.annotations = annotations
+        size = len(annotations)
+
+        # rows without gene_id get a code of their own
+        gene_codes = _codes(annotations.gene_id, size)
+        n_categories = len(annotations.gene_id.categories)
+        gene_codes = np.where(gene_codes >= 0, gene_codes, n_categories + np.arange(size))
+        keys = np.stack([_codes(annotations.chrom, size), _codes(annotations.strand, size), gene_codes], axis=1)
+
+        # genes are numbered on the order of their first transcript
+        _, first, inverse = np.unique(keys.reshape(size, 3), axis=0, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+
+        self.gene_of_row = rank[inverse.ravel()]
+        self.first_row = first[order]
+
+        # transcripts (rows) of each gene: rows[row_offsets[g]:row_offsets[g + 1]]
+        self.rows = np.argsort(self.gene_of_row, kind='stable')
+        self.row_offsets = _offsets(self.gene_of_row, len(self))
+
+    def __len__(self):
+        return len(self.first_row)
+
+    @property
+    def gene_id(self):
+        """gene_id of each gene (transcript_id for transcripts without gene_id)"""
+        gene_id = np.asarray(self.annotations.gene_id, dtype=object)[self.first_row]
+        transcript_id = np.asarray(self.annotations.transcript_id, dtype=object)[self.first_row]
+        return np.where(pd.isna(gene_id), transcript_id, gene_id)
+
+    def transcript_count(self):
+        """number of transcripts of each gene"""
+        return np.diff(self.row_offsets)
+
+    def _gene_set(self, starts, ends, genes):
+        """AnnotationSet with one row per gene, from blocks sorted by gene"""
+        def first(column):
+            return pd.Categorical.from_codes(column.codes[self.first_row], categories=column.categories)
+
+        gene_id = pd.Categorical(self.gene_id)
+        return AnnotationSet(starts, ends, _offsets(genes, len(self)),
+                             chrom=first(self.annotations.chrom),
+                             strand=first(self.annotations.strand),
+                             transcript_id=gene_id,
+                             gene_id=gene_id)
+
+    def _blocks(self):
+        """gene, start, end and row of every exon block, sorted by (gene, start, end)"""
+        annotation_set = self.annotations
+        rows = annotation_set.row_ids()
+        genes = self.gene_of_row[rows]
+        order = np.lexsort((rows, annotation_set.ends, annotation_set.starts, genes))
+        return genes[order], annotation_set.starts[order], annotation_set.ends[order], rows[order]
+
+    def spans(self):
+        """AnnotationSet with a single block per gene, from its first start to its last end"""
+        genes, starts, ends, _ = self._blocks()
+        offsets = _offsets(genes, len(self))
+        has_blocks = np.diff(offsets) > 0
+        lo = offsets[:-1][has_blocks]
+        return self._gene_set(np.minimum.reduceat(starts, lo) if len(lo) else starts[:0],
+                              np.maximum.reduceat(ends, lo) if len(lo) else ends[:0],
+                              np.flatnonzero(has_blocks))
+
+    def meta_exons(self):
+        """AnnotationSet with the union of the exons of all transcripts of each gene"""
+        from .utils import merge_blocks
+
+        genes, starts, ends, _ = self._blocks()
+        starts, ends, offsets = merge_blocks(starts, ends, _offsets(genes, len(self)))
+        return self._gene_set(starts, ends, np.repeat(np.arange(len(self)), np.diff(offsets)))
+
+    def exons(self):
+        """
+        Distinct exons (same start and end) of each gene.
+
+        Returns
+        -------
+        AnnotationSet with the distinct exons of each gene as blocks and
+        an array with the number of transcripts of the gene having each exon
+        """
+        genes, starts, ends, rows = self._blocks()
+        new_exon = np.ones(len(starts), dtype=bool)
+        new_exon[1:] = (genes[1:] != genes[:-1]) | (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1])
+
+        # a transcript with the same exon twice counts once
+        new_row = new_exon.copy()
+        new_row[1:] |= rows[1:] != rows[:-1]
+
+        first = np.flatnonzero(new_exon)
+        transcripts = np.add.reduceat(new_row, first) if len(first) else np.zeros(0, dtype=np.int64)
+        return self._gene_set(starts[first], ends[first], genes[first]), transcripts
+
+    def _exons_where(self, constitutive):
+        exons, transcripts = self.exons()
+        genes = exons.row_ids()
+        mask = (transcripts == self.transcript_count()[genes]) == constitutive
+        return self._gene_set(exons.starts[mask], exons.ends[mask], genes[mask])
+
+    def constitutive_exons(self):
+        """AnnotationSet with the exons present on all transcripts of each gene"""
+        return self._exons_where(True)
+
+    def alternative_exons(self):
+        """AnnotationSet with the exons missing from at least one transcript of each gene"""
+        return self._exons_where(False)
+
+    def retained_introns(self):
+        """
+        Intron retention candidates: AnnotationSet with the distinct introns of each gene
+        that are inside an exon of another transcript of the same gene.
+        """
+        annotation_set = self.annotations
+        genes, starts, ends, _ = self._blocks()
+
+        # introns of every transcript, sorted by (gene, start, end) and deduplicated
+        not_first = np.ones(len(annotation_set.starts), dtype=bool)
+        not_first[annotation_set.offsets[:-1][annotation_set.blockCount() > 0]] = False
+        idx = np.flatnonzero(not_first)
+        intron_genes = self.gene_of_row[annotation_set.row_ids()[idx]]
+        introns = np.unique(np.stack([intron_genes, annotation_set.ends[idx - 1], annotation_set.starts[idx]],
+                                     axis=1).reshape(-1, 3), axis=0)
+        intron_genes, intron_starts, intron_ends = introns.T
+
+        if not len(starts) or not len(intron_starts):
+            return self._gene_set(intron_starts[:0], intron_ends[:0], intron_genes[:0])
+
+        # exons sorted by (gene, start) with the running max of their ends, restarted on
+        # each gene (genes are shifted apart by span on a single sorted key)
+        low = min(starts.min(), intron_starts.min())
+        span = max(ends.max(), intron_ends.max()) - low + 1
+        running_end = np.maximum.accumulate(ends - low + genes * span) - genes * span + low
+
+        # last exon of the gene starting at or before each intron
+        last = np.searchsorted(starts - low + genes * span, intron_starts - low + intron_genes * span,
+                               side='right') - 1
+        valid = last >= 0
+        last = np.maximum(last, 0)
+        retained = valid & (genes[last] == intron_genes) & (running_end[last] >= intron_ends)
+
+        return self._gene_set(intron_starts[retained], intron_ends[retained], intron_genes[retained])
@@ -1,16 +1,39 @@
-import re
+from collections import OrderedDict
+from itertools import chain
+from warnings import warn
 
+from genial.exceptions import ParseError
 from .classes import GFF, GffLine
-from .line_parser import guess_kind_of_gff, line_parser
-from genial.utils import str2array
+from .line_parser import (ANNOTATION_FEATURES, REQUIRED_ATTRIBUTES, format_feature_counts,
+                          guess_kind_of_gff, is_block_feature, line_parser)
 
 
-def parse_to_dict(file_handle, ff='Unknown'):
+def parse_to_dict(file_handle, ff='Unknown', keep_attributes=None, features=None, feature_counts=None):
+    """
+    Parse a GTF/GFF3 file into a GFF dict (transcript id -> GffItem)
+
+    Parameters
+    ----------
+    file_handle
+    ff: file format
+    keep_attributes: set of attribute keys (default: None, keep all)
+        only these attributes (plus ID, Parent, transcript_id and gene_id) are
+        parsed and stored on the items and on GFF.attributes_of
+    features: set of feature types (default: None, parse all lines)
+        other lines are skipped before being parsed (but exon/CDS lines, and the ID/Parent
+        of GFF3 lines, eg: mRNA). Use ANNOTATION_FEATURES to parse only what annotations need
+    feature_counts: collections.Counter (optional)
+        updated with the lines of each feature parsed/skipped. See line_parser
+
+    Returns
+    -------
+    GFF
+    """
     gff_dict = GFF()
     gff_dict.file_format = ff
 
-    for gff_line in line_parser(file_handle, gff_dict.file_format):
-            if re.match('exon|CDS', gff_line.feature):
+    for gff_line in line_parser(file_handle, gff_dict.file_format, keep_attributes, features, feature_counts):
+            if is_block_feature(gff_line.feature):
                 add_exon(gff_dict, gff_line)
             else:
                 gff_dict.add_kinship(gff_line)
@@ -18,6 +41,148 @@ def parse_to_dict(file_handle, ff='Unknown'):
     return gff_dict
 
 
+def stream_to_dict(file_handle, ff='Unknown', window=1000, probe=100000, keep_attributes=None,
+                   features=None, feature_counts=None):
+    """
+    Parse a GTF/GFF3 file grouped by gene (eg: Ensembl, GENCODE), yielding
+    small GFF dicts with the transcripts of each gene as soon as they are complete.
+
+    A gene block is complete when the chromosome changes or when `window` lines of
+    other genes were read after its last line. Unlike parse_to_dict, memory use does not
+    scale with the size of the file (only the ids of flushed transcripts are kept).
+
+    While reading the first `probe` lines nothing is yielded. If, during the probe, a line
+    belongs to a transcript that was already flushed, the input is not grouped and the
+    whole file is parsed with parse_to_dict instead (a single GFF is yielded).
+    After the probe, such a line raises ParseError.
+
+    Parameters
+    ----------
+    file_handle
+    ff: file format
+    window: int (default: 1000)
+        number of lines from other genes before a gene block is considered complete
+    probe: int (default: 100000)
+        number of lines read before anything is yielded
+    keep_attributes: set of attribute keys (default: None, keep all). See parse_to_dict
+    features, feature_counts: see parse_to_dict
+
+    Returns
+    -------
+    generator of GFF
+    """
+    probe_lines = []
+    initial_counts = dict(feature_counts) if feature_counts is not None else None
+
+    def recorded(lines):
+        for line in lines:
+            if probe_lines is not None:
+                probe_lines.append(line)
+            yield line
+
+    gff_dict = GFF()
+    gff_dict.file_format = ff
+
+    # block -> [number of the last line, keys of the block]
+    pending = OrderedDict()
+    flushed = set()
+    held = []
+    chrom = None
+
+    def flush(blocks):
+        chunk = GFF()
+        chunk.file_format = gff_dict.file_format
+        chunk.orientation = gff_dict.orientation
+        for block in blocks:
+            for key in pending.pop(block)[1]:
+                if key in gff_dict:
+                    chunk[key] = gff_dict.pop(key)
+                if key in gff_dict.parent_of:
+                    chunk.parent_of[key] = gff_dict.parent_of.pop(key)
+                if key in gff_dict.attributes_of:
+                    chunk.attributes_of[key] = gff_dict.attributes_of.pop(key)
+                flushed.add(key)
+        return chunk
+
+    for n, gff_line in enumerate(line_parser(recorded(file_handle), gff_dict.file_format,
+                                                  keep_attributes, features, feature_counts)):
+        if is_block_feature(gff_line.feature):
+            keys = list(gff_line.parents_of_exon)
+        else:
+            try:
+                keys = [gff_line.attrib_dict['transcript_id' if gff_line.file_format == 'gtf' else 'ID']]
+            except KeyError:
+                keys = []
+
+        if any(key in flushed for key in keys):
+            if probe_lines is not None:
+                warn('%s is not grouped by gene, parsing the whole file' % gff_line.file_format)
+                # lines of the probe are parsed (and counted) again
+                if feature_counts is not None:
+                    feature_counts.clear()
+                    feature_counts.update(initial_counts)
+                yield parse_to_dict(chain(probe_lines, file_handle), ff, keep_attributes,
+                                    features, feature_counts)
+                return
+            raise ParseError('transcript %s is not grouped with its gene (line %d). '
+                             'Parse this file without streaming' % (keys, n + 1))
+
+        if is_block_feature(gff_line.feature):
+            add_exon(gff_dict, gff_line)
+        else:
+            gff_dict.add_kinship(gff_line)
+
+        block = _gene_block(gff_dict, gff_line, keys[0]) if keys else None
+
+        # blocks are complete when the chromosome changes or after the window
+        if gff_line.chrom != chrom:
+            complete = [b for b in pending if b != block]
+            chrom = gff_line.chrom
+        else:
+            complete = []
+            for b, (last_line, block_keys) in pending.items():
+                if last_line >= n - window:
+                    break
+                if b != block:
+                    complete.append(b)
+        if complete:
+            held.append(flush(complete))
+
+        if keys:
+            try:
+                pending[block][0] = n
+                pending.move_to_end(block)
+            except KeyError:
+                pending[block] = [n, {block: None}]
+            # dict (not set) keeps the order of the transcripts in the file
+            pending[block][1].update(dict.fromkeys(keys))
+
+        if probe_lines is not None and n >= probe:
+            probe_lines = None
+
+        if probe_lines is None:
+            for chunk in held:
+                yield chunk
+            held = []
+
+    if pending:
+        held.append(flush(list(pending)))
+    for chunk in held:
+        yield chunk
+
+
+def _gene_block(gff_dict: GFF, gff_line: GffLine, key):
+    """gene of a line (for GFF3, the top ancestor of key)"""
+    if gff_line.file_format == 'gtf':
+        return gff_line.gene_id or key
+
+    seen = set()
+    while key in gff_dict.parent_of and key not in seen:
+        seen.add(key)
+        key = gff_dict.parent_of[key]
+    return key
+
+
 def add_exon(gff_dict: GFF, gff_line: GffLine):
     from sys import intern
     starts = intern(gff_line.feature + '_starts')
@@ -34,15 +199,17 @@ def add_exon(gff_dict: GFF, gff_line: GffLine):
             gff_dict[rna_id] = gff_line
             gff_dict.add_attribs(rna_id, gff_line)
 
-        gff_dict[rna_id][starts] += '%s,' % gff_line.start
-        gff_dict[rna_id][ends] += '%s,' % gff_line.end
+        gff_dict[rna_id][starts].append(int(gff_line.start))
+        gff_dict[rna_id][ends].append(int(gff_line.end))
         if gff_line.feature == 'CDS':
-            gff_dict[rna_id].frame += '%s,' % gff_line.frame
+            # frame '.' is stored as -1
+            frame = -1 if gff_line.frame == '.' else int(gff_line.frame)
+            gff_dict[rna_id].frame.append(frame)
 
         # detect orientation of gff
         # ToDo: create another function to do this
         if gff_dict.orientation == 'Unknown' and gff_line.strand == '-':
-            arr = str2array(gff_dict[rna_id][starts])
+            arr = gff_dict[rna_id][starts]
             if len(arr) > 1:
                 dif = arr[-1] - arr[0]
 
@@ -1,10 +1,38 @@
 import re
+from html import unescape
 from warnings import warn
+
 from genial.exceptions import ParseError, UnsupportedFile
+from genial.utils import InternDict
+
+_id_prefix = re.compile(r'^\w+:')
+
+
+def _split_gff3_attribute(att):
+    """key and value of a GFF3 attribute (key=value). Raises ValueError if att is malformed"""
+    k, sep, v = att.partition('=')
+    k = k.strip()
+    if not sep or not k or len(k.split()) != 1:
+        raise ValueError(att)
+    return k, v.lstrip()
+
+
+def _split_gtf_attribute(att):
+    """key and value of a GTF attribute (key "value"). Raises ValueError if att is malformed"""
+    k, v = att.split(None, 1)
+    if v[0] != '"':
+        raise ValueError(att)
+    end = v.index('"', 1)
+    if end == 1:
+        raise ValueError(att)
+    return k, v[1:end]
 
 
-def attributes_parser(attributes: str, file_format='gff3') -> dict:
+def attributes_parser(attributes: str, file_format='gff3', keep_attributes=None) -> dict:
     """
+     Parse the attributes column of a GFF3/GTF line.
+     If keep_attributes (a set of keys) is given, other keys are skipped.
+
      SEMICOLON is a SACRED character on the attributes field of GFF/GTF files
              they should ONLY be used to separate attributes
 
@@ -41,66 +69,42 @@ def attributes_parser(attributes: str, file_format='gff3') -> dict:
 
 
      """
-    def compile_pattern(ff):
-        if ff == 'gff3':
-            return re.compile(r'^\s*(\S+)\s*=\s*(.*)\s*$')
-        elif ff == 'gtf':
-            return re.compile(r'^\s*(\S+)\s+\"([^\"]+)\"\s*')
-        # else:
-        #     raise UnsupportedFile('Unsupported file_format: %s' % ff)
-
-    # Workarounds for incorrect use of SEMICOLONS
-    # ToDo: implement a function for this? is it better to check for each case?
+    if file_format == 'gtf':
+        split_attribute = _split_gtf_attribute
+    else:
+        split_attribute = _split_gff3_attribute
+
+    # Workarounds for incorrect use of SEMICOLONS (only when a cheap check says they are needed)
     # 1: escaped html characters
-    from html import unescape
-    attributes.replace("&#59;", "%3B")
-    attributes = unescape(attributes)
+    if '&' in attributes:
+        attributes = unescape(attributes.replace("&#59;", "%3B"))
 
     # 2: semicolons inside atributes! (What's wrong with u, ensembl???)
-    attributes.replace(';\"', '\"').replace(";-", "-")
+    if ';"' in attributes or ';-' in attributes:
+        attributes = attributes.replace(';"', '"').replace(";-", "-")
 
     # 3: trailing semicolon
-    attributes = re.sub(';\s*$', '', attributes)
-
-    # finally, get a list of attributes
-    attrib_list = attributes.split(';')
+    stripped = attributes.rstrip()
+    if stripped.endswith(';'):
+        attributes = stripped[:-1]
 
-    from genial.utils import InternDict
     attrib_dict = InternDict()
-    # attrib_dict = {}
-
-    # compile the pattern to parse_to_dict gff3 or gtf
-    pattern = compile_pattern(file_format)
-    for att in attrib_list:
-        g = re.search(pattern, att)
-
+    for att in attributes.split(';'):
         try:
-            k, v = g.group(1, 2)
-        except AttributeError:
-            # TODO: use/make more specific exceptions
-            # raise ParseError('regex for %s failed to parse_to_dict %s' % (file_format, attributes))
+            k, v = split_attribute(att)
+        except ValueError:
             message = 'regex for {} failed to parse attribute {}'.format(file_format, att)
             warn(message=message)
-        # if file_format == 'gff3' and re.match(r'ID|Parent', k):
-        #     has_ids_prepended = re.match(r'^(transcript|gene):', v)
-        #     if has_ids_prepended:
-        #         # ensembl GFF usually has transcript/gene: prepended
-        #         # to the values of ID/Parent attributes
-        #         # replace transcript/gene: prepended to values
-        #         v = re.sub(r'^(transcript|gene):', '', v)
-        #
-        #         id_prepended = has_ids_prepended.group(1) + '_id'
-        #
-        #         # let's use this prepended information in our advantage
-        #         # and create an gene_id/transcript_id for GFF files!
-        #
-        #         if id_prepended not in attrib_dict:
-        #             attrib_dict[id_prepended] = v
         else:
-            has_ids_prepended = re.match(r'^(\w+):', v)
-            if has_ids_prepended:
-                v = re.sub(r'^\w+:', '', v)
+            if keep_attributes is not None and k not in keep_attributes:
+                continue
+
+            # ensembl GFF usually has transcript/gene: prepended to the values of ID/Parent
+            if ':' in v:
+                has_ids_prepended = _id_prefix.match(v)
+                if has_ids_prepended:
+                    v = v[has_ids_prepended.end():]
 
             attrib_dict[k] = v
 
-    return attrib_dict
\ No newline at end of file
+    return attrib_dict
@@ -1,4 +1,5 @@
 import re
+from array import array
 from sys import intern
 from collections import OrderedDict
 
@@ -52,7 +53,7 @@ class GffLine(object):
     def __str__(self):
         return '\t'.join(self.field)
 
-    def __init__(self, line: str, file_format: str = "Unknown"):
+    def __init__(self, line: str, file_format: str = "Unknown", keep_attributes=None):
 
         assert type(line) is str, '%s not a string' % line
 
@@ -71,6 +72,8 @@ class GffLine(object):
         self.attributes = self.field[8]
 
         self.file_format = file_format
+        # None: keep all attributes
+        self.keep_attributes = keep_attributes
 
     @property
     def parents_of_exon(self):
@@ -91,7 +94,13 @@ class GffLine(object):
 
     @property
     def attrib_dict(self):
-        return attributes_parser(self.attributes, file_format=self.file_format)
+        """attributes of the line, parsed only once (on first access)"""
+        try:
+            return self._attrib_dict
+        except AttributeError:
+            self._attrib_dict = attributes_parser(self.attributes, file_format=self.file_format,
+                                                  keep_attributes=self.keep_attributes)
+            return self._attrib_dict
 
     @property
     def gene_id(self):
@@ -130,6 +139,21 @@ class GffLine(object):
         return self.attrib_dict[rna_key]
 
 
+class CoordBuffer(array):
+    """
+    Growable buffer of int64 coordinates (array('q')).
+
+    str() returns the comma separated text used to store coordinates in
+    previous versions (eg: '1,20,300,'), for backward compatibility.
+    """
+
+    def __new__(cls, values=()):
+        return super(CoordBuffer, cls).__new__(cls, 'q', values)
+
+    def __str__(self):
+        return ''.join('%d,' % x for x in self)
+
+
 class GffItem(AttribDict):
     """
         An tem parsed from a GFF/GTF file
@@ -148,7 +172,8 @@ class GffItem(AttribDict):
             self.chrom = gff_line.chrom
             self.strand = gff_line.strand
             self.source = gff_line.source
-            self.attrib = gff_line.attrib_dict
+            # copy: the parsed attributes are cached on the line and shared with GFF.attributes_of
+            self.attrib = InternDict(gff_line.attrib_dict)
 
             # self.gene_id = gff_line.gene_id
             # print(gff_line.gene_id)
@@ -187,7 +212,7 @@ class GffItem(AttribDict):
                     self[k] = None
 
                 elif k in coord_keys:
-                    self[k] = ''
+                    self[k] = CoordBuffer()
                 elif k in dict_attribs:
                     if not hasattr(self, k):
                         setattr(self, k, {})
@@ -237,12 +262,36 @@ class GFF(OrderedDict):
         super(GFF, self).__init__(*args, **kwargs)
         self.parent_of = InternDict()
         self.attributes_of = InternDict()
+        self._hierarchy = None
+
+    @property
+    def hierarchy(self):
+        """
+        Index of parent_of (see genial.gff.hierarchy.Hierarchy), built on first use
+        and rebuilt if items were added to (or removed from) parent_of since then.
+        """
+        if self._hierarchy is None or self._hierarchy[0] != len(self.parent_of):
+            from .hierarchy import Hierarchy
+            self._hierarchy = (len(self.parent_of), Hierarchy(self.parent_of))
+        return self._hierarchy[1]
+
+    def gene_of(self, key):
+        """
+        gene_id of the item key: its gene_id attribute or, for GFF3, the root
+        of its parents (same as GffItem.gene_id, without scanning parent_of)
+        """
+        gene_id = self[key].attrib.get('gene_id')
+        if gene_id:
+            return gene_id
+        if self.file_format == 'gff3':
+            return self.hierarchy.gene_of(self[key].transcript_id)
+        return None
 
     def add_attribs(self, key, item: GffLine):
         try:
-            self.attributes_of[key].update(item.attrib_dict.copy())
+            self.attributes_of[key].update(item.attrib_dict)
         except KeyError:
-            self.attributes_of[key] = item.attrib_dict
+            self.attributes_of[key] = InternDict(item.attrib_dict)
 
     def add_kinship(self, item: GffLine):
         if self.file_format == 'gtf':
@@ -0,0 +1,119 @@
+"""
+Index of the parent/child relationships of a GFF (GFF.parent_of).
+
+Every id (child or parent) gets an integer code, and the parents and children of each
+code are stored on CSR-like arrays. Roots (the gene of each feature) and depths are
+computed once for all features, following the first parent of each feature one level
+at a time over the whole array (so the number of steps is the depth of the hierarchy,
+not the number of features).
+
+Features with several parents (Parent=A,B) are supported: their parents and children
+are listed, and their root is the root of their first parent.
+"""
+
+import numpy as np
+
+from genial.exceptions import ParseError
+
+
+def _csr(groups, values, size):
+    """offsets and values sorted by group"""
+    order = np.argsort(groups, kind='stable')
+    offsets = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(groups, minlength=size), out=offsets[1:])
+    return offsets, values[order]
+
+
+class Hierarchy:
+    def __init__(self, parent_of):
+        """
+
+        Parameters
+        ----------
+        parent_of: dict with key = child id and value = parent id
+            (several parents are separated by ',')
+        """
+        self.ids = []
+        self.code_of = {}
+
+        def code(key):
+            try:
+                return self.code_of[key]
+            except KeyError:
+                self.code_of[key] = len(self.ids)
+                self.ids.append(key)
+                return self.code_of[key]
+
+        children, parents = [], []
+        for child, parent in parent_of.items():
+            child = code(child)
+            for p in parent.split(','):
+                children.append(child)
+                parents.append(code(p))
+
+        size = len(self.ids)
+        children = np.array(children, dtype=np.int64)
+        parents = np.array(parents, dtype=np.int64)
+        self.parent_offsets, self.parent_codes = _csr(children, parents, size)
+        self.child_offsets, self.child_codes = _csr(parents, children, size)
+
+        first_parent = np.full(size, -1, dtype=np.int64)
+        has_parent = np.diff(self.parent_offsets) > 0
+        first_parent[has_parent] = self.parent_codes[self.parent_offsets[:-1][has_parent]]
+
+        # walk up all features at once, one level per step
+        self.root_codes = np.arange(size, dtype=np.int64)
+        self.depths = np.zeros(size, dtype=np.int64)
+        current = first_parent.copy()
+        active = np.flatnonzero(current >= 0)
+        for _ in range(size + 1):
+            if not len(active):
+                break
+            self.root_codes[active] = current[active]
+            self.depths[active] += 1
+            current[active] = first_parent[current[active]]
+            active = active[current[active] >= 0]
+        else:
+            raise ParseError('the Parent attributes of %s have a cycle' % self.ids[active[0]])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        return key in self.code_of
+
+    def _labels(self, codes):
+        return [self.ids[c] for c in codes.tolist()]
+
+    def parents(self, key):
+        """parent ids of key (empty for roots). Raises KeyError for unknown ids"""
+        code = self.code_of[key]
+        return self._labels(self.parent_codes[self.parent_offsets[code]:self.parent_offsets[code + 1]])
+
+    def children(self, key):
+        """child ids of key. Raises KeyError for unknown ids"""
+        code = self.code_of[key]
+        return self._labels(self.child_codes[self.child_offsets[code]:self.child_offsets[code + 1]])
+
+    def depth(self, key):
+        """number of levels above key (0 for roots). Raises KeyError for unknown ids"""
+        return int(self.depths[self.code_of[key]])
+
+    def root(self, key):
+        """greatest-parent of key (key itself for roots). Raises KeyError for unknown ids"""
+        return self.ids[self.root_codes[self.code_of[key]]]
+
+    def gene_of(self, key):
+        """
+        Gene of a transcript, as GffItem.gene_id: the roots of its parents (joined by ','
+        if they differ), key itself if it is a root with children or None if key is unknown.
+        """
+        code = self.code_of.get(key)
+        if code is None:
+            return None
+
+        parents = self.parent_codes[self.parent_offsets[code]:self.parent_offsets[code + 1]]
+        if not len(parents):
+            return key
+        roots = dict.fromkeys(self.root_codes[parents].tolist())
+        return ','.join(self.ids[c] for c in roots)
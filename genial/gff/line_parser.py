@@ -32,7 +32,43 @@ def guess_kind_of_gff(gff_line: str, ffs=['gff3', 'gtf']):
     return ff
 
 
-def line_parser(file_handle, ff='Unknown'):
+# attributes used to build transcripts and find their genes: always kept
+REQUIRED_ATTRIBUTES = frozenset(['ID', 'Parent', 'transcript_id', 'gene_id'])
+
+# attributes of GFF3 lines only used to follow the hierarchy (eg: mRNA -> gene)
+HIERARCHY_ATTRIBUTES = frozenset(['ID', 'Parent'])
+
+# features used to build annotations (exons and CDS are always parsed)
+ANNOTATION_FEATURES = frozenset(['exon', 'CDS'])
+
+
+def is_block_feature(feature):
+    """exon and CDS features (and their variants, eg: exonic_region), which add blocks to transcripts"""
+    return feature.startswith(('exon', 'CDS'))
+
+
+def line_parser(file_handle, ff='Unknown', keep_attributes=None, features=None, feature_counts=None):
+    """
+    GffLine of each feature line of file_handle
+
+    Parameters
+    ----------
+    file_handle
+    ff: file format (detected from the first line if 'Unknown')
+    keep_attributes: set of attribute keys (default: None, keep all)
+        other attributes are skipped while parsing (REQUIRED_ATTRIBUTES are always kept)
+    features: set of feature types (default: None, parse all lines)
+        whitelist checked on the raw line, before building any GffLine. exon/CDS lines
+        are always parsed. Other GFF3 lines with ID and Parent (eg: mRNA) only have these
+        two attributes parsed, to keep the hierarchy. Other lines are skipped.
+    feature_counts: collections.Counter (optional)
+        updated with the number of lines of each (feature, action), where action is
+        'parsed', 'hierarchy' or 'skipped'. See format_feature_counts
+    """
+    if keep_attributes is not None:
+        keep_attributes = REQUIRED_ATTRIBUTES.union(keep_attributes)
+    check = features is not None or feature_counts is not None
+
     for line in file_handle:
 
         # stop reading the file when fasta begins
@@ -51,4 +87,37 @@ def line_parser(file_handle, ff='Unknown'):
 
                 print("detected format {}".format(ff), file=sys.stderr)
 
-            yield GffLine(line, file_format=ff)
\ No newline at end of file
+            if not check:
+                yield GffLine(line, file_format=ff, keep_attributes=keep_attributes)
+                continue
+
+            fields = line.split('\t', 3)
+            if len(fields) < 4:
+                raise Exception('%s doesnt have 9 fields' % line)
+            feature = fields[2]
+
+            if features is None or feature in features or is_block_feature(feature):
+                action = 'parsed'
+                gff_line = GffLine(line, file_format=ff, keep_attributes=keep_attributes)
+            elif ff == 'gff3' and 'Parent' in fields[3] and 'ID' in fields[3]:
+                action = 'hierarchy'
+                gff_line = GffLine(line, file_format=ff, keep_attributes=HIERARCHY_ATTRIBUTES)
+            else:
+                action = 'skipped'
+                gff_line = None
+
+            if feature_counts is not None:
+                feature_counts[feature, action] += 1
+            if gff_line is not None:
+                yield gff_line
+
+
+def format_feature_counts(feature_counts):
+    """table with the number of lines of each feature: parsed, hierarchy only (GFF3) and skipped"""
+    rows = ['%-24s %10s %10s %10s' % ('feature', 'parsed', 'hierarchy', 'skipped')]
+    for feature in sorted({feature for feature, _ in feature_counts}):
+        rows.append('%-24s %10d %10d %10d' % (feature,
+                                              feature_counts.get((feature, 'parsed'), 0),
+                                              feature_counts.get((feature, 'hierarchy'), 0),
+                                              feature_counts.get((feature, 'skipped'), 0)))
+    return '\n'.join(rows)
@@ -0,0 +1,254 @@
+"""
+GNL: a memory-mappable binary format for annotations.
+
+A .gnl file stores the arrays of an AnnotationSet (exon and CDS blocks, offsets,
+thickStart/thickEnd), the codes of its categorical columns, their string tables and
+an index from transcript_id to rows. Opening a file only reads its header: arrays are
+memory mapped, so fetching a transcript reads only the pages holding its data.
+
+Layout (all integers little endian)::
+
+    b'GNL\\x01'                 magic number and format version
+    uint64                     size of the header
+    header                     JSON: {"rows": int, "arrays": {name: [offset, dtype, length]}}
+    arrays                     each one aligned to 64 bytes
+
+String tables are stored as a blob of utf-8 bytes plus int64 offsets, sorted
+(so transcript ids are found by binary search).
+"""
+
+import bisect
+import json
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet, AnnotationView, gather_segments
+from .exceptions import ParseError
+
+MAGIC = b'GNL\x01'
+_ALIGN = 64
+
+_int_arrays = ['starts', 'ends', 'offsets',
+               'cds_starts', 'cds_ends', 'cds_offsets',
+               'thick_starts', 'thick_ends']
+_categoricals = ['chrom', 'strand', 'transcript_id', 'gene_id', 'item_rgb']
+
+
+def _string_table(strings):
+    """sorted strings as (utf-8 blob, offsets), plus the new position of each string"""
+    strings = [str(s) for s in strings]
+    order = sorted(range(len(strings)), key=strings.__getitem__)
+    encoded = [strings[i].encode() for i in order]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    new_position = np.empty(len(strings), dtype=np.int64)
+    new_position[order] = np.arange(len(strings))
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, new_position
+
+
+def write_gnl(annotation_set, file_handle):
+    """
+    Write an AnnotationSet as GNL.
+
+    Parameters
+    ----------
+    annotation_set: AnnotationSet
+    file_handle: file handle opened on binary mode (doesn't need to be seekable)
+    """
+    arrays = {name: getattr(annotation_set, name).astype('<i8') for name in _int_arrays}
+
+    for name in _categoricals:
+        column = getattr(annotation_set, name)
+        if column is None:
+            continue
+        blob, offsets, new_position = _string_table(column.categories)
+        codes = np.asarray(column.codes, dtype=np.int64)
+        if len(new_position):
+            codes = np.where(codes < 0, -1, new_position[np.maximum(codes, 0)])
+        arrays[name + '_codes'] = codes.astype('<i4')
+        arrays[name + '_strings'] = blob
+        arrays[name + '_string_offsets'] = offsets.astype('<i8')
+
+    # transcript_id -> rows: rows sorted by transcript_id, split by id (CSR-like)
+    if 'transcript_id_codes' in arrays:
+        codes = arrays['transcript_id_codes'].astype(np.int64)
+        n_ids = len(arrays['transcript_id_string_offsets']) - 1
+        arrays['id_rows'] = np.argsort(codes, kind='stable')[np.sort(codes) >= 0].astype('<i8')
+        counts = np.bincount(codes[codes >= 0], minlength=n_ids)
+        id_offsets = np.zeros(n_ids + 1, dtype='<i8')
+        np.cumsum(counts, out=id_offsets[1:])
+        arrays['id_row_offsets'] = id_offsets
+
+    # compute the offsets of all arrays before writing (no seek needed)
+    def layout(header_size):
+        position = len(MAGIC) + 8 + header_size
+        entries = {}
+        for name, arr in arrays.items():
+            position += -position % _ALIGN
+            entries[name] = [position, arr.dtype.str, len(arr)]
+            position += arr.nbytes
+        return entries
+
+    header_size = 0
+    while True:
+        header = json.dumps({'rows': len(annotation_set), 'arrays': layout(header_size)}).encode()
+        if len(header) <= header_size:
+            break
+        header_size = len(header) + 64
+    header = header.ljust(header_size)
+
+    file_handle.write(MAGIC)
+    file_handle.write(np.uint64(header_size).astype('<u8').tobytes())
+    file_handle.write(header)
+    position = len(MAGIC) + 8 + header_size
+    for name, arr in arrays.items():
+        padding = -position % _ALIGN
+        file_handle.write(b'\0' * padding)
+        file_handle.write(arr.tobytes())
+        position += padding + arr.nbytes
+
+
+class _StringTable:
+    """read only sequence of str backed by a (blob, offsets) string table"""
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+    def decode(self, codes):
+        """list with the str of each code"""
+        return [self[i] for i in codes]
+
+    def all(self):
+        offsets = self.offsets.tolist()
+        blob = self.blob.tobytes()
+        return [blob[lo:hi].decode() for lo, hi in zip(offsets[:-1], offsets[1:])]
+
+
+class GnlFile:
+    def __init__(self, path):
+        """
+
+        A memory mapped GNL file. Opening it only reads the header.
+
+        Parameters
+        ----------
+        path: path to a .gnl file
+        """
+        self.path = path
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+
+        if self._mm[:len(MAGIC)].tobytes() != MAGIC:
+            raise ParseError('%s is not a GNL file' % path)
+        start = len(MAGIC) + 8
+        header_size = int(self._mm[len(MAGIC):start].view('<u8')[0])
+        header = json.loads(self._mm[start:start + header_size].tobytes().decode())
+
+        self.rows = header['rows']
+        self._arrays = {}
+        for name, (offset, dtype, length) in header['arrays'].items():
+            dtype = np.dtype(dtype)
+            self._arrays[name] = self._mm[offset:offset + length * dtype.itemsize].view(dtype)
+
+        for name in _int_arrays:
+            setattr(self, name, self._arrays[name])
+
+        self._strings = {name: _StringTable(self._arrays[name + '_strings'],
+                                            self._arrays[name + '_string_offsets'])
+                         for name in _categoricals if name + '_codes' in self._arrays}
+
+    def __len__(self):
+        return self.rows
+
+    def __iter__(self):
+        return iter(self.to_set())
+
+    def __contains__(self, transcript_id):
+        return len(self.rows_of(transcript_id)) > 0
+
+    def __getitem__(self, transcript_id):
+        """AnnotationView of the (first) transcript with this transcript_id"""
+        rows = self.rows_of(transcript_id)
+        if not len(rows):
+            raise KeyError(transcript_id)
+        return AnnotationView(self.take(rows[:1]), 0)
+
+    def rows_of(self, transcript_id):
+        """rows with this transcript_id (binary search on the sorted string table)"""
+        try:
+            ids = self._strings['transcript_id']
+        except KeyError:
+            return np.zeros(0, dtype=np.int64)
+
+        code = bisect.bisect_left(ids, transcript_id)
+        if code == len(ids) or ids[code] != transcript_id:
+            return np.zeros(0, dtype=np.int64)
+        lo, hi = self._arrays['id_row_offsets'][code:code + 2]
+        return np.array(self._arrays['id_rows'][lo:hi], dtype=np.int64)
+
+    def _categorical(self, name, rows=None):
+        if name not in self._strings:
+            return None
+
+        codes = self._arrays[name + '_codes']
+        if rows is None:
+            return pd.Categorical.from_codes(np.asarray(codes), categories=self._strings[name].all())
+
+        # decode only the strings used by rows
+        codes = np.asarray(codes[rows], dtype=np.int64)
+        used, new_codes = np.unique(codes, return_inverse=True)
+        if len(used) and used[0] < 0:
+            used = used[1:]
+            new_codes = new_codes - 1
+        return pd.Categorical.from_codes(new_codes.ravel(), categories=self._strings[name].decode(used))
+
+    def take(self, rows):
+        """AnnotationSet with the given rows (only their data is read)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        positions, offsets = gather_segments(self.offsets, rows)
+        cds_positions, cds_offsets = gather_segments(self.cds_offsets, rows)
+
+        return AnnotationSet(self.starts[positions], self.ends[positions], offsets,
+                             chrom=self._categorical('chrom', rows),
+                             strand=self._categorical('strand', rows),
+                             transcript_id=self._categorical('transcript_id', rows),
+                             gene_id=self._categorical('gene_id', rows),
+                             cds_starts=self.cds_starts[cds_positions],
+                             cds_ends=self.cds_ends[cds_positions],
+                             cds_offsets=cds_offsets,
+                             thick_starts=self.thick_starts[rows],
+                             thick_ends=self.thick_ends[rows],
+                             item_rgb=self._categorical('item_rgb', rows))
+
+    def get(self, transcript_ids):
+        """AnnotationSet with all rows of the given transcript ids (in the given order)"""
+        rows = [self.rows_of(transcript_id) for transcript_id in transcript_ids]
+        return self.take(np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64))
+
+    def to_set(self):
+        """
+        The whole file as an AnnotationSet. Block arrays stay memory mapped;
+        string tables are decoded.
+        """
+        return AnnotationSet(self.starts, self.ends, self.offsets,
+                             chrom=self._categorical('chrom'),
+                             strand=self._categorical('strand'),
+                             transcript_id=self._categorical('transcript_id'),
+                             gene_id=self._categorical('gene_id'),
+                             cds_starts=self.cds_starts,
+                             cds_ends=self.cds_ends,
+                             cds_offsets=self.cds_offsets,
+                             thick_starts=self.thick_starts,
+                             thick_ends=self.thick_ends,
+                             item_rgb=self._categorical('item_rgb'))
+
+
+def read_gnl(file_handle):
+    """AnnotationSet from a GNL file (file_handle must be a file on disk: it is memory mapped)"""
+    return GnlFile(getattr(file_handle, 'name', file_handle)).to_set()
@@ -0,0 +1,357 @@
+"""
+Interval index for overlap and nearest neighbour queries over parsed annotations.
+
+Intervals (transcripts or exons) are sorted by (chromosome, strand, start) in flat arrays.
+Every interval is augmented with the maximum end of all intervals sorted before it
+(cumulative max), so the intervals overlapping [start, end) are found with two binary
+searches plus a scan of the candidates between them. To keep a few long intervals from
+making every later query scan all the intervals after them, overlaps are searched on
+buckets of intervals of similar length (within a factor 4), each with its own cumulative max.
+Batches of queries are answered at once with numpy (no python loop per query), in chunks
+with a bounded number of candidates.
+
+Coordinates are 0-based and half-open, as in the BED format.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet
+
+# (chrom, strand) group of each interval is stored on the high bits of the sort keys
+_SHIFT = 40
+_MAX_COORD = 1 << _SHIFT
+_NO_DISTANCE = np.iinfo(np.int64).max
+# lengths of the intervals of an overlap bucket are in [4 ** k, 4 ** (k + 1))
+_BUCKET_BITS = 2
+# max number of candidate intervals expanded at once by overlap queries
+_MAX_CANDIDATES = 1 << 22
+
+
+def _expand(lo, hi):
+    """positions of every [lo[i], hi[i]) range, and the range index of each position"""
+    counts = np.maximum(hi - lo, 0)
+    owner = np.repeat(np.arange(len(lo)), counts)
+    first = np.zeros(len(lo), dtype=np.int64)
+    np.cumsum(counts[:-1], out=first[1:])
+    positions = np.arange(counts.sum(), dtype=np.int64) - np.repeat(first - lo, counts)
+    return positions, owner
+
+
+def _searchsorted(a, v, side):
+    """np.searchsorted, faster for large unsorted v (binary searches of sorted values share cache)"""
+    if len(v) < 1024:
+        return np.searchsorted(a, v, side=side)
+    order = np.argsort(v)
+    result = np.empty(len(v), dtype=np.int64)
+    result[order] = np.searchsorted(a, v[order], side=side)
+    return result
+
+
+def _chunks(counts, size):
+    """[first, last) ranges of consecutive counts adding up to about size (at least one count each)"""
+    total = np.cumsum(counts)
+    edges = np.searchsorted(total, np.arange(size, total[-1] if len(total) else 0, size), side='right')
+    edges = np.concatenate([[0], edges, [len(counts)]])
+    edges = edges[np.concatenate([[True], np.diff(edges) > 0])]
+    return zip(edges[:-1].tolist(), edges[1:].tolist())
+
+
+class IntervalIndex:
+    def __init__(self, annotations, level='transcript'):
+        """
+
+        Index the transcripts (or exons) of a collection of annotations by position.
+
+        Parameters
+        ----------
+        annotations: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+        level: 'transcript' (default) or 'exon'
+            transcript: intervals span from the first start to the last end of each annotation,
+            and queries return rows of the AnnotationSet
+            exon: one interval per exon block, and queries return positions on the flat
+            exon arrays (annotation_set.starts, annotation_set.ends; use row_ids to get their rows)
+        """
+        if not isinstance(annotations, AnnotationSet):
+            annotations = AnnotationSet.from_annotations(annotations)
+        self.annotations = annotations
+        self.level = level
+
+        if level == 'transcript':
+            has_blocks = annotations.blockCount() > 0
+            refs = np.flatnonzero(has_blocks)
+            starts = annotations.starts[annotations.offsets[:-1][has_blocks]]
+            ends = annotations.ends[annotations.offsets[1:][has_blocks] - 1]
+            rows = refs
+        elif level == 'exon':
+            refs = np.arange(len(annotations.starts))
+            starts, ends = annotations.starts, annotations.ends
+            rows = annotations.row_ids()
+        else:
+            raise ValueError("level must be 'transcript' or 'exon', not %r" % level)
+
+        if len(starts) and (starts.min() < 0 or ends.max() >= _MAX_COORD):
+            raise ValueError('coordinates must be between 0 and %d' % _MAX_COORD)
+
+        self.chroms = list(annotations.chrom.categories)
+        self.strands = ['+', '-']
+        chrom_codes = np.asarray(annotations.chrom.codes, dtype=np.int64)[rows]
+        strand_codes = pd.Categorical(annotations.strand, categories=self.strands).codes[rows]
+        groups = chrom_codes * len(self.strands) + strand_codes
+
+        valid = (chrom_codes >= 0) & (strand_codes >= 0)
+        groups, starts, ends, refs = groups[valid], starts[valid], ends[valid], refs[valid]
+
+        order = np.lexsort((ends, starts, groups))
+        self._groups = groups[order]
+        self._starts = starts[order]
+        self._ends = ends[order]
+        self.refs = refs[order]
+
+        self._start_keys = (self._groups << _SHIFT) | self._starts
+        # the max end of each group never reaches the keys of the next group
+        self._max_end_keys = np.maximum.accumulate((self._groups << _SHIFT) | self._ends)
+        self._max_end_at = self._running_argmax()
+        self._buckets = self._length_buckets()
+        # rank of each interval sorted by (chromosome, start) on both strands (on ties, + strand first)
+        self._rank = np.empty(len(self._starts), dtype=np.int64)
+        self._rank[np.lexsort((self._groups, self._starts, self._groups // len(self.strands)))] = \
+            np.arange(len(self._starts))
+
+        n_groups = len(self.chroms) * len(self.strands)
+        self._group_offsets = np.searchsorted(self._groups, np.arange(n_groups + 1))
+
+    def _running_argmax(self):
+        """position of the interval with the max end seen so far (on each group)"""
+        is_max = np.ones(len(self._ends), dtype=bool)
+        is_max[1:] = self._max_end_keys[1:] != self._max_end_keys[:-1]
+        return np.maximum.accumulate(np.where(is_max, np.arange(len(self._ends)), 0))
+
+    def _length_buckets(self):
+        """(positions, start keys, cumulative max end keys) of the intervals of each length bucket"""
+        lengths = np.maximum(self._ends - self._starts, 1)
+        bucket_ids = np.floor(np.log2(lengths) / _BUCKET_BITS).astype(np.int64)
+        counts = np.bincount(bucket_ids)
+
+        # a bucket with fewer intervals than the next (longer) one is merged with it:
+        # scanning a few more candidates is cheaper than searching one more bucket
+        merged = np.zeros(len(counts), dtype=np.int64)
+        size = 0
+        for bucket_id in np.flatnonzero(counts):
+            if size >= counts[bucket_id]:
+                merged[bucket_id:] += 1
+                size = 0
+            size += counts[bucket_id]
+        bucket_ids = merged[bucket_ids]
+
+        buckets = []
+        for bucket_id in np.unique(bucket_ids):
+            positions = np.flatnonzero(bucket_ids == bucket_id)
+            groups = self._groups[positions] << _SHIFT
+            buckets.append((positions, self._start_keys[positions],
+                            np.maximum.accumulate(groups | self._ends[positions])))
+        return buckets
+
+    def __len__(self):
+        return len(self.refs)
+
+    def row_ids(self, refs):
+        """rows of the AnnotationSet of the given references"""
+        refs = np.asarray(refs, dtype=np.int64)
+        if self.level == 'exon':
+            return np.searchsorted(self.annotations.offsets, refs, side='right') - 1
+        return refs
+
+    @staticmethod
+    def _codes(values, categories, size):
+        """code of each value on categories (-1 if missing), for an array or a single value"""
+        if np.ndim(values) == 0:
+            try:
+                code = categories.index(values)
+            except ValueError:
+                code = -1
+            return np.full(size, code, dtype=np.int64)
+
+        categories = np.asarray(categories)
+        if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+            # code of each category of values
+            values = pd.Categorical(values)
+            lookup = np.append(IntervalIndex._codes(np.asarray(values.categories), categories, 0), -1)
+            return lookup[values.codes]
+
+        values = np.asarray(values)
+        if values.dtype == object:
+            # eg: None for missing values
+            values = values.astype(str)
+        if len(categories) == 0:
+            return np.full(len(values), -1, dtype=np.int64)
+        order = np.argsort(categories)
+        found = np.minimum(np.searchsorted(categories[order], values), len(categories) - 1)
+        found = order[found]
+        return np.where(categories[found] == values, found, -1).astype(np.int64)
+
+    def _group_codes(self, chrom_codes, strands):
+        strand_codes = self._codes(strands, self.strands, len(chrom_codes))
+        groups = chrom_codes * len(self.strands) + strand_codes
+        groups[(chrom_codes < 0) | (strand_codes < 0)] = -1
+        return groups
+
+    def _overlap_stranded(self, groups, starts, ends):
+        known = groups >= 0
+        query_ids = np.flatnonzero(known)
+        # queries sorted by start (binary searches of sorted values share cache)
+        order = np.argsort((groups[known] << _SHIFT) | starts[known])
+        query_ids = query_ids[order]
+        groups, starts, ends = groups[query_ids], starts[query_ids], ends[query_ids]
+
+        # candidates of each bucket: start < query end and (max end before them) > query start
+        start_keys = (groups << _SHIFT) | starts
+        end_keys = (groups << _SHIFT) | ends
+        bounds = [(np.searchsorted(max_end_keys, start_keys, side='right'),
+                   np.searchsorted(bucket_start_keys, end_keys, side='left'))
+                  for _, bucket_start_keys, max_end_keys in self._buckets]
+        counts = sum((np.maximum(hi - lo, 0) for lo, hi in bounds), np.zeros(len(starts), dtype=np.int64))
+
+        hits = []
+        for first, last in _chunks(counts, _MAX_CANDIDATES):
+            for (bucket_positions, _, _), (lo, hi) in zip(self._buckets, bounds):
+                candidates, owner = _expand(lo[first:last], hi[first:last])
+                positions = bucket_positions[candidates]
+                owner += first
+                overlapping = self._ends[positions] > starts[owner]
+                hits.append((owner[overlapping], positions[overlapping]))
+        if not hits:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        # not sorted (see overlap_batch)
+        return query_ids[np.concatenate([o for o, _ in hits])], np.concatenate([p for _, p in hits])
+
+    def overlap_batch(self, chroms, starts, ends, strands=None):
+        """
+        Annotations overlapping each [starts[i], ends[i]) interval.
+
+        Parameters
+        ----------
+        chroms: array of str (or a single str for all queries)
+        starts, ends: arrays of int
+        strands: array of '+'/'-', a single value or None (default: both strands)
+
+        Returns
+        -------
+        (query_ids, refs): int64 arrays with a pair per overlap, sorted by query.
+        refs are rows of the AnnotationSet (level='transcript') or positions of exons (level='exon')
+        """
+        starts = np.atleast_1d(np.asarray(starts, dtype=np.int64))
+        ends = np.atleast_1d(np.asarray(ends, dtype=np.int64))
+        chrom_codes = self._codes(chroms, self.chroms, len(starts))
+
+        if strands is not None:
+            query_ids, positions = self._overlap_stranded(self._group_codes(chrom_codes, strands),
+                                                          starts, ends)
+        else:
+            hits = [self._overlap_stranded(self._group_codes(chrom_codes, strand), starts, ends)
+                    for strand in self.strands]
+            query_ids = np.concatenate([q for q, _ in hits])
+            positions = np.concatenate([p for _, p in hits])
+
+        # sorted by query, then by start
+        order = np.argsort(query_ids * len(self) + self._rank[positions])
+        query_ids, positions = query_ids[order], positions[order]
+
+        return query_ids, self.refs[positions]
+
+    def overlap(self, chrom, start, end, strand=None):
+        """
+        Annotations overlapping [start, end) of chrom, sorted by start.
+
+        Returns
+        -------
+        int64 array of references (see overlap_batch)
+        """
+        return self.overlap_batch(chrom, [start], [end], strand)[1]
+
+    def point_batch(self, chroms, positions, strands=None):
+        """Annotations containing each position. Returns (query_ids, refs), as overlap_batch"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.overlap_batch(chroms, positions, positions + 1, strands)
+
+    def point(self, chrom, position, strand=None):
+        """Annotations containing position"""
+        return self.overlap(chrom, position, position + 1, strand)
+
+    def _nearest_stranded(self, groups, starts, ends):
+        refs = np.full(len(starts), -1, dtype=np.int64)
+        distances = np.full(len(starts), _NO_DISTANCE, dtype=np.int64)
+
+        known = np.flatnonzero(groups >= 0)
+        if len(self) == 0 or len(known) == 0:
+            return refs, distances
+        groups, starts, ends = groups[known], starts[known], ends[known]
+
+        # left: the interval with the max end among the ones starting before the query end
+        # (it overlaps the query, if any interval does)
+        hi = _searchsorted(self._start_keys, (groups << _SHIFT) | ends, 'left')
+        has_left = hi > self._group_offsets[groups]
+        left = self._max_end_at[np.maximum(hi - 1, 0)]
+        left_end = self._ends[left]
+        left_distance = np.where(left_end > starts, 0, starts - left_end + 1)
+        left_distance[~has_left] = _NO_DISTANCE
+
+        # right: the first interval starting at or after the query end
+        has_right = hi < self._group_offsets[groups + 1]
+        right = np.minimum(hi, len(self) - 1)
+        right_distance = self._starts[right] - ends + 1
+        right_distance[~has_right] = _NO_DISTANCE
+
+        # on ties, the left interval wins
+        use_left = left_distance <= right_distance
+        found = has_left | has_right
+
+        refs[known[found]] = self.refs[np.where(use_left, left, right)[found]]
+        distances[known[found]] = np.where(use_left, left_distance, right_distance)[found]
+        return refs, distances
+
+    def nearest_batch(self, chroms, starts, ends=None, strands=None):
+        """
+        Nearest annotation of each [starts[i], ends[i]) interval (or position, if ends is None).
+
+        The distance is 0 for overlapping annotations, and the number of bases between
+        the query and the annotation otherwise (eg: 1 for book-ended intervals).
+        On ties, the annotation on the left (lower coordinates) is returned.
+
+        Parameters
+        ----------
+        chroms: array of str (or a single str for all queries)
+        starts: array of int
+        ends: array of int (default: starts + 1)
+        strands: array of '+'/'-', a single value or None (default: both strands)
+
+        Returns
+        -------
+        (refs, distances): int64 arrays with one value per query.
+        refs is -1 (and distance is the max int64) when there are no annotations
+        on the chromosome (and strand) of the query
+        """
+        starts = np.atleast_1d(np.asarray(starts, dtype=np.int64))
+        ends = starts + 1 if ends is None else np.atleast_1d(np.asarray(ends, dtype=np.int64))
+        chrom_codes = self._codes(chroms, self.chroms, len(starts))
+
+        if strands is not None:
+            return self._nearest_stranded(self._group_codes(chrom_codes, strands), starts, ends)
+
+        plus, minus = [self._nearest_stranded(self._group_codes(chrom_codes, strand), starts, ends)
+                       for strand in self.strands]
+        use_plus = plus[1] <= minus[1]
+        return np.where(use_plus, plus[0], minus[0]), np.where(use_plus, plus[1], minus[1])
+
+    def nearest(self, chrom, start, end=None, strand=None):
+        """
+        Nearest annotation of [start, end) (or of start, if end is None).
+
+        Returns
+        -------
+        (ref, distance), or (None, None) if there are no annotations on chrom
+        """
+        refs, distances = self.nearest_batch(chrom, [start], None if end is None else [end], strand)
+        if refs[0] < 0:
+            return None, None
+        return int(refs[0]), int(distances[0])
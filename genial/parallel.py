@@ -0,0 +1,241 @@
+"""
+Parallel processing of annotation files.
+
+Files are split in chunks of bytes: BED files at line boundaries, GTF/GFF3 files at
+gene boundaries (so every transcript is complete inside its chunk).
+Each chunk is parsed and processed by a function on a different process
+and the results are returned in the original order of the file.
+
+Files not grouped by gene (eg: sorted by position) can't be split this way: the genes of every
+chunk are checked first and, if a gene (or a GFF3 parent) is on more than one chunk,
+the file is parsed on a single process.
+"""
+
+import io
+import mmap
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from warnings import warn
+
+from .bgzf import sniff
+from .utils import magic_open
+
+_GTF_GENE_ID = re.compile(rb'gene_id\s+"([^"]*)"')
+_GTF_LINE_GENE = re.compile(rb'^([^#\t\r\n][^\t\r\n]*)\t[^\n]*?gene_id\s+"([^"]*)"', re.M)
+_GFF3_ID = re.compile(rb'[\t;]\s*ID=([^;\t\r\n]*)')
+_GFF3_PARENT = re.compile(rb'[\t;]\s*Parent=([^;\t\r\n]*)')
+
+
+def _gene_key(line, input_format):
+    """
+    Key that changes between two consecutive lines of different genes.
+    None for lines that can be on any side of a boundary (eg: comments).
+    """
+    if line.startswith(b'#'):
+        # GFF3 ### directive: all features before it are complete
+        if input_format == 'gff3' and line.startswith(b'###'):
+            return line
+        return None
+
+    fields = line.split(b'\t', 8)
+    if len(fields) < 9:
+        return None
+
+    if input_format == 'gtf':
+        gene_id = _GTF_GENE_ID.search(fields[8])
+        return fields[0], gene_id.group(1) if gene_id else None
+
+    # gff3: top level features (without Parent) start a new gene
+    if b'Parent=' not in fields[8]:
+        return line
+    return False
+
+
+def _next_boundary(file_handle, offset, input_format, end):
+    """first line start (at or after offset) where a chunk may begin"""
+    if offset >= end:
+        return end
+
+    # finish the line containing offset - 1
+    file_handle.seek(offset - 1)
+    file_handle.readline()
+
+    if input_format == 'bed':
+        return min(file_handle.tell(), end)
+
+    previous = None
+    while True:
+        position = file_handle.tell()
+        line = file_handle.readline()
+        if not line or position >= end:
+            return end
+
+        key = _gene_key(line, input_format)
+        if key is None:
+            continue
+
+        if input_format == 'gff3':
+            if key is not False:
+                return position
+        elif previous is not None and key != previous:
+            return position
+        previous = key
+
+
+def _end_of_features(path, input_format):
+    """GFF3 files may end with sequences (##FASTA section): don't split them"""
+    size = os.path.getsize(path)
+    if input_format != 'gff3' or size == 0:
+        return size
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ends = [mm.find(b'\n##FASTA'), mm.find(b'\n>')]
+        ends = [e + 1 for e in ends if e >= 0]
+        if mm[:1] == b'>' or mm[:7] == b'##FASTA':
+            ends.append(0)
+    return min(ends, default=size)
+
+
+def chunk_offsets(path, input_format, chunk_size):
+    """
+    Split path in chunks of approximately chunk_size bytes.
+
+    Returns
+    -------
+    list of (start, end) byte offsets
+    """
+    end = _end_of_features(path, input_format)
+
+    boundaries = [0]
+    with open(path, 'rb') as f:
+        offset = chunk_size
+        while offset < end:
+            boundary = _next_boundary(f, offset, input_format, end)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+            offset = max(offset, boundary) + chunk_size
+
+    if boundaries[-1] < end:
+        boundaries.append(end)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _chunk_genes(path, input_format, start, end):
+    """
+    Genes of a chunk: (chrom, gene_id) of GTF lines or ID of GFF3 features, and the
+    orphans of the chunk (GFF3 parents referenced but not defined in it).
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start)
+
+    if input_format == 'gtf':
+        return set(_GTF_LINE_GENE.findall(text)), set()
+
+    ids = set(_GFF3_ID.findall(text))
+    parents = {parent for parents in _GFF3_PARENT.findall(text) for parent in parents.split(b',')}
+    return ids, parents - ids
+
+
+def _grouped_by_gene(chunk_genes):
+    """True if no gene is on more than one chunk (and no parent is on another chunk than its children)"""
+    seen, all_orphans = set(), set()
+    for genes, orphans in chunk_genes:
+        if not seen.isdisjoint(genes):
+            return False
+        seen.update(genes)
+        all_orphans.update(orphans)
+    # orphans without parent on any chunk are parsed the same way by a single process
+    return seen.isdisjoint(all_orphans)
+
+
+def _process_chunk(path, input_format, start, end, func, parse_kwargs):
+    from genial import parse
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+
+    # newline=None: translate \r\n as a file opened on text mode would do
+    return func(parse(io.StringIO(text, newline=None), input_format, **parse_kwargs))
+
+
+def is_compressed(path):
+    with open(path, 'rb') as f:
+        head = f.read(1024)
+    return sniff(head) is not None
+
+
+def process_chunks(path, input_format, func, threads=None, chunk_size=None,
+                   annotations_per_chunk=10000, **parse_kwargs):
+    """
+    Parse path in chunks, processed in parallel by `threads` processes.
+
+    func is called with an iterable of InteractiveAnnotation (the annotations of a chunk)
+    and must be picklable (eg: a module level function or a functools.partial of it).
+    Its results are yielded in the original order of the file.
+
+    Compressed files, and GTF/GFF3 files not grouped by gene, can't be split: they are
+    parsed on the current process and func is called for every `annotations_per_chunk`
+    annotations (with a warning, for files not grouped by gene).
+
+    Parameters
+    ----------
+    path: path to an uncompressed bed, gtf or gff3 file
+    input_format
+    func: function(annotations) -> result
+    threads: number of processes (default: number of cpus)
+    chunk_size: bytes per chunk (default: file size / (4 * threads), between 1MB and 64MB)
+    annotations_per_chunk: int
+        files parsed on the current process only, number of annotations passed to each call of func
+    parse_kwargs: passed to genial.parse
+
+    Returns
+    -------
+    generator with the results of func
+    """
+    from genial import parse
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+
+    if not is_compressed(path):
+        if chunk_size is None:
+            chunk_size = os.path.getsize(path) // (4 * threads)
+            chunk_size = min(max(chunk_size, 2 ** 20), 2 ** 26)
+
+        chunks = chunk_offsets(path, input_format, chunk_size)
+
+        with ProcessPoolExecutor(max_workers=threads) as executor:
+            if input_format != 'bed' and len(chunks) > 1:
+                starts, ends = zip(*chunks)
+                chunk_genes = executor.map(_chunk_genes, repeat(path), repeat(input_format), starts, ends)
+                if not _grouped_by_gene(chunk_genes):
+                    chunks = None
+
+            if chunks is not None:
+                # keep only a few chunks ahead of the one being yielded
+                running = deque()
+                for start, end in chunks:
+                    running.append(executor.submit(_process_chunk, path, input_format,
+                                                   start, end, func, parse_kwargs))
+                    if len(running) >= 2 * threads:
+                        yield running.popleft().result()
+
+                while running:
+                    yield running.popleft().result()
+                return
+
+        warn('%s is not grouped by gene, parsing it on a single process' % path)
+
+    with magic_open(path) as f:
+        annotations = parse(f, input_format, **parse_kwargs)
+        while True:
+            chunk = list(islice(annotations, annotations_per_chunk))
+            if not chunk:
+                break
+            yield func(chunk)
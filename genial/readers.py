@@ -0,0 +1,279 @@
+"""
+Bulk readers: parse whole annotation files into an AnnotationSet,
+without creating an InteractiveAnnotation per line.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from .AnnotationSet import AnnotationSet
+from .exceptions import ParseError
+
+_TAB, _NEWLINE = ord('\t'), ord('\n')
+
+bed12_columns = ['chrom', 'chromStart', 'chromEnd', 'name', 'score', 'strand',
+                 'thickStart', 'thickEnd', 'itemRgb', 'blockCount', 'blockSizes', 'blockStarts']
+
+
+def _fromstring(text, expected):
+    """int64 array from comma separated integers, raise ParseError if len != expected"""
+    if not text:
+        values = np.zeros(0, dtype=np.int64)
+    else:
+        with warnings.catch_warnings():
+            # invalid text is reported below
+            warnings.simplefilter('ignore', DeprecationWarning)
+            try:
+                values = np.fromstring(text, sep=',', dtype=np.int64)
+            except ValueError as err:
+                raise ParseError(str(err))
+
+    if len(values) != expected:
+        raise ParseError('expected %d integers, found %d' % (expected, len(values)))
+    return values
+
+
+def _join_fields(chunk, starts, ends):
+    """
+    Comma separated integers of every chunk[starts[i]:ends[i]] region.
+    Tabs inside a region and trailing commas are allowed.
+    """
+    regions = b','.join([chunk[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+    return regions.replace(b'\t', b',').replace(b',,', b',').rstrip(b',')
+
+
+def _fixed_width(buf, starts, ends):
+    """bytes of every [starts, ends) interval of buf, as a numpy 'S' array"""
+    width = max(int(np.max(ends - starts, initial=0)), 1)
+    # bytes past the end of an interval read the 0 appended to buf
+    padded = np.append(buf, np.uint8(0))
+    chars = np.empty((len(starts), width), dtype=np.uint8)
+    for k in range(width):
+        chars[:, k] = padded[np.where(starts + k < ends, starts + k, len(buf))]
+    return chars.view('S%d' % width).ravel()
+
+
+def _to_int(values):
+    """int64 array from a numpy 'S' array"""
+    try:
+        return values.astype(np.int64)
+    except ValueError as err:
+        raise ParseError(str(err))
+
+
+def _clean_lines(chunk):
+    """drop empty, comment, track and browser lines (slow path)"""
+    lines = [line for line in chunk.split(b'\n')
+             if line.strip() and not line.startswith((b'#', b'track', b'browser'))]
+    return b'\n'.join(lines) + b'\n' if lines else b''
+
+
+def _tokenize_bed12(chunk):
+    """
+    Vectorized tokenizer for a chunk of complete BED12 lines.
+
+    Returns
+    -------
+    dict with the int columns, 'S' arrays for the str columns and flat block arrays
+    """
+    if not chunk:
+        return None
+
+    buf = np.frombuffer(chunk, dtype=np.uint8)
+    delims = np.flatnonzero((buf == _TAB) | (buf == _NEWLINE))
+    # start of the field ending at each delimiter
+    delim_starts = np.concatenate([[0], delims[:-1] + 1])
+    n_lines = len(delims) // 12
+
+    if len(delims) != 12 * n_lines or np.any(buf[delims[11::12]] != _NEWLINE):
+        # BED12+ (extra fields are ignored), or lines to clean
+        newlines = buf[delims] == _NEWLINE
+        line_ends = np.flatnonzero(newlines)
+        counts = np.diff(np.concatenate([[-1], line_ends]))
+        if not len(counts) or counts.min() < 12:
+            cleaned = _clean_lines(chunk)
+            if cleaned != chunk:
+                return _tokenize_bed12(cleaned)
+            raise ParseError('BED12 lines must have at least 12 tab separated fields')
+
+        n_lines = len(line_ends)
+        first = line_ends - counts + 1
+        keep = (first[:, None] + np.arange(12)).ravel()
+        delims, delim_starts = delims[keep], delim_starts[keep]
+
+    field_ends = delims.reshape(n_lines, 12)
+    field_starts = delim_starts.reshape(n_lines, 12)
+
+    def string_field(i):
+        return _fixed_width(buf, field_starts[:, i], field_ends[:, i])
+
+    # chromStart, chromEnd, thickStart, thickEnd, blockCount
+    cols = [1, 2, 6, 7, 9]
+    ints = _to_int(_fixed_width(buf, field_starts[:, cols].ravel(), field_ends[:, cols].ravel()))
+    ints = ints.reshape(n_lines, 5)
+    counts = ints[:, 4]
+
+    # blockSizes and blockStarts of each line: counts[i] sizes followed by counts[i] starts
+    blocks = _fromstring(_join_fields(chunk, field_starts[:, 10], field_ends[:, 11]), 2 * np.sum(counts))
+
+    offsets = np.zeros(n_lines + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    in_row = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+    sizes_idx = np.repeat(2 * offsets[:-1], counts) + in_row
+
+    starts = blocks[sizes_idx + np.repeat(counts, counts)] + np.repeat(ints[:, 0], counts)
+
+    return {
+        'chrom': string_field(0),
+        'name': string_field(3),
+        'strand': string_field(5),
+        'itemRgb': string_field(8),
+        'thickStart': ints[:, 2],
+        'thickEnd': ints[:, 3],
+        'blockCount': counts,
+        'starts': starts,
+        'ends': starts + blocks[sizes_idx],
+    }
+
+
+def _read_chunks(file_handle, chunk_size):
+    """yield chunks of bytes ending at a line boundary"""
+    rest = b''
+    while True:
+        data = file_handle.read(chunk_size)
+        if isinstance(data, str):
+            data = data.encode()
+        if not data:
+            break
+        data = rest + data
+        cut = data.rfind(b'\n') + 1
+        rest = data[cut:]
+        if cut:
+            yield data[:cut]
+
+    if rest:
+        yield rest + b'\n'
+
+
+def _categorical(values):
+    """pandas.Categorical of str from a numpy 'S' array"""
+    categories, codes = np.unique(values, return_inverse=True)
+    try:
+        categories = categories.astype(str)
+    except UnicodeDecodeError:
+        # numpy only decodes ascii
+        categories = np.array([c.decode() for c in categories], dtype=object)
+    return pd.Categorical.from_codes(codes.ravel(), categories=categories)
+
+
+def read_bed12(file_handle, chunk_size=2 ** 26):
+    """
+    Read a BED12 file into an AnnotationSet.
+
+    The file is read in chunks of chunk_size bytes and each chunk is tokenized at once
+    with numpy: all blockSizes/blockStarts are decoded into flat arrays and no
+    object is created per line.
+
+    Parameters
+    ----------
+    file_handle: file handle (text or binary mode)
+    chunk_size: number of bytes read at a time
+
+    Returns
+    -------
+    AnnotationSet
+    """
+    columns = [_tokenize_bed12(chunk) for chunk in _read_chunks(file_handle, chunk_size)]
+    columns = [c for c in columns if c is not None]
+
+    if columns:
+        bed = {k: np.concatenate([c[k] for c in columns]) for k in columns[0]}
+    else:
+        bed = {k: np.zeros(0, dtype=np.int64) for k in ('thickStart', 'thickEnd',
+                                                         'blockCount', 'starts', 'ends')}
+        bed.update({k: np.zeros(0, dtype='S1') for k in ('chrom', 'name', 'strand', 'itemRgb')})
+
+    invalid = (bed['strand'] != b'+') & (bed['strand'] != b'-')
+    if invalid.any():
+        raise ParseError('invalid strand value: %s' % bed['strand'][invalid][0].decode())
+
+    offsets = np.zeros(len(bed['blockCount']) + 1, dtype=np.int64)
+    np.cumsum(bed['blockCount'], out=offsets[1:])
+
+    return AnnotationSet(bed['starts'], bed['ends'], offsets,
+                         chrom=_categorical(bed['chrom']),
+                         strand=_categorical(bed['strand']),
+                         transcript_id=_categorical(bed['name']),
+                         thick_starts=bed['thickStart'],
+                         thick_ends=bed['thickEnd'],
+                         item_rgb=_categorical(bed['itemRgb']))
+
+
+extb_columns = ['coords', 'strand', 'transcript_id', 'gene_id', 'blockCount', 'length', 'exons', 'introns']
+
+
+def read_extb(file_handle):
+    """
+    Read an EXTB file (as written with output format 'extb') into an AnnotationSet.
+
+    The exon and intron sizes of all lines are decoded at once into flat arrays
+    and the exon starts are rebuilt from them.
+
+    Parameters
+    ----------
+    file_handle: file handle (text or binary mode)
+
+    Returns
+    -------
+    AnnotationSet
+    """
+    dtype = {'coords': object, 'strand': 'category', 'transcript_id': 'category', 'gene_id': 'category',
+             'blockCount': np.int64, 'length': np.int64, 'exons': object, 'introns': object}
+    try:
+        table = pd.read_csv(file_handle, sep='\t', header=None, names=extb_columns, dtype=dtype,
+                            comment='#', na_values=['None'], keep_default_na=False)
+    except pd.errors.EmptyDataError:
+        table = None
+    except ValueError as err:
+        raise ParseError(str(err))
+    if table is None or not len(table):
+        return AnnotationSet.from_annotations([])
+
+    invalid = ~table.strand.isin(['+', '-'])
+    if invalid.any():
+        raise ParseError('invalid strand value: %s' % table.strand[invalid].iloc[0])
+
+    # chrom:start-end (1-based start); chrom may have ':'
+    chrom, start = [], []
+    for coords in table.coords.tolist():
+        name, _, coords = coords.rpartition(':')
+        chrom.append(name)
+        start.append(coords.partition('-')[0])
+    start = _to_int(np.array(start, dtype='S')) - 1
+
+    counts = table.blockCount.to_numpy()
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    exons = _fromstring(','.join(table.exons.tolist()).encode(), offsets[-1])
+    multi = counts > 1
+    introns = _fromstring(','.join(table.introns[multi].tolist()).encode(), np.sum(counts[multi] - 1))
+
+    # distance from each exon start to the next one: exon + following intron
+    step = exons.copy()
+    not_last = np.ones(len(exons), dtype=bool)
+    not_last[offsets[1:][counts > 0] - 1] = False
+    step[not_last] += introns
+
+    # exclusive cumsum of the steps within each row
+    before = np.cumsum(step) - step
+    before -= np.repeat(before[offsets[:-1][counts > 0]], counts[counts > 0])
+    starts = np.repeat(start, counts) + before
+
+    return AnnotationSet(starts, starts + exons, offsets,
+                         chrom=pd.Categorical(chrom),
+                         strand=table.strand.array,
+                         transcript_id=table.transcript_id.array,
+                         gene_id=table.gene_id.array)
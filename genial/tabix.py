@@ -0,0 +1,312 @@
+"""
+Region index of BED12 and GTF files, for random access to the annotations of a few regions.
+
+Like tabix, the index maps genomic regions to byte ranges of the (bgzipped or uncompressed)
+file, so fetching a region only reads and parses the BGZF blocks holding it. The index
+has its own format (a .gix file next to the annotation file, an uncompressed .npz):
+
+* the file is split in chunks of about CHUNK_SIZE uncompressed bytes, at line boundaries
+  (GTF: at gene boundaries, so transcripts are never split). Each chunk has a chromosome,
+  the byte range of its lines and the min start/max end of its features.
+* for BGZF files, the offset of each block on the compressed and uncompressed content.
+
+Files don't have to be sorted, but GTF lines of a gene must be consecutive (as on Ensembl
+and GENCODE files). The index is rebuilt when the annotation file changes.
+"""
+
+import io
+import os
+import re
+
+import numpy as np
+
+from .bgzf import BUFFER_SIZE, iter_blocks, read_range, sniff
+from .exceptions import UnsupportedFile
+from .parallel import _gene_key
+
+# bump when the layout of the index changes
+INDEX_FORMAT = 1
+
+CHUNK_SIZE = 2 ** 16
+
+_MAX_END = np.iinfo(np.int64).max
+_REGION = re.compile(r'^([\d,]+)(?:-([\d,]+))?$')
+
+
+def parse_region(region):
+    """
+    (chrom, start, end) of a region like 'chr1:1-5000000' (1-based, inclusive, as samtools
+    and tabix), 'chr1:1000' (from 1000 to the end of chr1) or 'chr1' (the whole chromosome).
+    start is 0-based.
+    """
+    region = region.strip()
+    chrom, _, coords = region.rpartition(':')
+    match = _REGION.match(coords) if chrom else None
+    if match is None:
+        return region, 0, _MAX_END
+
+    start = int(match.group(1).replace(',', '')) - 1
+    end = int(match.group(2).replace(',', '')) if match.group(2) else _MAX_END
+    return chrom, max(start, 0), end
+
+
+def read_regions_file(file_handle):
+    """
+    Regions of a BED file (chrom, start, end: 0-based) or of a file with one
+    'chr:start-end' region per line.
+    """
+    regions = []
+    for line in file_handle:
+        if not line.strip() or line.startswith(('#', 'track', 'browser')):
+            continue
+        fields = line.split()
+        if len(fields) >= 3:
+            regions.append((fields[0], int(fields[1]), int(fields[2])))
+        else:
+            regions.append(parse_region(fields[0]))
+    return regions
+
+
+def _as_regions(regions):
+    """list of (chrom, start, end) from regions as str ('chr1:1-1000') or tuples"""
+    return [parse_region(r) if isinstance(r, str) else (r[0], int(r[1]), int(r[2])) for r in regions]
+
+
+def index_file_of(path):
+    return path + '.gix'
+
+
+def _lines(chunks):
+    """(start, end, line) of every line of an iterable of bytes. start/end are offsets"""
+    offset = 0
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield offset, offset + len(line) + 1, line
+            offset += len(line) + 1
+    if rest:
+        yield offset, offset + len(rest), rest
+
+
+def _chunk_table(lines, input_format, chunk_size):
+    """chromosomes and (chrom code, start, end, min start, max end) of each chunk"""
+    chroms = {}
+    table = []
+    current = None
+    previous_key = None
+    finished = set()
+
+    for start, end, line in lines:
+        if not line.strip() or line.startswith((b'#', b'track', b'browser')):
+            continue
+
+        fields = line.split(b'\t', 5)
+        chrom = fields[0].decode()
+        if input_format == 'bed':
+            feature_start, feature_end = int(fields[1]), int(fields[2])
+            boundary = True
+        else:
+            feature_start, feature_end = int(fields[3]) - 1, int(fields[4])
+            key = _gene_key(line, 'gtf')
+            boundary = key != previous_key
+            if boundary:
+                if key in finished:
+                    raise UnsupportedFile('lines of gene %s are not consecutive: sort the file by gene'
+                                          % key[1].decode())
+                finished.add(previous_key)
+                previous_key = key
+
+        code = chroms.setdefault(chrom, len(chroms))
+        if current is None or code != current[0] or (boundary and start - current[1] >= chunk_size):
+            current = [code, start, end, feature_start, feature_end]
+            table.append(current)
+        else:
+            current[2] = end
+            current[3] = min(current[3], feature_start)
+            current[4] = max(current[4], feature_end)
+
+    return list(chroms), np.array(table, dtype=np.int64).reshape(-1, 5)
+
+
+class RegionIndex:
+    def __init__(self, path, input_format, chroms, chunks, compressed_offsets=None, offsets=None):
+        """
+
+        Region index of a BED12 or GTF file (see genial.tabix). Use load_index or build_index.
+
+        Parameters
+        ----------
+        path: path to the annotation file
+        input_format: 'bed' or 'gtf'
+        chroms: list with the chromosome of each chrom code
+        chunks: int64 array with (chrom code, start, end, min start, max end) of each chunk
+        compressed_offsets, offsets: BGZF only, offset of each block (plus the total size)
+            on the compressed and uncompressed content
+        """
+        self.path = path
+        self.input_format = input_format
+        self.chroms = list(chroms)
+        self.chunks = chunks
+        self.compressed_offsets = compressed_offsets
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def save(self, index_file):
+        stat = os.stat(self.path)
+        arrays = dict(format=INDEX_FORMAT, input_format=self.input_format,
+                      size=stat.st_size, mtime_ns=stat.st_mtime_ns,
+                      chroms=np.array(self.chroms, dtype=str), chunks=self.chunks)
+        if self.offsets is not None:
+            arrays.update(compressed_offsets=self.compressed_offsets, offsets=self.offsets)
+        with open(index_file, 'wb') as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path, index_file):
+        """
+        Load the index of path saved on index_file.
+        Raises ValueError if the index is outdated.
+        """
+        stat = os.stat(path)
+        with np.load(index_file, allow_pickle=False) as npz:
+            if (int(npz['format']) != INDEX_FORMAT or int(npz['size']) != stat.st_size or
+                    int(npz['mtime_ns']) != stat.st_mtime_ns):
+                raise ValueError('outdated index %s' % index_file)
+            offsets = npz['offsets'] if 'offsets' in npz else None
+            compressed_offsets = npz['compressed_offsets'] if 'compressed_offsets' in npz else None
+            return cls(path, str(npz['input_format']), npz['chroms'].tolist(), npz['chunks'],
+                       compressed_offsets, offsets)
+
+    def ranges(self, regions):
+        """merged (start, end) byte ranges of the chunks overlapping regions, on file order"""
+        codes = {chrom: code for code, chrom in enumerate(self.chroms)}
+        selected = np.zeros(len(self.chunks), dtype=bool)
+        for chrom, start, end in _as_regions(regions):
+            if chrom in codes:
+                selected |= ((self.chunks[:, 0] == codes[chrom]) &
+                             (self.chunks[:, 3] < end) & (self.chunks[:, 4] > start))
+
+        ranges = []
+        for start, end in self.chunks[selected, 1:3].tolist():
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return [tuple(r) for r in ranges]
+
+    def read(self, regions):
+        """text of the chunks overlapping regions (whole lines, on file order)"""
+        data = []
+        with open(self.path, 'rb') as f:
+            for start, end in self.ranges(regions):
+                if self.offsets is None:
+                    f.seek(start)
+                    data.append(f.read(end - start))
+                else:
+                    data.append(read_range(f, self.compressed_offsets, self.offsets, start, end))
+        return b''.join(data).decode()
+
+    def fetch(self, regions, feature_counts=None):
+        """
+        Yield the annotations (InteractiveAnnotation) overlapping any of the regions,
+        on file order. Regions are str ('chr1:1-5000000') or (chrom, start, end) tuples
+        with 0-based starts. feature_counts: see genial.parse
+        """
+        from genial import parse
+
+        regions = _as_regions(regions)
+        by_chrom = {}
+        for chrom, start, end in regions:
+            by_chrom.setdefault(chrom, []).append((start, end))
+        by_chrom = {chrom: np.array(r, dtype=np.int64) for chrom, r in by_chrom.items()}
+
+        lines = io.StringIO(self.read(regions))
+        if self.input_format == 'bed':
+            lines = (line for line in lines if line.strip() and not line.startswith(('#', 'track', 'browser')))
+
+        for annotation in parse(lines, self.input_format, feature_counts=feature_counts):
+            bounds = by_chrom.get(annotation.chrom)
+            if bounds is not None and np.any((bounds[:, 0] < annotation.end) & (bounds[:, 1] > annotation.start)):
+                yield annotation
+
+
+def build_index(path, input_format, index_file=None, chunk_size=CHUNK_SIZE):
+    """
+    Build the region index of a bgzipped or uncompressed BED12/GTF file and save it
+    on index_file (default: path + '.gix').
+
+    Returns
+    -------
+    RegionIndex
+    """
+    index = _build(path, input_format, chunk_size)
+    index.save(index_file or index_file_of(path))
+    return index
+
+
+def _build(path, input_format, chunk_size=CHUNK_SIZE):
+    if input_format not in ('bed', 'gtf'):
+        raise UnsupportedFile('region index is only supported for bed and gtf files')
+
+    with open(path, 'rb') as f:
+        compression = sniff(f.read(1024))
+        f.seek(0)
+
+        if compression is None:
+            chroms, chunks = _chunk_table(_lines(iter(lambda: f.read(BUFFER_SIZE), b'')),
+                                          input_format, chunk_size)
+            compressed_offsets = offsets = None
+
+        elif compression == 'bgzf':
+            compressed_offsets, offsets = [], []
+
+            def blocks():
+                size = 0
+                for compressed_offset, block in iter_blocks(f):
+                    compressed_offsets.append(compressed_offset)
+                    offsets.append(size)
+                    size += len(block)
+                    yield block
+                compressed_offsets.append(os.path.getsize(path))
+                offsets.append(size)
+
+            chroms, chunks = _chunk_table(_lines(blocks()), input_format, chunk_size)
+            compressed_offsets = np.array(compressed_offsets, dtype=np.int64)
+            offsets = np.array(offsets, dtype=np.int64)
+
+        else:
+            raise UnsupportedFile('%s is compressed with %s: compress it with bgzip to index it'
+                                  % (path, compression))
+
+    return RegionIndex(path, input_format, chroms, chunks, compressed_offsets, offsets)
+
+
+def load_index(path, input_format, index_file=None, build=True):
+    """
+    Region index of path, loaded from index_file (default: path + '.gix').
+    If it doesn't exist or is outdated, it is built (unless build is False: raises
+    FileNotFoundError/ValueError).
+
+    Returns
+    -------
+    RegionIndex
+    """
+    path = os.path.realpath(path)
+    index_file = index_file or index_file_of(path)
+    try:
+        return RegionIndex.load(path, index_file)
+    except (OSError, ValueError, KeyError):
+        if not build:
+            raise
+
+    index = _build(path, input_format)
+    try:
+        index.save(index_file)
+    except PermissionError:
+        # read only directory: the index is only kept on memory
+        pass
+    return index
@@ -1,9 +1,11 @@
 from sys import intern
+import io
 import os
 
 import numpy as np
 import pandas as pd
 import re
+from .bgzf import BUFFER_SIZE, open_bgzf, open_compressed, sniff
 from .exceptions import UnsupportedFile
 
 
@@ -16,6 +18,45 @@ def sort_intervals(starts, ends):
     return starts, ends
 
 
+def merge_blocks(starts, ends, offsets, gap=0):
+    """
+    Merge blocks separated by gaps smaller or equals gap, for every row of
+    a CSR-like layout at once (blocks of row i are starts[offsets[i]:offsets[i+1]],
+    sorted by start).
+
+    Returns
+    -------
+    starts, ends, offsets of the merged blocks
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(starts) == 0:
+        return starts.copy(), ends.copy(), offsets.copy()
+
+    counts = np.diff(offsets)
+    rows = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+
+    # running max of ends, restarted on each row (rows are shifted apart by span)
+    low = ends.min()
+    span = ends.max() - low + 1
+    running_end = np.maximum.accumulate(ends - low + rows * span) - rows * span + low
+
+    # a block starts a new merged block if it is the first of its row or
+    # if it starts after (the max end of the blocks before it) + gap
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > running_end[:-1] + gap
+    first[offsets[:-1][counts > 0]] = True
+
+    first_idx = np.flatnonzero(first)
+    last_idx = np.append(first_idx[1:] - 1, len(starts) - 1)
+
+    n_first = np.zeros(len(first) + 1, dtype=np.int64)
+    np.cumsum(first, out=n_first[1:])
+
+    return starts[first_idx], running_end[last_idx], n_first[offsets]
+
+
 def nice_sort(l):
     """ Sort given iterable in the way that humans expect.
     src: http://stackoverflow.com/a/2669120
@@ -25,29 +66,72 @@ def nice_sort(l):
     return sorted(l, key=alphanum_key)
 
 
+_MIME = {'bgzf': 'application/gzip',
+         'gzip': 'application/gzip',
+         'bz2': 'application/x-bzip2',
+         'xz': 'application/x-xz',
+         'zstd': 'application/zstd'}
+
+
+def _sniff_file(path_to_file, size=1024):
+    """(compression, first bytes) of a file. compression is None for uncompressed files"""
+    with open(path_to_file, 'rb') as f:
+        head = f.read(size)
+    return sniff(head), head
+
+
 def detect_mime(path_to_file, uncompress=False):
-    import magic
-    mime = magic.Magic(mime=True, uncompress=uncompress)
-    mime_from_file = mime.from_file(path_to_file)
-    # magic returns byte, not str
-    # mime_from_file = mime_from_file.decode()
-    return mime_from_file
+    """
+    mime type of a file from its magic number: text/plain, application/octet-stream
+    (other binary files) or the mime type of its compression.
+    If uncompress, the type of the uncompressed content of compressed files.
+    """
+    compression, head = _sniff_file(path_to_file)
+    if compression is not None and uncompress:
+        with magic_open(path_to_file, 'rb') as f:
+            compression, head = None, f.read(1024)
+
+    if compression is not None:
+        return _MIME[compression]
+    return 'application/octet-stream' if b'\0' in head else 'text/plain'
+
 
+def magic_open(path_to_file, mode='rt', threads=None, background=True):
+    """
+    Open a plain text or compressed (gzip, BGZF, bzip2, xz or zstd) file, detected
+    from its magic number.
 
-def magic_open(path_to_file, mode='rt'):
-    import gzip
+    Parameters
+    ----------
+    path_to_file
+    mode: 'rt' (default) or 'rb'
+    threads: int
+        BGZF only, number of threads decompressing blocks (default: number of cpus)
+    background: bool (default: True)
+        decompress gzip/bzip2/xz/zstd files on a background thread, while the
+        caller parses (see genial.bgzf)
+
+    Returns
+    -------
+    file object (reads use buffers of genial.bgzf.BUFFER_SIZE bytes)
+    """
     # follow symlinks
     path_to_file = os.path.realpath(path_to_file)
-    mime = detect_mime(path_to_file)
+    compression, head = _sniff_file(path_to_file)
 
-    if mime == 'text/plain':
-        return open(path_to_file, mode=mode)
+    if compression is None:
+        if b'\0' in head:
+            raise UnsupportedFile('File %s is type %s' % (path_to_file, 'application/octet-stream'))
+        return open(path_to_file, mode=mode, buffering=BUFFER_SIZE)
 
-    elif mime == 'application/gzip':
-        # if detect_mime(path_to_file, uncompress=True) == 'text/plain':
-        return gzip.open(path_to_file, mode=mode)
+    if compression == 'bgzf':
+        f = open_bgzf(path_to_file, threads)
+    else:
+        f = open_compressed(path_to_file, compression, background)
 
-    raise UnsupportedFile('File %s is type %s' % (path_to_file, mime))
+    if 'b' in mode:
+        return f
+    return io.TextIOWrapper(f)
 
 
 def rand_id():
@@ -66,6 +150,16 @@ def str2array(string):
     return np.fromstring(string, sep=',', dtype=np.int64)
 
 
+def coords2array(coords):
+    """
+    Return a new int64 numpy array from coordinates stored as a comma separated
+    string, a buffer (eg: array('q')) or any other sequence of integers.
+    """
+    if isinstance(coords, str):
+        return str2array(coords)
+    return np.array(coords, dtype=np.int64)
+
+
 def format_intervals(iterable_with_numbers):
     n_list = sorted(iterable_with_numbers)
     dist = 0
@@ -128,6 +222,9 @@ def read_extb(filepath):
     """
     returns a pandas dataframe with the content of the specified extb file.
     transcript_ID is used as index
+
+    For typed columns (and blocks as lists of int), use
+    genial.readers.read_extb(f).to_pandas()
     
     EXTB (EXon TaBle) columns:
     
@@ -175,6 +272,9 @@ def read_bed(filepath, cols=12):
     """
     returns a pandas dataframe with the content of the specified BED12 file. 
     transcript_ID is used as index
+
+    For typed columns (and blocks as lists of int), use
+    genial.readers.read_bed12(f).to_pandas()
     
     Parameters
     ----------
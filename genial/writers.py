@@ -0,0 +1,184 @@
+"""
+Bulk writers: format many annotations at once from the block arrays of an
+AnnotationSet. The output is the same as InteractiveAnnotation.format, one
+annotation per line (bed6 and intron-bed: one line per block/intron).
+"""
+
+import numpy as np
+
+from .AnnotationSet import AnnotationSet, iter_chunks, segment_sum
+
+DEFAULT_ITEM_RGB = "200,155,55"
+
+
+def _labels(column, size, missing='None'):
+    """list of str with the value of each row of a pandas.Categorical (missing values as str(None))"""
+    if column is None:
+        return [missing] * size
+    labels = np.array(list(map(str, column.categories.tolist())) + [missing], dtype=object)
+    codes = np.asarray(column.codes, dtype=np.int64)
+    return labels[np.where(codes < 0, len(labels) - 1, codes)].tolist()
+
+
+def _join_rows(values, offsets):
+    """comma separated values of each row of a CSR-like layout"""
+    tokens = list(map(str, values.tolist()))
+    return [','.join(tokens[lo:hi]) for lo, hi in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+def _rows_with_blocks(annotation_set):
+    # rows without blocks have no output
+    if np.all(annotation_set.blockCount() > 0):
+        return annotation_set
+    return annotation_set.take(np.flatnonzero(annotation_set.blockCount() > 0))
+
+
+def _format_bed(annotation_set):
+    size = len(annotation_set)
+    start, end = annotation_set.start, annotation_set.end
+    thick_starts = np.where(annotation_set.thick_starts < 0, start, annotation_set.thick_starts)
+    thick_ends = np.where(annotation_set.thick_ends < 0, start, annotation_set.thick_ends)
+    rows = zip(_labels(annotation_set.chrom, size),
+               start.tolist(),
+               end.tolist(),
+               _labels(annotation_set.transcript_id, size),
+               _labels(annotation_set.strand, size),
+               thick_starts.tolist(),
+               thick_ends.tolist(),
+               _labels(annotation_set.item_rgb, size, missing=DEFAULT_ITEM_RGB),
+               annotation_set.blockCount().tolist(),
+               _join_rows(annotation_set.exons, annotation_set.offsets),
+               _join_rows(annotation_set.starts - np.repeat(start, annotation_set.blockCount()),
+                          annotation_set.offsets))
+    return ''.join(['%s\t%d\t%d\t%s\t1000\t%s\t%d\t%d\t%s\t%d\t%s\t%s\n' % row for row in rows])
+
+
+def _format_bed6(annotation_set):
+    size = len(annotation_set)
+    counts = annotation_set.blockCount()
+
+    def repeat(labels):
+        return np.repeat(np.array(labels, dtype=object), counts).tolist()
+
+    rows = zip(repeat(_labels(annotation_set.chrom, size)),
+               annotation_set.starts.tolist(),
+               annotation_set.ends.tolist(),
+               repeat(_labels(annotation_set.transcript_id, size)),
+               repeat(_labels(annotation_set.strand, size)))
+    return ''.join(['%s\t%d\t%d\t%s\t1000\t%s\n' % row for row in rows])
+
+
+def _format_intron_bed(annotation_set):
+    size = len(annotation_set)
+    intron_offsets = annotation_set.intron_offsets
+    counts = np.diff(intron_offsets)
+
+    # every block, but the last of each row, is followed by an intron
+    not_last = np.ones(len(annotation_set.starts), dtype=bool)
+    not_last[annotation_set.offsets[1:] - 1] = False
+    idx = np.flatnonzero(not_last)
+
+    # introns are numbered from 5' to 3'
+    number = np.arange(intron_offsets[-1]) - np.repeat(intron_offsets[:-1], counts) + 1
+    minus = np.repeat(np.asarray(annotation_set.strand == '-'), counts)
+    number[minus] = np.repeat(counts, counts)[minus] - number[minus] + 1
+
+    def repeat(labels):
+        return np.repeat(np.array(labels, dtype=object), counts).tolist()
+
+    rows = zip(repeat(_labels(annotation_set.chrom, size)),
+               annotation_set.ends[idx].tolist(),
+               annotation_set.starts[idx + 1].tolist(),
+               repeat(_labels(annotation_set.transcript_id, size)),
+               number.tolist(),
+               repeat(_labels(annotation_set.strand, size)))
+    return ''.join(['%s\t%d\t%d\t%s_Intron_%03d\t999\t%s\n' % row for row in rows])
+
+
+def _format_extb(annotation_set):
+    size = len(annotation_set)
+    introns = _join_rows(annotation_set.introns, annotation_set.intron_offsets)
+    # InteractiveAnnotation.introns is [nan] for single exon annotations
+    introns = [i if i else 'nan' for i in introns]
+
+    rows = zip(_labels(annotation_set.chrom, size),
+               (annotation_set.start + 1).tolist(),
+               annotation_set.end.tolist(),
+               _labels(annotation_set.strand, size),
+               _labels(annotation_set.transcript_id, size),
+               _labels(annotation_set.gene_id, size),
+               annotation_set.blockCount().tolist(),
+               segment_sum(annotation_set.exons, annotation_set.offsets).tolist(),
+               _join_rows(annotation_set.exons, annotation_set.offsets),
+               introns)
+    return ''.join(['%s:%d-%d\t%s\t%s\t%s\t%d\t%d\t%s\t%s\n' % row for row in rows])
+
+
+_formatters = {
+    'bed': _format_bed,
+    'bed6': _format_bed6,
+    'intron-bed': _format_intron_bed,
+    'extb': _format_extb,
+}
+
+
+def format_set(annotation_set, output_format):
+    """
+    Format all rows of an AnnotationSet at once.
+
+    Parameters
+    ----------
+    annotation_set: AnnotationSet
+    output_format: one of genial.output_formats
+
+    Returns
+    -------
+    str with the same lines of InteractiveAnnotation.format (each line ends with a newline;
+    annotations without output, eg: intron-bed of single exon transcripts, are skipped)
+    """
+    try:
+        formatter = _formatters[output_format]
+    except KeyError:
+        # gnl is a binary format: use write
+        raise ValueError('unsupported text output format: %s' % output_format)
+
+    annotation_set = _rows_with_blocks(annotation_set)
+    if not len(annotation_set):
+        return ''
+    return formatter(annotation_set)
+
+
+def write(annotations, file_handle, output_format, chunk_size=10000):
+    """
+    Write annotations to file_handle, with a single write for each chunk of annotations.
+
+    Parameters
+    ----------
+    annotations: AnnotationSet or iterable of InteractiveAnnotation (eg: the output of genial.parse)
+    file_handle: file handle opened on text mode (binary mode for gnl)
+    output_format: one of genial.output_formats
+    chunk_size: int (default: 10000)
+        number of annotations formatted at once (gnl: all annotations are written at once)
+
+    Returns
+    -------
+    number of annotations written
+    """
+    if output_format == 'gnl':
+        from .gnl import write_gnl
+        if not isinstance(annotations, AnnotationSet):
+            annotations = AnnotationSet.concat(iter_chunks(annotations, chunk_size))
+        write_gnl(annotations, file_handle)
+        return len(annotations)
+
+    if isinstance(annotations, AnnotationSet):
+        chunks = (annotations[i:i + chunk_size] for i in range(0, len(annotations), chunk_size))
+    else:
+        chunks = iter_chunks(annotations, chunk_size)
+
+    n = 0
+    for chunk in chunks:
+        file_handle.write(format_set(chunk, output_format))
+        n += len(chunk)
+    return n
+
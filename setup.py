@@ -1,7 +1,9 @@
 from setuptools import setup
 import glob
+import re
 
-version = '0.1.0a1'
+# genial/__init__.py imports numpy and pandas: read the version without importing it
+version = re.search(r"__version__ = '([^']+)'", open('genial/__init__.py').read()).group(1)
 
 scripts = glob.glob('bin/*')
 requirements = open('requirements.txt').readlines()
@@ -20,6 +22,7 @@ setup(
     url='https://github.com/varnion/genial',
     license='BSD',
     install_requires=requirements,
+    extras_require={'zstd': ['zstandard'], 'arrow': ['pyarrow']},
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Intended Audience :: Science/Research',